@@ -108,6 +108,12 @@ class YoutubeDownloaderApp:
 
         self.lbl_status = tk.Label(root, text="Pronto para baixar", font=("Segoe UI", 10), fg="gray", bg=self.cores['bg'])
         self.lbl_status.pack(pady=5)
+
+        # Último estado publicado pela thread do download (valor da barra, texto, cor).
+        # A tela lê em intervalo fixo em vez de receber um callback por chamada do yt-dlp.
+        self.estado_progresso = None
+        self._estado_exibido = None
+        self.root.after(50, self.atualizar_tela)
         
         # (Rodapé removido pois agora temos o seletor de pasta visível)
 
@@ -123,24 +129,31 @@ class YoutubeDownloaderApp:
             return
         
         self.btn_download.config(state="disabled", text="CONECTANDO...", bg="#444444")
-        self.lbl_status.config(text="Analisando link...", fg=self.cores['accent'])
-        self.progress_bar['value'] = 0
+        self.estado_progresso = (0, "Analisando link...", self.cores['accent'])
         
         thread = threading.Thread(target=self.realizar_download, args=(link,))
         thread.start()
 
     def progress_hook(self, d):
+        # Roda na thread do download: só troca o estado, quem desenha é atualizar_tela
         if d['status'] == 'downloading':
-            # Tenta pegar a porcentagem. As vezes vem com caracteres de controle ANSI, então limpamos
-            p = d.get('_percent_str', '0%').replace('%','')
-            try:
-                self.root.after(0, lambda: self.progress_bar.configure(value=float(p)))
-                self.root.after(0, lambda: self.lbl_status.config(text=f"Baixando: {d.get('_percent_str')} | Vel: {d.get('_speed_str')}"))
-            except:
-                pass
+            # Porcentagem pelos bytes (o _percent_str às vezes vem com caracteres de controle ANSI)
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            pct = d.get('downloaded_bytes', 0) / total * 100 if total else 0
+            vel = f"{d['speed'] / 1048576:.1f} MB/s" if d.get('speed') else "--"
+            self.estado_progresso = (pct, f"Baixando: {pct:.1f}% | Vel: {vel}", self.cores['accent'])
         elif d['status'] == 'finished':
-            self.root.after(0, lambda: self.lbl_status.config(text="Processando arquivo (convertendo)...", fg="yellow"))
-            self.root.after(0, lambda: self.progress_bar.configure(value=100))
+            self.estado_progresso = (100, "Processando arquivo (convertendo)...", "yellow")
+
+    def atualizar_tela(self):
+        """Aplica o estado mais recente ~20x por segundo; estados intermediários são descartados."""
+        estado = self.estado_progresso
+        if estado is not self._estado_exibido:
+            self._estado_exibido = estado
+            valor, texto, cor = estado
+            if valor is not None: self.progress_bar.configure(value=valor)
+            self.lbl_status.config(text=texto, fg=cor)
+        self.root.after(50, self.atualizar_tela)
 
     def realizar_download(self, link):
         tipo = self.formato_var.get()
@@ -201,7 +214,8 @@ class YoutubeDownloaderApp:
             self.root.after(0, self.resetar_interface)
 
     def atualizar_status(self, texto, cor):
-        self.root.after(0, lambda: self.lbl_status.config(text=texto, fg=cor))
+        # Pelo mesmo estado do progresso: assim um progresso atrasado não sobrescreve a mensagem final
+        self.estado_progresso = (None, texto, cor)
 
     def resetar_interface(self):
         self.btn_download.config(state="normal", text="INICIAR DOWNLOAD", bg=self.cores['btn_bg'])
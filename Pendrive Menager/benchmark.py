@@ -0,0 +1,364 @@
+"""Benchmark do Pendrive Manager.
+
+Gera árvores de mídia sintéticas e reproduzíveis (mesma semente = mesmos arquivos)
+e mede cada operação em um processo separado: arquivos/s, MB/s, pico de memória
+e chamadas ao sistema. Os resultados vão para um JSON que pode ser comparado
+entre commits.
+
+    python benchmark.py                              # 10 mil arquivos
+    python benchmark.py --escalas 10k,100k,1M
+    python benchmark.py --comparar antes.json depois.json
+"""
+import os
+import sys
+import io
+import json
+import math
+import time
+import random
+import struct
+import shutil
+import argparse
+import datetime
+import platform
+import subprocess
+import tempfile
+from collections import Counter
+
+try:
+    import resource  # Não existe no Windows: o pico de memória fica de fora
+except ImportError:
+    resource = None
+
+PASTA_SCRIPT = os.path.dirname(os.path.abspath(__file__))
+PIPELINES = ["scan", "rescan", "lixo", "integridade", "duplicatas", "auditoria", "organizar", "galeria"]
+MANIFESTO = ".benchmark.json"
+VERSAO_GERADOR = 1  # Mudar quando o formato dos arquivos gerados mudar (força regerar)
+
+# Eventos de auditoria (PEP 578) contados como "chamadas ao sistema"
+EVENTOS_SISTEMA = {"open", "os.listdir", "os.scandir", "os.rename", "os.remove", "os.rmdir", "os.mkdir",
+                   "os.link", "os.utime", "os.truncate", "shutil.copyfile", "shutil.move", "mmap.__new__",
+                   "sqlite3.connect", "subprocess.Popen"}
+
+# --- GERADOR DA ÁRVORE SINTÉTICA ---
+
+def _segmento_exif(data):
+    """APP1 com um TIFF mínimo: IFD0 -> IFD EXIF -> DateTimeOriginal."""
+    texto = data.strftime("%Y:%m:%d %H:%M:%S").encode("ascii") + b"\x00"
+    ifd0 = struct.pack("<H", 1) + struct.pack("<HHII", 0x8769, 4, 1, 26) + struct.pack("<I", 0)
+    exif = struct.pack("<H", 1) + struct.pack("<HHII", 0x9003, 2, len(texto), 44) + struct.pack("<I", 0)
+    tiff = b"II*\x00" + struct.pack("<I", 8) + ifd0 + exif + texto
+    dados = b"Exif\x00\x00" + tiff
+    return b"\xff\xe1" + struct.pack(">H", len(dados) + 2) + dados
+
+def _modelos_jpeg(rng):
+    """Algumas imagens JPEG reais usadas como corpo de todas as fotos geradas (menor primeiro)."""
+    from PIL import Image
+    modelos = []
+    for largura, altura in ((160, 120), (320, 240), (640, 480), (1024, 768)):
+        # Pixels sorteados em baixa resolução e ampliados: parece foto para o JPEG e comprime como uma
+        base = Image.frombytes("RGB", (largura // 16, altura // 16), rng.randbytes(largura // 16 * altura // 16 * 3))
+        buf = io.BytesIO()
+        base.resize((largura, altura), Image.BILINEAR).save(buf, "JPEG", quality=85)
+        modelos.append(buf.getvalue()[2:])  # Sem o SOI: o arquivo gerado recoloca SOI + EXIF
+    return modelos
+
+def _atomo(tipo, conteudo):
+    return struct.pack(">I4s", 8 + len(conteudo), tipo) + conteudo
+
+def _mp4_stub(data, tamanho_mdat, preenchimento):
+    """MP4 mínimo: ftyp + moov (mvhd com a data de criação + uma trilha) + mdat."""
+    criado = int((data - datetime.datetime(1904, 1, 1)).total_seconds())
+    ftyp = struct.pack(">I4s4sI4s4s", 24, b"ftyp", b"isom", 0x200, b"isom", b"mp41")
+    mvhd = struct.pack(">I4sBxxxIIII", 108, b"mvhd", 0, criado, criado, 1000, 0) + bytes(80)
+
+    def moov(offset_dados):
+        stco = _atomo(b"stco", struct.pack(">III", 0, 1, offset_dados))  # Um bloco, no início do mdat
+        trak = _atomo(b"trak", _atomo(b"mdia", _atomo(b"minf", _atomo(b"stbl", stco))))
+        return _atomo(b"moov", mvhd + trak)
+
+    offset_dados = len(ftyp) + len(moov(0)) + 8
+    return ftyp + moov(offset_dados) + struct.pack(">I4s", 8 + tamanho_mdat, b"mdat") + preenchimento
+
+def gerar_arvore(destino, quantidade, semente=42, tamanho_medio=48 * 1024, prop_duplicatas=0.10,
+                 prop_corrompidos=0.02, prop_videos=0.10, prop_lixo=0.15, por_pasta=500):
+    """Cria (ou reaproveita, se os parâmetros forem os mesmos) uma árvore de mídia sintética.
+
+    Tamanhos seguem uma distribuição log-normal em torno de `tamanho_medio`.
+    Retorna o manifesto com os parâmetros e os totais gerados.
+    """
+    parametros = {"versao": VERSAO_GERADOR, "quantidade": quantidade, "semente": semente,
+                  "tamanho_medio": tamanho_medio, "prop_duplicatas": prop_duplicatas,
+                  "prop_corrompidos": prop_corrompidos, "prop_videos": prop_videos,
+                  "prop_lixo": prop_lixo, "por_pasta": por_pasta}
+    caminho_manifesto = os.path.join(destino, MANIFESTO)
+    try:
+        with open(caminho_manifesto, encoding="utf-8") as f:
+            manifesto = json.load(f)
+        if manifesto["parametros"] == parametros: return manifesto
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if os.path.exists(destino): shutil.rmtree(destino)
+    os.makedirs(destino)
+    rng = random.Random(semente)
+    modelos = _modelos_jpeg(rng)
+    aleatorio = rng.randbytes(4 * 1024 * 1024)  # Fonte de conteúdo; cada arquivo pega um trecho diferente
+    recentes = []  # Fotos já geradas, candidatas a virar duplicata
+    contagem = Counter()
+    total_bytes = 0
+    inicio = time.perf_counter()
+
+    def preenchimento(n):
+        if n <= 0: return b""
+        partes = [rng.randbytes(16)]  # Prefixo único: nenhum arquivo repete outro por acaso
+        n -= 16
+        while n > 0:
+            pos = rng.randrange(len(aleatorio) - 1)
+            trecho = aleatorio[pos:pos + n]
+            partes.append(trecho)
+            n -= len(trecho)
+        return b"".join(partes)
+
+    for i in range(quantidade):
+        pasta = os.path.join(destino, f"{i // (por_pasta * 100):03d}", f"Pasta_{i // por_pasta:05d}")
+        if i % por_pasta == 0: os.makedirs(pasta, exist_ok=True)
+        data = datetime.datetime(2005, 1, 1) + datetime.timedelta(seconds=rng.randrange(20 * 365 * 86400))
+        tamanho = int(min(rng.lognormvariate(math.log(tamanho_medio), 0.8), 8 * 1024 * 1024))
+
+        sorteio = rng.random()
+        if sorteio < prop_videos:
+            nome, tipo = f"VID_{data:%Y%m%d}_{i:07d}.mp4", "video"
+            conteudo = _mp4_stub(data, tamanho, preenchimento(tamanho))
+        elif recentes and sorteio < prop_videos + prop_duplicatas:
+            origem = rng.choice(recentes)
+            nome, tipo = f"IMG_{i:07d} (copia).jpg", "duplicata"
+            with open(origem, "rb") as f: conteudo = f.read()
+        else:
+            modelo = ([m for m in modelos if len(m) <= tamanho] or modelos[:1])[-1]  # Maior que cabe no tamanho
+            corpo = b"\xff\xd8" + _segmento_exif(data) + modelo
+            if rng.random() < prop_lixo:
+                nome, tipo = rng.choice([f"IMG-{data:%Y%m%d}-WA{i % 10000:04d}.jpg",
+                                         f"Screenshot_{data:%Y%m%d-%H%M%S}_{i}.jpg",
+                                         f"received_{i:07d}.jpeg"]), "lixo"
+            else:
+                nome, tipo = f"IMG_{i:07d}.jpg", "foto"
+            if rng.random() < prop_corrompidos:
+                tipo = "corrompido"
+                conteudo = corpo[:len(corpo) // 2]  # JPEG cortado no meio dos dados da imagem
+            else:
+                # Bytes após o EOI (como fazem alguns celulares) dão o tamanho sorteado sem invalidar a foto
+                conteudo = corpo + preenchimento(tamanho - len(corpo))
+        caminho = os.path.join(pasta, nome)
+        with open(caminho, "wb") as f: f.write(conteudo)
+        os.utime(caminho, (data.timestamp(), data.timestamp()))
+        if tipo in ("foto", "lixo"):
+            recentes.append(caminho)
+            if len(recentes) > 1000: recentes.pop(rng.randrange(len(recentes)))
+        contagem[tipo] += 1
+        total_bytes += len(conteudo)
+
+    manifesto = {"parametros": parametros, "arquivos": quantidade, "bytes": total_bytes,
+                 "tipos": dict(contagem), "segundos_geracao": round(time.perf_counter() - inicio, 2)}
+    with open(caminho_manifesto, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=2)
+    return manifesto
+
+# --- MEDIÇÃO (RODA EM UM PROCESSO PRÓPRIO POR OPERAÇÃO) ---
+
+def _ler_proc_io():
+    """Contadores de E/S do Linux (syscr/syscw = chamadas read/write); {} nos demais sistemas."""
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (linha.split(":") for linha in f)}
+    except OSError:
+        return {}
+
+def _pico_rss_mb(quem):
+    if resource is None: return None
+    kb = resource.getrusage(quem).ru_maxrss
+    return round(kb / 1024 / (1024 if sys.platform == "darwin" else 1), 1)  # macOS informa em bytes
+
+def medir_pipeline(nome, pasta, perfil, quente=False):
+    """Prepara o estado (frio por padrão), executa uma operação e devolve as métricas.
+
+    Chamadas e E/S contam só este processo; o trabalho dos pools de processos
+    (integridade, galeria) aparece apenas no tempo e no pico de memória dos filhos.
+    """
+    sys.path.insert(0, PASTA_SCRIPT)
+    import pendrive_manager as pm
+
+    pasta_dados = os.path.join(pasta, pm.PASTA_DADOS)
+    if not quente:
+        pm._cache_hash = pm.CacheHash(":memory:")  # Sem hashes/integridade de execuções anteriores
+        if nome == "scan":
+            for sufixo in ("", "-wal", "-shm"):
+                try: os.remove(os.path.join(pasta_dados, pm.IndiceMidia.ARQUIVO_DB + sufixo))
+                except OSError: pass
+        if nome == "galeria":
+            shutil.rmtree(os.path.join(pasta_dados, "galeria"), ignore_errors=True)
+    indice = pm.IndiceMidia(pasta)
+    if nome != "scan":
+        indice.sincronizar(completo=True)  # Índice pronto antes de medir (o scan é medido à parte)
+        if not quente:
+            with indice._lock:
+                indice.conn.execute("UPDATE arquivos SET hash = NULL, integridade = NULL, ano = NULL")
+                indice.conn.commit()
+    arquivos = indice.total()
+    total_bytes = indice.conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM arquivos").fetchone()[0]
+
+    chamadas = Counter()
+    ativo = [False]
+    def auditoria(evento, args):
+        if ativo[0] and evento in EVENTOS_SISTEMA: chamadas[evento] += 1
+    sys.addaudithook(auditoria)  # Não pode ser removido: por isso um processo por operação
+
+    metricas = pm.MetricasExecucao(nome, pasta)
+    io_antes = _ler_proc_io()
+    ativo[0] = True
+    inicio = time.perf_counter()
+    if nome == "scan":
+        arquivos = indice.sincronizar(metricas=metricas)
+        total_bytes = indice.conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM arquivos").fetchone()[0]
+        resumo = {"indexados": arquivos}
+    elif nome == "rescan":
+        # Nada mudou desde a sincronização acima: mede o caminho incremental (só stat das pastas)
+        indexados = indice.sincronizar(metricas=metricas)
+        resumo = {"indexados": indexados, "listados": metricas.como_dict()["etapas"]["varredura"]["arquivos"]}
+    elif nome == "lixo":
+        resumo = {"encontrados": len(pm.buscar_lixo(indice, metricas))}
+    elif nome == "integridade":
+        resumo = {"corrompidos": len(pm.buscar_corrompidos(indice, "profundo", metricas=metricas))}
+    elif nome == "duplicatas":
+        grupos, stats = pm.buscar_duplicatas(indice, perfil, metricas=metricas)
+        resumo = {"grupos": len(grupos), **stats}
+    elif nome == "auditoria":
+        relatorio = pm.auditoria_completa(indice, "profundo", perfil, metricas=metricas)
+        resumo = {"grupos": len(relatorio["duplicatas"]), "corrompidos": len(relatorio["corrompidos"]),
+                  "lixo": len(relatorio["lixo"]), "lidos": relatorio["lidos"]}
+    elif nome == "organizar":
+        movidos, erros = pm.organizar_pasta(indice, perfil, metricas=metricas)
+        resumo = {"movidos": movidos, "erros": erros}
+    elif nome == "galeria":
+        resumo = {"ok": pm.gerar_html_galeria(pasta, indice.caminhos("foto"), metricas=metricas)}
+    segundos = time.perf_counter() - inicio
+    ativo[0] = False
+    io_depois = _ler_proc_io()
+
+    if nome == "organizar":
+        pm.desfazer_organizacao(pasta, indice)  # Devolve a árvore ao estado gerado (fora da medição)
+    indice.fechar()
+
+    return {"pipeline": nome, "segundos": round(segundos, 3), "arquivos": arquivos, "bytes": total_bytes,
+            "arquivos_s": round(arquivos / segundos, 1) if segundos else None,
+            "mb_s": round(total_bytes / 1048576 / segundos, 1) if segundos else None,
+            "rss_pico_mb": _pico_rss_mb(resource.RUSAGE_SELF) if resource else None,
+            "rss_pico_filhos_mb": _pico_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+            "chamadas": dict(chamadas),
+            "io": {k: io_depois[k] - io_antes.get(k, 0) for k in io_depois},
+            "etapas": metricas.como_dict()["etapas"], "resumo": resumo}
+
+def rodar_pipeline(nome, pasta, perfil, quente):
+    """Executa medir_pipeline em um processo novo (memória e ganchos de auditoria isolados)."""
+    comando = [sys.executable, os.path.abspath(__file__), "--medir", nome, pasta, "--perfil", perfil]
+    if quente: comando.append("--quente")
+    proc = subprocess.run(comando, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"pipeline": nome, "erro": (proc.stderr.strip().splitlines() or ["falhou"])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# --- RELATÓRIO ---
+
+def _versao_codigo():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PASTA_SCRIPT,
+                                capture_output=True, text=True).stdout.strip()
+        alterado = bool(subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=PASTA_SCRIPT,
+                                       capture_output=True, text=True).stdout.strip())
+        return {"commit": commit or "desconhecido", "alterado": alterado}
+    except OSError:
+        return {"commit": "desconhecido", "alterado": None}
+
+def _linha(r):
+    if "erro" in r: return f"  {r['pipeline']:<12} ERRO: {r['erro']}"
+    rss = f"{r['rss_pico_mb']:>7.1f} MB" if r.get("rss_pico_mb") is not None else "        -"
+    return (f"  {r['pipeline']:<12} {r['segundos']:>9.2f} s {r['arquivos_s'] or 0:>11.0f} arq/s "
+            f"{r['mb_s'] or 0:>8.1f} MB/s {rss} {sum(r['chamadas'].values()):>9} chamadas")
+
+def comparar(arquivo_a, arquivo_b):
+    with open(arquivo_a, encoding="utf-8") as f: a = json.load(f)
+    with open(arquivo_b, encoding="utf-8") as f: b = json.load(f)
+    print(f"{a['codigo']['commit']} -> {b['codigo']['commit']}")
+    antes = {(e["arquivos"], r["pipeline"]): r for e in a["escalas"] for r in e["resultados"] if "erro" not in r}
+    for escala in b["escalas"]:
+        print(f"\n{escala['arquivos']} arquivos")
+        for r in escala["resultados"]:
+            ra = antes.get((escala["arquivos"], r["pipeline"]))
+            if ra is None or "erro" in r:
+                print(f"  {r['pipeline']:<12} (sem comparação)")
+                continue
+            razao = r["segundos"] / ra["segundos"] if ra["segundos"] else float("inf")
+            situacao = "mais rápido" if razao < 0.98 else "mais lento" if razao > 1.02 else "igual"
+            print(f"  {r['pipeline']:<12} {ra['segundos']:>9.2f} s -> {r['segundos']:>9.2f} s  ({situacao}: {razao:.2f}x)")
+
+def _escala(texto):
+    texto = texto.strip().lower()
+    multiplicador = {"k": 1000, "m": 1000000}.get(texto[-1:], 1)
+    return int(float(texto.rstrip("km")) * multiplicador)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do Pendrive Manager com árvores sintéticas.")
+    parser.add_argument("--escalas", default="10k", help="quantidades de arquivos, ex: 10k,100k,1M")
+    parser.add_argument("--pipelines", default=",".join(PIPELINES), help="operações medidas, em ordem")
+    parser.add_argument("--perfil", default="ssd", help="perfil de disco (ssd/usb)")
+    parser.add_argument("--quente", action="store_true", help="mantém índice e caches entre as operações")
+    parser.add_argument("--pasta", default=os.path.join(tempfile.gettempdir(), "pendrive_manager_benchmark"),
+                        help="onde as árvores ficam (reaproveitadas entre execuções)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--tamanho-medio", type=int, default=48, help="tamanho médio dos arquivos em KB")
+    parser.add_argument("--duplicatas", type=float, default=0.10, help="proporção de cópias exatas")
+    parser.add_argument("--corrompidos", type=float, default=0.02, help="proporção de JPEGs truncados")
+    parser.add_argument("--videos", type=float, default=0.10, help="proporção de MP4")
+    parser.add_argument("--lixo", type=float, default=0.15, help="proporção de nomes de WhatsApp/prints")
+    parser.add_argument("--saida", help="arquivo JSON de resultados (padrão: resultados_benchmark/...)")
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"), help="compara dois resultados")
+    parser.add_argument("--medir", nargs=2, metavar=("PIPELINE", "PASTA"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.medir:
+        print(json.dumps(medir_pipeline(args.medir[0], args.medir[1], args.perfil, args.quente)))
+        return 0
+    if args.comparar:
+        comparar(*args.comparar)
+        return 0
+
+    pipelines = [p.strip() for p in args.pipelines.split(",") if p.strip()]
+    desconhecidos = set(pipelines) - set(PIPELINES)
+    if desconhecidos: parser.error(f"pipelines desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    relatorio = {"data": datetime.datetime.now().isoformat(timespec="seconds"), "codigo": _versao_codigo(),
+                 "python": platform.python_version(), "sistema": platform.platform(),
+                 "cpus": os.cpu_count(), "perfil": args.perfil, "quente": args.quente, "escalas": []}
+    for quantidade in (_escala(e) for e in args.escalas.split(",")):
+        pasta = os.path.join(args.pasta, f"arvore_{quantidade}")
+        print(f"\n{quantidade} arquivos em {pasta}")
+        manifesto = gerar_arvore(pasta, quantidade, args.semente, args.tamanho_medio * 1024, args.duplicatas,
+                                 args.corrompidos, args.videos, args.lixo)
+        print(f"  árvore: {manifesto['bytes'] / 1048576:.0f} MB {manifesto['tipos']}")
+        resultados = []
+        for nome in pipelines:
+            resultado = rodar_pipeline(nome, pasta, args.perfil, args.quente)
+            print(_linha(resultado))
+            resultados.append(resultado)
+        relatorio["escalas"].append({"arquivos": quantidade, "arvore": manifesto, "resultados": resultados})
+
+    saida = args.saida or os.path.join("resultados_benchmark",
+                                       f"benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}_{relatorio['codigo']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados salvos em {saida}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
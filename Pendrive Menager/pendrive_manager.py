@@ -6,141 +6,3265 @@ import hashlib
 import time
 import platform
 import subprocess
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from pathlib import Path
-from PIL import Image, ImageTk
+import sqlite3
+import struct
+import json
+import io
+import re
+import errno
+import uuid
+from collections import OrderedDict, Counter, deque
+import mmap
+from array import array
+import atexit
+import multiprocessing
+import argparse
+import contextlib
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from PIL import Image, features
+
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
+    from PIL import ImageTk
+except ImportError:  # Servidor sem Tk: apenas o modo linha de comando fica disponível
+    tk = None
+
+try:
+    import fcntl  # Só em sistemas Unix: usado para clones copy-on-write (reflink)
+except ImportError:
+    fcntl = None
+
+try:
+    import xxhash  # Opcional: hash não-criptográfico muito mais rápido que MD5/BLAKE2
+except ImportError:
+    xxhash = None
 
 # --- CONFIGURAÇÃO DE EXTENSÕES ---
 EXTENSOES_FOTO = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.tif', '.tiff'}
 EXTENSOES_VIDEO = {'.mp4', '.mov', '.avi', '.mkv', '.wmv', '.flv', '.webm', '.3gp', '.m4v', '.mts'}
 EXTENSOES_TODAS = EXTENSOES_FOTO.union(EXTENSOES_VIDEO)
 
-# --- CORES E ESTILO (TEMA PROFISSIONAL DARK) ---
-COR_FUNDO = "#121212"       # Preto Profundo
-COR_PAINEL = "#1E1E1E"      # Cinza Carbono
-COR_DESTAQUE = "#007ACC"    # Azul Profissional (Microsoft Style)
-COR_SUCESSO = "#28A745"     # Verde Sóbrio
-COR_ALERTA = "#DC3545"      # Vermelho Alerta
-COR_INFO = "#17A2B8"        # Ciano Informativo
-COR_ROXO = "#6F42C1"        # Roxo para a nova função
-COR_TEXTO = "#E0E0E0"       # Branco Gelo
+# --- PASTAS ESPECIAIS ---
+PASTA_DADOS = ".pendrive_manager"  # Índice e caches ficam dentro do próprio dispositivo
+PASTAS_IGNORADAS = {"_LIXEIRA_SEGURA", "_SUSPEITOS", "_REVISAO_RAPIDA", "_JA_ARQUIVADOS", PASTA_DADOS}
+PASTA_REFERENCIAS = os.path.join(os.path.expanduser("~"), PASTA_DADOS, "acervos")  # Índices de referência dos acervos
+
+# --- CORES E ESTILO (TEMA PROFISSIONAL DARK) ---
+COR_FUNDO = "#121212"       # Preto Profundo
+COR_PAINEL = "#1E1E1E"      # Cinza Carbono
+COR_DESTAQUE = "#007ACC"    # Azul Profissional (Microsoft Style)
+COR_SUCESSO = "#28A745"     # Verde Sóbrio
+COR_ALERTA = "#DC3545"      # Vermelho Alerta
+COR_INFO = "#17A2B8"        # Ciano Informativo
+COR_ROXO = "#6F42C1"        # Roxo para a nova função
+COR_TEXTO = "#E0E0E0"       # Branco Gelo
+
+FONTE_LOGO = ("Impact", 50)
+FONTE_TITULO = ("Segoe UI", 24, "bold")
+FONTE_MENU = ("Segoe UI", 12, "bold")
+FONTE_DESC = ("Segoe UI", 9)
+
+# --- CONFIGURAÇÃO DE HASH ---
+ALGORITMO_HASH = "xxh3_128" if xxhash else "blake2b"
+BLOCO_PARCIAL = 64 * 1024   # Tamanho de cada amostra do hash parcial
+AMOSTRAS_MEIO = 3           # Blocos amostrados no meio do arquivo (além de início e fim)
+
+# Perfis de leitura: SSD aguenta várias leituras simultâneas; pendrive/HD externo
+# perde muito com seeks, então lê um arquivo por vez na ordem física aproximada (inode).
+PERFIS_DISCO = {
+    "ssd": {"nome": "SSD / NVMe", "workers": min(8, (os.cpu_count() or 2) * 2), "ordenar_inode": False,
+            "buffer": 4 * 1024 * 1024, "mmap": True, "workers_metadados": 16},
+    "usb": {"nome": "Pendrive / HD Externo", "workers": 1, "ordenar_inode": True,
+            "buffer": 1024 * 1024, "mmap": False, "workers_metadados": 4},
+}
+PERFIL_PADRAO = "usb"
+LIMITE_CACHE_HASH = 500_000  # Entradas mantidas no cache de hashes (LRU)
+DISTANCIA_PARECIDAS = 6      # Bits diferentes (de 64) aceitos entre fotos "parecidas"
+
+# --- MINIATURAS DAS JANELAS DE REVISÃO ---
+MEMORIA_MINIATURAS = 96 * 1024 * 1024  # Limite do cache em memória (bytes de pixels)
+PREFETCH_MINIATURAS = 8                # Itens preparados à frente do atual
+TAMANHO_MINIATURA_GALERIA = 320        # Lado maior das miniaturas da galeria HTML
+ITENS_BLOCO_GALERIA = 1000             # Fotos por arquivo de dados da galeria (carregados sob demanda)
+
+# --- IMPORTAÇÃO DE CARTÕES ---
+BUFFER_IMPORTACAO = 8 * 1024 * 1024  # Blocos grandes: cartões SD e pendrives rendem mais com escritas longas
+PASTA_SEM_DATA = "Sem_Data"          # Destino (na importação) das mídias sem data em EXIF, vídeo ou mtime
+
+# --- ATUALIZAÇÃO DA TELA ---
+INTERVALO_TELA_MS = 33  # O progresso é redesenhado ~30x por segundo, não a cada arquivo
+
+# --- RELATÓRIOS DE EXECUÇÃO ---
+EXPORTAR_PROMETHEUS = False  # Também grava métricas no formato texto do Prometheus (textfile collector)
+
+# --- DETECÇÃO DE LIXO ---
+# Padrões (regex, sem diferenciar maiúsculas) procurados no nome do arquivo, por categoria.
+# Categorias do usuário em ~/.pendrive_manager/regras_lixo.json somam-se a estas ou as substituem:
+#   {"memes": ["meme", "bom[ _-]?dia"], "download": []}   (lista vazia desativa a categoria)
+REGRAS_LIXO_PADRAO = {
+    "whatsapp": ["whatsapp", "wa0"],
+    "print": ["screenshot", "screen", "captura", "print"],
+    "redes sociais": ["telegram", "facebook", "instagram", "received"],
+    "download": ["download"],
+}
+ARQUIVO_REGRAS_LIXO = os.path.join(os.path.expanduser("~"), PASTA_DADOS, "regras_lixo.json")
+LIXO_POR_CONTEUDO = True  # Também lê o cabeçalho das fotos: pega prints renomeados
+# Resoluções de tela comuns (lado maior, lado menor): celulares e monitores
+RESOLUCOES_TELA = {
+    (1280, 720), (1334, 750), (1792, 828), (1920, 1080), (2160, 1080), (2220, 1080), (2340, 1080),
+    (2400, 1080), (2436, 1125), (2532, 1170), (2556, 1179), (2688, 1242), (2778, 1284), (2796, 1290),
+    (2560, 1440), (2960, 1440), (3040, 1440), (3120, 1440), (3200, 1440), (2388, 1668), (2732, 2048),
+    (1366, 768), (1440, 900), (1536, 864), (1600, 900), (1680, 1050), (1920, 1200), (2560, 1600),
+    (2880, 1800), (3024, 1964), (3456, 2234), (3840, 2160),
+}
+
+# --- FUNÇÕES UTILITÁRIAS ---
+
+# --- MÉTRICAS DE EXECUÇÃO ---
+
+class MetricasExecucao:
+    """Tempo, arquivos, bytes lidos e erros por etapa de uma operação longa.
+
+    Uso: `with metricas.etapa("amostragem"): ...`; contar() e erro() vão para a
+    etapa em andamento e podem ser chamados de qualquer thread. Ao final,
+    gravar() salva o relatório JSON (e o arquivo do Prometheus, se pedido).
+    """
+
+    def __init__(self, operacao, pasta_base=""):
+        self.operacao = operacao
+        self.pasta_base = pasta_base
+        self.inicio = time.time()
+        self.fim = None
+        self.cancelada = False
+        self.etapas = OrderedDict()  # nome -> {"segundos", "arquivos", "bytes", "erros": Counter}
+        self.exemplos_erros = OrderedDict()  # tipo -> primeiro caminho que falhou
+        self.etapa_atual = None
+        self._inicio_etapa = None
+        self._lock = threading.Lock()
+
+    def _dados_etapa(self, nome):
+        if nome not in self.etapas:
+            self.etapas[nome] = {"segundos": 0.0, "arquivos": 0, "bytes": 0, "erros": Counter()}
+        return self.etapas[nome]
+
+    @contextlib.contextmanager
+    def etapa(self, nome):
+        with self._lock:
+            anterior, inicio_anterior = self.etapa_atual, self._inicio_etapa
+            self._dados_etapa(nome)
+            self.etapa_atual, self._inicio_etapa = nome, time.monotonic()
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.etapas[nome]["segundos"] += time.monotonic() - self._inicio_etapa
+                self.etapa_atual, self._inicio_etapa = anterior, inicio_anterior
+
+    def contar(self, arquivos=1, bytes_lidos=0):
+        with self._lock:
+            dados = self._dados_etapa(self.etapa_atual or "geral")
+            dados["arquivos"] += arquivos
+            dados["bytes"] += bytes_lidos
+
+    def erro(self, tipo, caminho=None):
+        """Registra uma falha; `tipo` pode ser a própria exceção (conta pelo nome da classe)."""
+        if isinstance(tipo, BaseException): tipo = type(tipo).__name__
+        with self._lock:
+            self._dados_etapa(self.etapa_atual or "geral")["erros"][tipo] += 1
+            if caminho is not None: self.exemplos_erros.setdefault(tipo, caminho)
+
+    def total_erros(self):
+        with self._lock:
+            return sum(sum(d["erros"].values()) for d in self.etapas.values())
+
+    def resumo(self):
+        """Linha curta para a tela de progresso: etapa atual, volume, velocidade e erros."""
+        with self._lock:
+            nome = self.etapa_atual
+            if nome is None: return ""
+            dados = self.etapas[nome]
+            decorrido = dados["segundos"] + time.monotonic() - self._inicio_etapa
+            erros = sum(sum(d["erros"].values()) for d in self.etapas.values())
+        partes = [f"Etapa: {nome}", f"{dados['arquivos']} arquivos ({dados['arquivos'] / max(decorrido, 1e-6):.0f}/s)"]
+        if dados["bytes"]:
+            partes.append(f"{formatar_bytes(dados['bytes'])} lidos ({dados['bytes'] / max(decorrido, 1e-6) / 1048576:.1f} MB/s)")
+        partes.append(f"{erros} erros")
+        return " • ".join(partes)
+
+    def como_dict(self):
+        fim = self.fim or time.time()
+        with self._lock:
+            etapas = {}
+            for nome, d in self.etapas.items():
+                etapas[nome] = {"segundos": round(d["segundos"], 3), "arquivos": d["arquivos"], "bytes": d["bytes"],
+                                "arquivos_s": round(d["arquivos"] / d["segundos"], 1) if d["segundos"] else None,
+                                "mb_s": round(d["bytes"] / d["segundos"] / 1048576, 2) if d["segundos"] else None,
+                                "erros": dict(d["erros"])}
+            return {"operacao": self.operacao, "pasta": self.pasta_base,
+                    "inicio": datetime.datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+                    "duracao_s": round(fim - self.inicio, 3), "cancelada": self.cancelada, "etapas": etapas,
+                    "exemplos_erros": dict(self.exemplos_erros)}
+
+    def _texto_prometheus(self, dados):
+        def rotulos(**kw):
+            escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"')
+            return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in kw.items()) + "}"
+        op = self.operacao
+        linhas = ["# HELP pendrive_manager_duracao_segundos Duração total da última execução.",
+                  "# TYPE pendrive_manager_duracao_segundos gauge",
+                  f"pendrive_manager_duracao_segundos{rotulos(operacao=op)} {dados['duracao_s']}",
+                  "# HELP pendrive_manager_ultima_execucao_timestamp Fim da última execução (epoch).",
+                  "# TYPE pendrive_manager_ultima_execucao_timestamp gauge",
+                  f"pendrive_manager_ultima_execucao_timestamp{rotulos(operacao=op)} {int(self.fim or time.time())}"]
+        for metrica, campo, ajuda in (("etapa_segundos", "segundos", "Tempo gasto na etapa."),
+                                      ("etapa_arquivos", "arquivos", "Arquivos processados na etapa."),
+                                      ("etapa_bytes_lidos", "bytes", "Bytes lidos do disco na etapa.")):
+            linhas += [f"# HELP pendrive_manager_{metrica} {ajuda}", f"# TYPE pendrive_manager_{metrica} gauge"]
+            linhas += [f"pendrive_manager_{metrica}{rotulos(operacao=op, etapa=nome)} {d[campo]}"
+                       for nome, d in dados["etapas"].items()]
+        linhas += ["# HELP pendrive_manager_erros Falhas por etapa e tipo na última execução.",
+                   "# TYPE pendrive_manager_erros gauge"]
+        linhas += [f"pendrive_manager_erros{rotulos(operacao=op, etapa=nome, tipo=tipo)} {n}"
+                   for nome, d in dados["etapas"].items() for tipo, n in d["erros"].items()]
+        return "\n".join(linhas) + "\n"
+
+    def gravar(self, pasta, prometheus=EXPORTAR_PROMETHEUS):
+        """Finaliza e grava o relatório JSON em `pasta`. Retorna o caminho (None se falhar)."""
+        self.fim = self.fim or time.time()
+        dados = self.como_dict()
+        try:
+            os.makedirs(pasta, exist_ok=True)
+            caminho = os.path.join(pasta, f"{datetime.datetime.fromtimestamp(self.inicio):%Y%m%d_%H%M%S}_{self.operacao}.json")
+            with open(caminho, "w", encoding="utf-8") as f:
+                json.dump(dados, f, indent=2, ensure_ascii=False)
+            if prometheus:
+                # Escrita atômica: o coletor nunca lê um arquivo pela metade
+                destino = os.path.join(pasta, f"pendrive_manager_{self.operacao}.prom")
+                with open(destino + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(self._texto_prometheus(dados))
+                os.replace(destino + ".tmp", destino)
+            return caminho
+        except OSError:
+            return None
+
+class _MetricasNulas:
+    """Métricas que não registram nada (quando quem chama não pediu medição)."""
+    def etapa(self, nome): return contextlib.nullcontext(self)
+    def contar(self, arquivos=1, bytes_lidos=0): pass
+    def erro(self, tipo, caminho=None): pass
+
+# --- TAREFAS (CANCELAR / PAUSAR) ---
+
+class TarefaCancelada(Exception):
+    """Levantada em um ponto de verificação depois que a tarefa foi cancelada."""
+
+class Tarefa:
+    """Controle de uma operação em segundo plano: cancelar, pausar e retomar.
+
+    As funções longas chamam checar() em pontos seguros (entre um arquivo e
+    outro, nunca no meio de um movimento). Pausada, a chamada fica bloqueada
+    até retomar(); cancelada, levanta TarefaCancelada. O que já foi feito
+    (hashes em cache, movimentos no diário, miniaturas) continua valendo.
+    """
+
+    def __init__(self):
+        self._cancelada = threading.Event()
+        self._livre = threading.Event()
+        self._livre.set()
+
+    def cancelar(self):
+        self._cancelada.set()
+        self._livre.set()  # Libera quem estiver pausado para ver o cancelamento
+
+    def pausar(self):
+        if not self._cancelada.is_set(): self._livre.clear()
+
+    def retomar(self):
+        self._livre.set()
+
+    @property
+    def cancelada(self):
+        return self._cancelada.is_set()
+
+    @property
+    def pausada(self):
+        return not self._livre.is_set()
+
+    def checar(self):
+        self._livre.wait()
+        if self._cancelada.is_set(): raise TarefaCancelada()
+
+def _mapear_em_blocos(pool, funcao, itens, tarefa, bloco, chunksize=1):
+    """pool.map em blocos: pausa e cancelamento valem no bloco seguinte em vez de só no fim da lista."""
+    for i in range(0, len(itens), bloco):
+        tarefa.checar()
+        yield from pool.map(funcao, itens[i:i + bloco], chunksize=chunksize)
+
+# --- LEITURA RÁPIDA DE DATAS (SÓ CABEÇALHOS) ---
+
+EXTENSOES_EXIF_RAPIDO = {'.jpg', '.jpeg', '.tif', '.tiff', '.heic'}
+EXTENSOES_MP4 = {'.mp4', '.mov', '.m4v', '.3gp'}
+LIMITE_CABECALHO = 128 * 1024  # Onde procurar o bloco EXIF em JPEG/HEIC
+
+def _ano_valido(ano):
+    try:
+        ano = int(ano)
+    except (TypeError, ValueError):
+        return None
+    return str(ano) if 1900 < ano <= datetime.date.today().year + 1 else None
+
+def _ler_tiff_data(f, base):
+    """Procura DateTimeOriginal (ou DateTime) em uma estrutura TIFF/EXIF que começa em `base`."""
+    f.seek(base)
+    cab = f.read(8)
+    if cab[:4] == b"II*\x00": ordem = "<"
+    elif cab[:4] == b"MM\x00*": ordem = ">"
+    else: return None
+
+    def ler_ifd(offset):
+        f.seek(base + offset)
+        n = f.read(2)
+        if len(n) < 2: return {}
+        qtd = struct.unpack(ordem + "H", n)[0]
+        dados = f.read(12 * min(qtd, 512))
+        tags = {}
+        for i in range(0, len(dados) - 11, 12):
+            tag, tipo, cont, valor = struct.unpack(ordem + "HHI4s", dados[i:i + 12])
+            tags[tag] = (tipo, cont, valor)
+        return tags
+
+    def ler_ascii(entrada):
+        tipo, cont, valor = entrada
+        if tipo != 2: return None
+        if cont <= 4: return valor[:cont]
+        f.seek(base + struct.unpack(ordem + "I", valor)[0])
+        return f.read(min(cont, 64))
+
+    ifd0 = ler_ifd(struct.unpack(ordem + "I", cab[4:8])[0])
+    candidatos = []
+    if 0x8769 in ifd0:  # Ponteiro para o IFD EXIF
+        exif = ler_ifd(struct.unpack(ordem + "I", ifd0[0x8769][2])[0])
+        candidatos += [exif.get(0x9003), exif.get(0x9004)]  # DateTimeOriginal, DateTimeDigitized
+    candidatos.append(ifd0.get(0x0132))  # DateTime
+    for entrada in candidatos:
+        if entrada is None: continue
+        texto = ler_ascii(entrada)
+        ano = _ano_valido(texto[:4].decode("ascii", "ignore")) if texto else None
+        if ano: return ano
+    return None
+
+@contextlib.contextmanager
+def _abrir_origem(origem):
+    """Abre um caminho para leitura binária; um arquivo já aberto (ex: BytesIO) é usado como está."""
+    if hasattr(origem, "read"):
+        origem.seek(0)
+        yield origem
+    else:
+        with open(origem, "rb") as f:
+            yield f
+
+def ler_ano_exif(origem):
+    """Ano do EXIF lendo apenas o cabeçalho de JPEG/TIFF/HEIC, sem decodificar a imagem.
+
+    `origem` é um caminho ou um arquivo binário já aberto (vale também para ler_ano_video).
+    """
+    with _abrir_origem(origem) as f:
+        inicio = f.read(12)
+        if inicio[:4] in (b"II*\x00", b"MM\x00*"):
+            return _ler_tiff_data(f, 0)
+        if inicio[:2] == b"\xff\xd8":
+            # JPEG: percorre os marcadores até o APP1 "Exif" (para antes dos dados da imagem)
+            pos = 2
+            while pos < LIMITE_CABECALHO:
+                f.seek(pos)
+                marc = f.read(4)
+                if len(marc) < 4 or marc[0] != 0xFF: return None
+                tipo, tam = marc[1], struct.unpack(">H", marc[2:4])[0]
+                if tipo == 0xDA: return None  # Início da imagem comprimida: não há EXIF
+                if tipo == 0xE1 and f.read(6) == b"Exif\x00\x00":
+                    return _ler_tiff_data(f, pos + 10)
+                pos += 2 + tam
+            return None
+        if inicio[4:8] == b"ftyp":
+            # HEIC: o item EXIF fica em algum lugar do começo; procura o TIFF após "Exif\0\0"
+            f.seek(0)
+            bloco = f.read(LIMITE_CABECALHO)
+            i = bloco.find(b"Exif\x00\x00")
+            if i >= 0:
+                return _ler_tiff_data(f, i + 6)
+    return None
+
+def _atomos(f, inicio, limite):
+    """Átomos MP4/MOV entre inicio e limite: (tipo, início dos dados, fim).
+
+    ValueError quando um tamanho declarado não fecha com o espaço disponível
+    (arquivo truncado ou que não é MP4/MOV).
+    """
+    pos = inicio
+    while pos < limite:
+        if limite - pos < 8: raise ValueError(f"{limite - pos} bytes soltos no offset {pos}")
+        f.seek(pos)
+        cab = f.read(8)
+        if len(cab) < 8: raise ValueError(f"fim inesperado do arquivo no offset {pos}")
+        tam, tipo = struct.unpack(">I4s", cab)
+        if not all(32 <= c < 127 or c == 0xA9 for c in tipo):  # 0xA9: "©", usado nos metadados
+            raise ValueError(f"átomo inválido no offset {pos}: não parece um MP4/MOV")
+        cab_tam = 8
+        if tam == 1:
+            tam = struct.unpack(">Q", f.read(8))[0]
+            cab_tam = 16
+        elif tam == 0:
+            tam = limite - pos  # Vai até o fim (comum no mdat)
+        nome = tipo.decode("latin-1")
+        if tam < cab_tam: raise ValueError(f"átomo '{nome}' com tamanho inválido ({tam}) no offset {pos}")
+        if pos + tam > limite:
+            raise ValueError(f"átomo '{nome}' declara {tam} bytes, mas só restam {limite - pos}: truncado")
+        yield tipo, pos + cab_tam, pos + tam
+        pos += tam
+
+def ler_ano_video(origem):
+    """Ano de criação de MP4/MOV (átomo moov/mvhd) percorrendo os átomos sem decodificar."""
+    with _abrir_origem(origem) as f:
+        f.seek(0, os.SEEK_END)
+        fim = f.tell()
+        for tipo, ini, fim_moov in _atomos(f, 0, fim):
+            if tipo != b"moov": continue
+            for sub, ini_mvhd, _ in _atomos(f, ini, fim_moov):
+                if sub != b"mvhd": continue
+                f.seek(ini_mvhd)
+                versao = f.read(4)[0]
+                criado = struct.unpack(">Q", f.read(8))[0] if versao == 1 else struct.unpack(">I", f.read(4))[0]
+                if criado == 0: return None
+                # Segundos desde 01/01/1904 (época do QuickTime)
+                data = datetime.datetime(1904, 1, 1) + datetime.timedelta(seconds=criado)
+                return _ano_valido(data.year)
+    return None
+
+def obter_data_arquivo(caminho_arquivo, dados=None):
+    """Tenta descobrir o ano do arquivo (EXIF/metadados do vídeo ou Data de Modificação).
+
+    Com `dados` (o conteúdo já lido), os metadados saem da memória em vez do disco.
+    """
+    ext = os.path.splitext(caminho_arquivo)[1].lower()
+    origem = io.BytesIO(dados) if dados is not None else caminho_arquivo
+    
+    try:
+        if ext in EXTENSOES_EXIF_RAPIDO:
+            ano = ler_ano_exif(origem)
+            if ano: return ano
+        elif ext in EXTENSOES_MP4:
+            ano = ler_ano_video(origem)
+            if ano: return ano
+        elif ext in EXTENSOES_FOTO:
+            # Formatos menos comuns (PNG/WebP...): o Pillow só lê o cabeçalho aqui
+            with Image.open(origem) as img:
+                # 36867 é a tag para DateTimeOriginal
+                data_str = img.getexif().get_ifd(0x8769).get(36867) or img.getexif().get(306)
+            ano = _ano_valido(data_str[:4]) if data_str else None
+            if ano: return ano
+    except Exception:
+        pass
+    
+    # Fallback: Data de modificação do arquivo (funciona p/ vídeos e fotos sem EXIF)
+    try:
+        timestamp = os.path.getmtime(caminho_arquivo)
+        data_arquivo = datetime.datetime.fromtimestamp(timestamp)
+        return str(data_arquivo.year)
+    except (OSError, ValueError, OverflowError):
+        return "Indeterminado"
+
+def novo_hasher(algoritmo=ALGORITMO_HASH):
+    """Cria o objeto de hash (xxh3_128 se disponível, senão BLAKE2b; aceita qualquer nome do hashlib)."""
+    if algoritmo == "xxh3_128":
+        return xxhash.xxh3_128()
+    if algoritmo == "blake2b":
+        return hashlib.blake2b(digest_size=20)
+    return hashlib.new(algoritmo)
+
+class CacheHash:
+    """Cache durável de hashes indexado por (dispositivo, inode, algoritmo).
+
+    A entrada só vale enquanto tamanho e mtime_ns forem os mesmos; qualquer
+    alteração do arquivo a invalida. Como um rename mantém o inode, arquivos
+    apenas movidos continuam com o hash em cache. O total de entradas é
+    limitado e as menos usadas recentemente são descartadas.
+    """
+
+    def __init__(self, caminho_db=None, limite=LIMITE_CACHE_HASH):
+        if caminho_db is None:
+            try:
+                pasta = os.path.join(os.path.expanduser("~"), PASTA_DADOS)
+                os.makedirs(pasta, exist_ok=True)
+                caminho_db = os.path.join(pasta, "cache_hash.db")
+            except OSError:
+                caminho_db = ":memory:"
+        self.limite = limite
+        self._lock = threading.Lock()
+        self._pendentes = 0
+        self._relogio = 0
+        # timeout: vários processos da linha de comando podem dividir o mesmo cache
+        self.conn = sqlite3.connect(caminho_db, check_same_thread=False, timeout=30)
+        try: self.conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError: pass
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                dev       INTEGER NOT NULL,
+                inode     INTEGER NOT NULL,
+                algoritmo TEXT NOT NULL,
+                tamanho   INTEGER NOT NULL,
+                mtime_ns  INTEGER NOT NULL,
+                hash      TEXT NOT NULL,
+                uso       INTEGER NOT NULL,
+                PRIMARY KEY (dev, inode, algoritmo)
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_hashes_uso ON hashes(uso)")
+        self._relogio = self.conn.execute("SELECT COALESCE(MAX(uso), 0) FROM hashes").fetchone()[0]
+        self.conn.commit()
+
+    def obter(self, st, algoritmo):
+        """Hash em cache para o stat informado, ou None se ausente/desatualizado."""
+        with self._lock:
+            linha = self.conn.execute(
+                "SELECT tamanho, mtime_ns, hash FROM hashes WHERE dev = ? AND inode = ? AND algoritmo = ?",
+                (st.st_dev, st.st_ino, algoritmo)).fetchone()
+            if linha is None: return None
+            if (linha[0], linha[1]) != (st.st_size, st.st_mtime_ns):
+                self.conn.execute("DELETE FROM hashes WHERE dev = ? AND inode = ? AND algoritmo = ?",
+                                  (st.st_dev, st.st_ino, algoritmo))
+                self._registrar_escrita()
+                return None
+            self._relogio += 1
+            self.conn.execute("UPDATE hashes SET uso = ? WHERE dev = ? AND inode = ? AND algoritmo = ?",
+                              (self._relogio, st.st_dev, st.st_ino, algoritmo))
+            self._registrar_escrita()
+            return linha[2]
+
+    def gravar(self, st, algoritmo, valor):
+        with self._lock:
+            self._relogio += 1
+            self.conn.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (st.st_dev, st.st_ino, algoritmo, st.st_size, st.st_mtime_ns, valor, self._relogio))
+            self._registrar_escrita()
+
+    def transferir(self, st_origem, st_destino):
+        """Copia as entradas de um arquivo para o seu novo inode (move entre dispositivos)."""
+        if (st_origem.st_dev, st_origem.st_ino) == (st_destino.st_dev, st_destino.st_ino): return
+        if (st_origem.st_size, st_origem.st_mtime_ns) != (st_destino.st_size, st_destino.st_mtime_ns): return
+        with self._lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO hashes
+                SELECT ?, ?, algoritmo, tamanho, mtime_ns, hash, uso FROM hashes
+                WHERE dev = ? AND inode = ? AND tamanho = ? AND mtime_ns = ?""",
+                (st_destino.st_dev, st_destino.st_ino, st_origem.st_dev, st_origem.st_ino,
+                 st_origem.st_size, st_origem.st_mtime_ns))
+            self.conn.execute("DELETE FROM hashes WHERE dev = ? AND inode = ?", (st_origem.st_dev, st_origem.st_ino))
+            self._registrar_escrita()
+
+    def _registrar_escrita(self):
+        # Commits em lote: um commit por arquivo deixaria o cache mais lento que o próprio hash
+        self._pendentes += 1
+        if self._pendentes >= 500:
+            self._salvar()
+
+    def _salvar(self):
+        excesso = self.conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0] - self.limite
+        if excesso > 0:
+            self.conn.execute("DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM hashes ORDER BY uso LIMIT ?)", (excesso,))
+        self.conn.commit()
+        self._pendentes = 0
+
+    def salvar(self):
+        with self._lock:
+            self._salvar()
+
+_cache_hash = None
+_cache_hash_lock = threading.Lock()
+
+def obter_cache_hash():
+    """Instância única do cache de hashes (criada na primeira utilização)."""
+    global _cache_hash
+    with _cache_hash_lock:
+        if _cache_hash is None:
+            _cache_hash = CacheHash()
+            atexit.register(_cache_hash.salvar)
+        return _cache_hash
+
+def mover_arquivo(origem, destino):
+    """shutil.move que preserva o hash em cache mesmo quando o inode muda."""
+    st_origem = os.stat(origem)
+    shutil.move(origem, destino)
+    try:
+        obter_cache_hash().transferir(st_origem, os.stat(destino))
+    except (OSError, sqlite3.Error):
+        pass
+
+_buffers_thread = threading.local()
+
+def _buffer_leitura(tamanho):
+    """Buffer reutilizado por thread para readinto (evita alocar um bytes por bloco)."""
+    buf = getattr(_buffers_thread, "buf", None)
+    if buf is None or len(buf) != tamanho:
+        buf = _buffers_thread.buf = bytearray(tamanho)
+    return buf
+
+def obter_datas_em_lote(caminhos, progresso=None, workers=4, metricas=None, tarefa=None):
+    """obter_data_arquivo em um pool de threads: o tempo fica limitado pela leitura do disco."""
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    anos = {}
+    total = len(caminhos)
+
+    def ler(caminho):
+        tarefa.checar()
+        return obter_data_arquivo(caminho)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, (caminho, ano) in enumerate(zip(caminhos, pool.map(ler, caminhos)), 1):
+            anos[caminho] = ano
+            metricas.contar()
+            if ano == "Indeterminado": metricas.erro("DataIndeterminada", caminho)
+            if progresso and i % 50 == 0: progresso(i, total, "Lendo datas (EXIF/vídeo)...")
+    return anos
+
+def calcular_hash_arquivo(caminho, block_size=1024 * 1024, algoritmo=ALGORITMO_HASH, usar_mmap=False, usar_cache=True):
+    """Gera hash do conteúdo completo para comparar arquivos (consultando antes o cache)."""
+    if usar_cache:
+        try:
+            st = os.stat(caminho)
+            h = obter_cache_hash().obter(st, algoritmo)
+            if h: return h
+        except (OSError, sqlite3.Error):
+            usar_cache = False
+        h = calcular_hash_arquivo(caminho, block_size, algoritmo, usar_mmap, usar_cache=False)
+        if h and usar_cache:
+            try:
+                if os.stat(caminho).st_mtime_ns == st.st_mtime_ns:  # Não grava se mudou durante a leitura
+                    obter_cache_hash().gravar(st, algoritmo, h)
+            except (OSError, sqlite3.Error):
+                pass
+        return h
+    
+    hasher = novo_hasher(algoritmo)
+    try:
+        with open(caminho, 'rb') as f:
+            if usar_mmap:
+                try:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                        hasher.update(m)
+                    return hasher.hexdigest()
+                except ValueError:
+                    pass  # Arquivo vazio não pode ser mapeado; segue pelo caminho normal
+            buf = _buffer_leitura(block_size)
+            view = memoryview(buf)
+            n = f.readinto(buf)
+            while n:
+                hasher.update(view[:n])
+                n = f.readinto(buf)
+        return hasher.hexdigest()
+    except OSError:
+        return None
+
+def calcular_hash_parcial(caminho, tamanho, algoritmo=ALGORITMO_HASH):
+    """Hash do início, do fim e de alguns blocos do meio.
+
+    Retorna (hash, bytes_lidos, completo). Se o arquivo for pequeno o bastante
+    para ser lido inteiro, `completo` é True e o hash equivale ao de calcular_hash_arquivo.
+    """
+    if tamanho <= BLOCO_PARCIAL * (AMOSTRAS_MEIO + 2):
+        return calcular_hash_arquivo(caminho, algoritmo=algoritmo), tamanho, True
+    
+    # Amostras também vão para o cache, com uma chave própria por configuração
+    chave = f"parcial:{algoritmo}:{BLOCO_PARCIAL}x{AMOSTRAS_MEIO}"
+    try:
+        st = os.stat(caminho)
+        h = obter_cache_hash().obter(st, chave)
+        if h: return h, 0, False
+    except (OSError, sqlite3.Error):
+        st = None
+    
+    hasher = novo_hasher(algoritmo)
+    passo = (tamanho - BLOCO_PARCIAL) // (AMOSTRAS_MEIO + 1)
+    offsets = [i * passo for i in range(AMOSTRAS_MEIO + 1)] + [tamanho - BLOCO_PARCIAL]
+    lidos = 0
+    try:
+        with open(caminho, 'rb') as f:
+            for off in offsets:
+                f.seek(off)
+                buf = f.read(BLOCO_PARCIAL)
+                hasher.update(buf)
+                lidos += len(buf)
+        h = hasher.hexdigest()
+        if st is not None:
+            try: obter_cache_hash().gravar(st, chave, h)
+            except sqlite3.Error: pass
+        return h, lidos, False
+    except OSError:
+        return None, lidos, False
+
+class MotorHash:
+    """Executa leituras/hashes em um pool de threads conforme o perfil do disco.
+
+    O hashlib libera o GIL em blocos grandes, então várias threads aproveitam
+    a banda de um SSD. No perfil USB as leituras são sequenciais e ordenadas
+    por inode, o que reduz seeks em pendrives e HDs externos.
+    """
+
+    def __init__(self, perfil=PERFIL_PADRAO, workers=None, metricas=None, tarefa=None):
+        self.perfil = PERFIS_DISCO.get(perfil, PERFIS_DISCO[PERFIL_PADRAO])
+        self.workers = workers or self.perfil["workers"]
+        self.metricas = metricas or _MetricasNulas()
+        self.tarefa = tarefa or Tarefa()
+        self.bytes_lidos = 0
+        self._lock = threading.Lock()
+
+    def hash_completo(self, caminho, algoritmo=ALGORITMO_HASH):
+        """Retorna (hash, bytes_lidos); um acerto no cache de hashes não lê nada do disco."""
+        try:
+            st = os.stat(caminho)
+            h = obter_cache_hash().obter(st, algoritmo)
+            if h: return h, 0
+        except (OSError, sqlite3.Error):
+            return None, 0
+        return calcular_hash_arquivo(caminho, self.perfil["buffer"], algoritmo, self.perfil["mmap"]), st.st_size
+
+    def mapear(self, funcao, itens, progresso=None, texto="Processando..."):
+        """Aplica funcao(item) -> (resultado, bytes_lidos) a cada item.
+
+        `itens` é uma lista de tuplas cujo terceiro campo é o inode (usado na ordenação).
+        Gera (item, resultado) conforme terminam e reporta o progresso com MB/s.
+        """
+        if self.perfil["ordenar_inode"]:
+            itens = sorted(itens, key=lambda it: it[2] or 0)
+        total = len(itens)
+        inicio = time.monotonic()
+        bytes_inicio = self.bytes_lidos
+
+        def executar(item):
+            self.tarefa.checar()  # Pausa/cancelamento entre um arquivo e outro
+            resultado, lidos = funcao(item)
+            with self._lock:
+                self.bytes_lidos += lidos
+            self.metricas.contar(1, lidos)
+            return item, resultado
+
+        def reportar(feitos):
+            if not progresso: return
+            decorrido = max(time.monotonic() - inicio, 1e-6)
+            mbs = (self.bytes_lidos - bytes_inicio) / decorrido / (1024 * 1024)
+            progresso(feitos, total, f"{texto} {mbs:.1f} MB/s")
+
+        if self.workers <= 1:
+            for feitos, item in enumerate(itens, 1):
+                yield executar(item)
+                reportar(feitos)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for feitos, par in enumerate(pool.map(executar, itens), 1):
+                yield par
+                reportar(feitos)
+
+def encontrar_duplicatas(arquivos, progresso=None, algoritmo=ALGORITMO_HASH, motor=None):
+    """Detecta duplicatas em etapas: tamanho -> hash parcial -> hash completo.
+
+    `arquivos` é uma TabelaArquivos com a coluna "hash" (valores "algoritmo:hash";
+    os de outro algoritmo, ex: MD5 de versões antigas, são recalculados). Só os
+    arquivos com tamanho repetido viram itens em memória. Retorna (grupos, hashes_novos, estatisticas), onde hashes_novos lista os
+    (caminho, hash) completos calculados nesta execução e estatisticas traz os
+    bytes lidos e evitados em cada etapa.
+    """
+    motor = motor or MotorHash()
+    metricas = motor.metricas
+    stats = {"arquivos": len(arquivos), "bytes_total": 0,
+             "evitados_tamanho": 0, "lidos_parcial": 0, "evitados_parcial": 0,
+             "lidos_completo": 0, "reaproveitados": 0, "ja_ligados": 0}
+
+    # 1. Tamanho: arquivos com tamanho único não precisam ser lidos (nem sair da tabela)
+    prefixo = algoritmo + ":"
+    with metricas.etapa("tamanho"):
+        repeticoes = Counter(arquivos.tamanho)
+        hashes = arquivos.extras["hash"]
+        itens = []
+        inodes = set()
+        for i, tamanho in enumerate(arquivos.tamanho):
+            stats["bytes_total"] += tamanho
+            if tamanho > 0 and repeticoes[tamanho] > 1:
+                # Hardlinks do mesmo arquivo não ocupam espaço extra: entra só o primeiro nome
+                inode = arquivos.inode[i]
+                if inode:
+                    if inode in inodes:
+                        stats["ja_ligados"] += 1
+                        continue
+                    inodes.add(inode)
+                h = hashes[i]
+                # Hash guardado só vale se o arquivo não mudou desde que foi calculado
+                h = h[len(prefixo):] if h and h.startswith(prefixo) and arquivos.atual(i) else None
+                itens.append((arquivos.caminho(i), tamanho, arquivos.inode[i], h))
+            else:
+                stats["evitados_tamanho"] += tamanho
+        metricas.contar(len(arquivos))
+
+    completos = {}    # caminho -> hash completo
+    hashes_novos = []
+
+    # 2. Hash parcial (início/meio/fim) separa quase todos os falsos candidatos.
+    # Arquivos com hash completo já conhecido também são amostrados (custa no
+    # máximo alguns blocos) para poderem ser comparados com os demais.
+    def parcial(item):
+        hp, lidos, completo = calcular_hash_parcial(item[0], item[1], algoritmo)
+        return (hp, completo, lidos), lidos
+
+    por_parcial = {}
+    with metricas.etapa("amostragem"):
+        for item, (hp, completo, lidos) in motor.mapear(parcial, itens, progresso, "Etapa 1/2: amostrando conteúdo..."):
+            caminho, tamanho, inode, h = item
+            stats["lidos_parcial"] += lidos
+            if hp is None:
+                metricas.erro("LeituraFalhou", caminho)
+                continue
+            if h:
+                completos[caminho] = h
+                stats["reaproveitados"] += 1
+            elif completo:
+                completos[caminho] = hp
+                hashes_novos.append((caminho, hp))
+            por_parcial.setdefault((tamanho, hp), []).append(item)
+
+    sobreviventes = []
+    for (tamanho, _), grupo in por_parcial.items():
+        if len(grupo) > 1:
+            sobreviventes.extend(grupo)
+        else:
+            stats["evitados_parcial"] += tamanho - min(tamanho, BLOCO_PARCIAL * (AMOSTRAS_MEIO + 2))
+
+    # 3. Hash completo apenas para quem sobreviveu à amostragem
+    def hash_total(item):
+        h, lidos = motor.hash_completo(item[0], algoritmo)
+        return (h, lidos), lidos
+
+    faltando = [item for item in sobreviventes if item[0] not in completos]
+    with metricas.etapa("hash completo"):
+        for item, (h, lidos) in motor.mapear(hash_total, faltando, progresso, "Etapa 2/2: confirmando conteúdo..."):
+            if h is None:
+                metricas.erro("LeituraFalhou", item[0])
+                continue
+            stats["lidos_completo"] += lidos
+            completos[item[0]] = h
+            hashes_novos.append((item[0], h))
+
+    grupos_hash = {}
+    for caminho, tamanho, _, _ in sobreviventes:
+        h = completos.get(caminho)
+        if h: grupos_hash.setdefault((tamanho, h), []).append(caminho)
+
+    grupos = [g for g in grupos_hash.values() if len(g) > 1]
+    return grupos, hashes_novos, stats
+
+# --- DEDUPLICAÇÃO COM LINKS ---
+
+FICLONE = 0x40049409  # ioctl do Linux: clone copy-on-write (Btrfs, XFS, bcachefs...)
+
+class ArquivosDiferentes(Exception):
+    """Levantada quando a comparação byte a byte contradiz o hash: nada é substituído."""
+
+def arquivos_identicos(caminho_a, caminho_b, bloco=1024 * 1024):
+    """Compara o conteúdo byte a byte em blocos, sem carregar os arquivos inteiros."""
+    with open(caminho_a, "rb") as fa, open(caminho_b, "rb") as fb:
+        if os.fstat(fa.fileno()).st_size != os.fstat(fb.fileno()).st_size: return False
+        while True:
+            a, b = fa.read(bloco), fb.read(bloco)
+            if a != b: return False
+            if not a: return True
+
+def _criar_reflink(origem, destino):
+    """Cria `destino` como clone copy-on-write de `origem`. False se o sistema de arquivos não suporta."""
+    if fcntl is None: return False
+    try:
+        with open(origem, "rb") as fo, open(destino, "xb") as fd:
+            fcntl.ioctl(fd.fileno(), FICLONE, fo.fileno())
+        return True
+    except OSError:
+        with contextlib.suppress(OSError): os.remove(destino)
+        return False
+
+def substituir_por_link(original, copia, modo="auto"):
+    """Troca `copia` por um reflink (cópia independente que divide os blocos) ou hardlink de `original`.
+
+    O conteúdo é conferido byte a byte antes; o link nasce com nome temporário
+    ao lado da cópia e só então os.replace o coloca no lugar, de modo que uma
+    falha em qualquer ponto deixa a cópia intacta. `modo`: "auto" (reflink se
+    possível, senão hardlink), "reflink" ou "hardlink". Retorna (tipo, bytes
+    liberados); tipo None se já eram o mesmo arquivo.
+    """
+    st_original, st_copia = os.stat(original), os.stat(copia)
+    if (st_original.st_dev, st_original.st_ino) == (st_copia.st_dev, st_copia.st_ino): return None, 0
+    if st_original.st_dev != st_copia.st_dev:
+        raise OSError(errno.EXDEV, "arquivos em dispositivos diferentes não podem ser ligados", copia)
+    if not arquivos_identicos(original, copia):
+        raise ArquivosDiferentes(f"conteúdo diferente de {original}")
+
+    temporario = os.path.join(os.path.dirname(copia), f".{os.path.basename(copia)}.{uuid.uuid4().hex[:8]}.link")
+    tipo = None
+    if modo in ("auto", "reflink") and _criar_reflink(original, temporario):
+        tipo = "reflink"
+        shutil.copystat(copia, temporario)  # O clone mantém data/permissões da cópia substituída
+    elif modo in ("auto", "hardlink"):
+        os.link(original, temporario)
+        tipo = "hardlink"
+    else:
+        raise OSError(errno.EOPNOTSUPP, "o sistema de arquivos não suporta reflink", copia)
+    try:
+        st_agora = os.stat(copia)
+        if (st_agora.st_ino, st_agora.st_size, st_agora.st_mtime_ns) != (st_copia.st_ino, st_copia.st_size, st_copia.st_mtime_ns):
+            raise ArquivosDiferentes(f"{copia} mudou durante a comparação")
+        os.replace(temporario, copia)
+    except BaseException:
+        with contextlib.suppress(OSError): os.remove(temporario)
+        raise
+    # Só libera espaço se esse era o último nome dos blocos da cópia
+    return tipo, st_copia.st_size if st_copia.st_nlink == 1 else 0
+
+# --- FOTOS PARECIDAS (HASH PERCEPTUAL) ---
+
+def calcular_dhash(caminho):
+    """Hash perceptual (dHash, 64 bits) a partir de uma decodificação reduzida da imagem."""
+    chave = "dhash64"
+    try:
+        st = os.stat(caminho)
+        h = obter_cache_hash().obter(st, chave)
+        if h: return int(h, 16)
+    except (OSError, sqlite3.Error):
+        return None
+    valor = dhash_imagem(caminho)
+    if valor is None: return None
+    try: obter_cache_hash().gravar(st, chave, f"{valor:016x}")
+    except sqlite3.Error: pass
+    return valor
+
+def dhash_imagem(origem):
+    """dHash de um caminho ou arquivo aberto, sem consultar o cache (None se não decodificar)."""
+    try:
+        with Image.open(origem) as img:
+            return _dhash_decodificando(img)
+    except Exception:
+        return None
+
+def _dhash_decodificando(img):
+    """dHash de uma imagem aberta; a decodificação (reduzida) acontece aqui e seus erros sobem."""
+    img.draft("L", (64, 64))  # JPEG: decodifica já em escala 1/8, bem mais rápido
+    px = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    valor = 0
+    for linha in range(8):
+        for col in range(8):
+            valor = (valor << 1) | (px[linha * 9 + col] > px[linha * 9 + col + 1])
+    return valor
+
+def distancia_hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class ArvoreBK:
+    """BK-tree para busca por distância de Hamming sem comparar todos os pares."""
+
+    def __init__(self):
+        self.raiz = None  # Nó: [valor, itens, {distancia: filho}]
+
+    def inserir(self, valor, item):
+        if self.raiz is None:
+            self.raiz = [valor, [item], {}]
+            return
+        no = self.raiz
+        while True:
+            d = distancia_hamming(valor, no[0])
+            if d == 0:
+                no[1].append(item)
+                return
+            filho = no[2].get(d)
+            if filho is None:
+                no[2][d] = [valor, [item], {}]
+                return
+            no = filho
+
+    def buscar(self, valor, limite):
+        """Itens cujo hash está a no máximo `limite` bits de `valor`."""
+        encontrados = []
+        pilha = [self.raiz] if self.raiz else []
+        while pilha:
+            no = pilha.pop()
+            d = distancia_hamming(valor, no[0])
+            if d <= limite:
+                encontrados.extend(no[1])
+            # Desigualdade triangular: só filhos em [d - limite, d + limite] podem ter resultados
+            for dist, filho in no[2].items():
+                if d - limite <= dist <= d + limite:
+                    pilha.append(filho)
+        return encontrados
+
+def encontrar_fotos_parecidas(fotos, progresso=None, limite=DISTANCIA_PARECIDAS, motor=None):
+    """Agrupa fotos visualmente iguais (recompressões, redimensionamentos...).
+
+    `fotos` é uma lista de (caminho, tamanho, inode). Cada grupo vem ordenado do
+    maior arquivo para o menor, de modo que o primeiro é o de melhor qualidade.
+    """
+    motor = motor or MotorHash()
+    metricas = motor.metricas
+    arvore = ArvoreBK()
+    hashes = {}
+    with metricas.etapa("assinatura visual"):
+        try:
+            for item, h in motor.mapear(lambda it: (calcular_dhash(it[0]), 0), fotos, progresso, "Calculando assinatura visual..."):
+                if h is None:
+                    metricas.erro("DecodificacaoFalhou", item[0])
+                    continue
+                hashes[item[0]] = h
+                arvore.inserir(h, item[0])
+        finally:
+            obter_cache_hash().salvar()  # Assinaturas já calculadas valem mesmo se a tarefa for cancelada
+
+    # União dos vizinhos encontrados na árvore (union-find)
+    pai = {c: c for c in hashes}
+    def raiz(c):
+        while pai[c] != c:
+            pai[c] = pai[pai[c]]
+            c = pai[c]
+        return c
+
+    total = len(hashes)
+    with metricas.etapa("agrupamento"):
+        for i, (caminho, h) in enumerate(hashes.items(), 1):
+            if i % 200 == 0:
+                motor.tarefa.checar()
+                if progresso: progresso(i, total, "Agrupando fotos parecidas...")
+            for vizinho in arvore.buscar(h, limite):
+                a, b = raiz(caminho), raiz(vizinho)
+                if a != b: pai[b] = a
+        metricas.contar(total)
+
+    grupos = {}
+    for caminho in hashes:
+        grupos.setdefault(raiz(caminho), []).append(caminho)
+    tamanhos = {c: t for c, t, _ in fotos}
+    return [sorted(g, key=lambda c: -tamanhos.get(c, 0)) for g in grupos.values() if len(g) > 1]
+
+# --- INTEGRIDADE DE VÍDEOS (SÓ A ESTRUTURA DO CONTÊINER) ---
+
+EXTENSOES_MATROSKA = {'.mkv', '.webm'}
+EXTENSOES_VIDEO_VERIFICAVEIS = EXTENSOES_MP4 | EXTENSOES_MATROSKA
+EXTENSOES_VERIFICAVEIS = EXTENSOES_FOTO | EXTENSOES_VIDEO_VERIFICAVEIS
+
+# IDs dos elementos EBML de nível superior usados na verificação de MKV/WebM
+EBML_CABECALHO, EBML_SEGMENT = 0x1A45DFA3, 0x18538067
+EBML_SEEKHEAD, EBML_INFO, EBML_TRACKS, EBML_CLUSTER, EBML_CUES = 0x114D9B74, 0x1549A966, 0x1654AE6B, 0x1F43B675, 0x1C53BB6B
+NOMES_EBML = {EBML_CABECALHO: "EBML", EBML_SEGMENT: "Segment", EBML_SEEKHEAD: "SeekHead", EBML_INFO: "Info",
+              EBML_TRACKS: "Tracks", EBML_CLUSTER: "Cluster", EBML_CUES: "Cues"}
+
+def _filho(f, inicio, limite, tipo):
+    """(início, fim) do primeiro átomo `tipo` entre inicio e limite, ou None."""
+    return next(((ini, fim) for t, ini, fim in _atomos(f, inicio, limite) if t == tipo), None)
+
+def _ultimo_chunk_mp4(f, inicio_trak, fim_trak):
+    """Offset do último bloco de dados de uma trilha (tabela stco/co64), ou None se a trilha não tiver."""
+    intervalo = (inicio_trak, fim_trak)
+    for tipo in (b"mdia", b"minf", b"stbl"):
+        intervalo = _filho(f, *intervalo, tipo)
+        if intervalo is None: return None
+    for tipo, ini, fim in _atomos(f, *intervalo):
+        if tipo not in (b"stco", b"co64"): continue
+        largura = 4 if tipo == b"stco" else 8
+        f.seek(ini + 4)
+        n = struct.unpack(">I", f.read(4))[0]
+        if n == 0: return None  # MP4 fragmentado: os dados estão nos moof
+        if ini + 8 + n * largura > fim: raise ValueError(f"tabela {tipo.decode()} maior que o próprio átomo")
+        f.seek(ini + 8 + (n - 1) * largura)
+        return int.from_bytes(f.read(largura), "big")
+    return None
+
+def _verificar_mp4(f, tamanho):
+    topo = {}
+    for tipo, ini, fim in _atomos(f, 0, tamanho):
+        topo.setdefault(tipo, (ini, fim))
+    if b"moov" not in topo:
+        raise ValueError("sem átomo 'moov' (índice do vídeo): gravação ou cópia interrompida")
+    if b"mdat" not in topo and b"moof" not in topo:
+        raise ValueError("sem átomo 'mdat' (dados do vídeo)")
+    trilhas = [(ini, fim) for tipo, ini, fim in _atomos(f, *topo[b"moov"]) if tipo == b"trak"]
+    if _filho(f, *topo[b"moov"], b"mvhd") is None or not trilhas:
+        raise ValueError("átomo 'moov' sem 'mvhd'/'trak'")
+    for trilha in trilhas:
+        ultimo = _ultimo_chunk_mp4(f, *trilha)
+        if ultimo is not None and ultimo >= tamanho:
+            raise ValueError(f"dados indexados no offset {ultimo}, além do fim do arquivo ({tamanho} bytes): truncado")
+
+def _vint_ebml(f, identificador=False):
+    """Inteiro de tamanho variável do EBML; tamanho com todos os bits em 1 ("desconhecido") vira None."""
+    primeiro = f.read(1)
+    if not primeiro: raise ValueError("fim inesperado do arquivo")
+    comprimento = 9 - primeiro[0].bit_length()
+    if comprimento > 8: raise ValueError("número EBML inválido")
+    resto = f.read(comprimento - 1)
+    if len(resto) < comprimento - 1: raise ValueError("fim inesperado do arquivo")
+    valor = int.from_bytes(primeiro + resto, "big")
+    if identificador: return valor, comprimento
+    bits = (1 << (7 * comprimento)) - 1
+    return (None if valor & bits == bits else valor & bits), comprimento
+
+def _elemento_ebml(f, pos):
+    """(id, início dos dados, tamanho ou None) do elemento em `pos`."""
+    f.seek(pos)
+    id_elemento, a = _vint_ebml(f, True)
+    tamanho, b = _vint_ebml(f)
+    return id_elemento, pos + a + b, tamanho
+
+def _ler_seekhead(dados):
+    """{id do elemento: posição relativa ao Segment} a partir do conteúdo de um SeekHead."""
+    f = io.BytesIO(dados)
+    posicoes = {}
+    while f.tell() < len(dados):
+        id_seek, ini, tam = _elemento_ebml(f, f.tell())
+        if tam is None: break
+        fim = ini + tam
+        if id_seek == 0x4DBB:  # Seek: SeekID + SeekPosition
+            alvo = posicao = None
+            while f.tell() < fim:
+                id_filho, ini_filho, tam_filho = _elemento_ebml(f, f.tell())
+                valor = f.read(tam_filho or 0)
+                if id_filho == 0x53AB: alvo = int.from_bytes(valor, "big")
+                elif id_filho == 0x53AC: posicao = int.from_bytes(valor, "big")
+            if alvo is not None and posicao is not None: posicoes.setdefault(alvo, posicao)
+        f.seek(fim)
+    return posicoes
+
+def _verificar_matroska(f, tamanho):
+    """Levanta ValueError se a estrutura estiver quebrada; devolve um aviso (ou None) para o que só falta."""
+    id_elemento, ini, tam = _elemento_ebml(f, 0)
+    if id_elemento != EBML_CABECALHO or tam is None:
+        raise ValueError("cabeçalho EBML ausente: não parece um MKV/WebM")
+    id_elemento, inicio_seg, tam_seg = _elemento_ebml(f, ini + tam)
+    if id_elemento != EBML_SEGMENT:
+        raise ValueError("elemento Segment ausente após o cabeçalho")
+    if tam_seg is not None and inicio_seg + tam_seg > tamanho:
+        raise ValueError(f"Segment declara {tam_seg} bytes, mas o arquivo termina "
+                         f"{inicio_seg + tam_seg - tamanho} bytes antes: truncado")
+    fim_seg = tamanho if tam_seg is None else inicio_seg + tam_seg
+    vistos, indice_seek = set(), {}
+    pos = inicio_seg
+    while pos < fim_seg:
+        id_elemento, ini, tam = _elemento_ebml(f, pos)
+        nome = NOMES_EBML.get(id_elemento, f"0x{id_elemento:X}")
+        if tam is None:
+            # Cluster sem tamanho (gravação ao vivo): dali em diante não há como pular elementos
+            if id_elemento != EBML_CLUSTER: raise ValueError(f"elemento {nome} sem tamanho declarado")
+            vistos.add(id_elemento)
+            break
+        if ini + tam > fim_seg:
+            raise ValueError(f"elemento {nome} declara {tam} bytes além do fim do arquivo: truncado")
+        vistos.add(id_elemento)
+        if id_elemento == EBML_SEEKHEAD and not indice_seek:
+            f.seek(ini)
+            indice_seek = _ler_seekhead(f.read(min(tam, 64 * 1024)))
+        if id_elemento == EBML_CLUSTER and EBML_CUES in indice_seek:
+            break  # Os Clusters não são percorridos um a um: o SeekHead diz onde estão os elementos do índice
+        pos = ini + tam
+    for id_esperado in (EBML_INFO, EBML_TRACKS, EBML_CUES):
+        if id_esperado in vistos or id_esperado not in indice_seek: continue
+        id_elemento, ini, tam = _elemento_ebml(f, inicio_seg + indice_seek[id_esperado])
+        if id_elemento != id_esperado:
+            raise ValueError(f"SeekHead aponta {NOMES_EBML[id_esperado]} para uma posição inválida")
+        if tam is None or ini + tam > fim_seg:
+            raise ValueError(f"elemento {NOMES_EBML[id_esperado]} além do fim do arquivo: truncado")
+        vistos.add(id_esperado)
+    if not {EBML_INFO, EBML_TRACKS} <= vistos:
+        raise ValueError("sem Info/Tracks (cabeçalho do vídeo)")
+    if EBML_CUES not in vistos:
+        # MediaRecorder e gravações ao vivo não gravam Cues: o vídeo toca, só não tem busca rápida
+        return "sem índice (Cues): o vídeo toca, mas a busca pode ser lenta"
+    return None
+
+def verificar_video(args):
+    """Confere a estrutura do contêiner (MP4/MOV ou MKV/WebM) sem decodificar. Retorna (caminho, 'ok' ou erro).
+
+    Os tamanhos declarados de átomos/elementos têm de caber no arquivo e o
+    moov tem de existir: é o que uma cópia ou gravação interrompida quebra. Um
+    MKV/WebM sem Cues é válido e volta como (caminho, 'ok', aviso). Contêineres
+    que não são lidos aqui (AVI, WMV...) passam como 'ok'. Só alguns seek+read
+    por arquivo; o nível não muda nada.
+    """
+    caminho, _, *dados = args
+    ext = os.path.splitext(caminho)[1].lower()
+    if ext not in EXTENSOES_VIDEO_VERIFICAVEIS: return caminho, "ok"
+    origem = io.BytesIO(dados[0]) if dados and dados[0] is not None else caminho
+    try:
+        with _abrir_origem(origem) as f:
+            f.seek(0, os.SEEK_END)
+            tamanho = f.tell()
+            if tamanho == 0: raise ValueError("arquivo vazio")
+            aviso = _verificar_mp4(f, tamanho) if ext in EXTENSOES_MP4 else _verificar_matroska(f, tamanho)
+        return (caminho, "ok", aviso) if aviso else (caminho, "ok")
+    except (OSError, ValueError, struct.error, IndexError) as e:
+        return caminho, str(e) or type(e).__name__
+
+# --- INTEGRIDADE (POOL DE PROCESSOS) ---
+
+NIVEIS_INTEGRIDADE = ("rapido", "profundo")
+
+def verificar_imagem(args):
+    """Verifica uma imagem em um processo separado. Retorna (caminho, 'ok' ou mensagem de erro).
+
+    rapido:   estrutura do arquivo (Image.verify), sem decodificar os pixels.
+    profundo: decodifica a imagem inteira (em escala reduzida quando o formato
+              permite), o que pega JPEGs truncados com cabeçalho intacto.
+    """
+    caminho, nivel, *dados = args  # Terceiro campo opcional: o conteúdo já lido (auditoria)
+    abrir = (lambda: io.BytesIO(dados[0])) if dados and dados[0] is not None else (lambda: caminho)
+    try:
+        with Image.open(abrir()) as img:
+            img.verify()
+        if nivel == "profundo":
+            with Image.open(abrir()) as img:
+                img.draft("RGB", (img.width // 8 or 1, img.height // 8 or 1))
+                img.load()
+        return caminho, "ok"
+    except Exception as e:
+        return caminho, str(e) or type(e).__name__
+
+def verificar_midia(args):
+    """verificar_imagem ou verificar_video conforme a extensão (mesmos argumentos e retorno)."""
+    if os.path.splitext(args[0])[1].lower() in EXTENSOES_VIDEO: return verificar_video(args)
+    return verificar_imagem(args)
+
+def verificar_integridade(arquivos, nivel="rapido", progresso=None, workers=None, metricas=None, tarefa=None):
+    """Verifica imagens (e a estrutura dos vídeos) em paralelo: decodificar é CPU e o GIL serializaria as threads.
+
+    `arquivos` é uma lista de caminhos. Resultados ficam no cache por
+    (dispositivo, inode, tamanho, mtime): uma imagem aprovada não é testada de novo,
+    e uma aprovada no modo profundo também vale para o rápido.
+    Retorna a lista de (caminho, resultado) de todos os arquivos.
+    """
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    cache = obter_cache_hash()
+    chaves = ["integridade:profundo"] if nivel == "profundo" else ["integridade:profundo", "integridade:rapido"]
+    resultados = []
+    pendentes = {}
+    for caminho in arquivos:
+        try:
+            st = os.stat(caminho)
+        except OSError as e:
+            metricas.erro(e, caminho)
+            resultados.append((caminho, str(e)))
+            continue
+        try:
+            if any(cache.obter(st, ch) == "ok" for ch in chaves):
+                resultados.append((caminho, "ok"))
+                continue
+        except sqlite3.Error:
+            pass
+        pendentes[caminho] = st
+
+    total = len(pendentes)
+    if total:
+        workers = workers or os.cpu_count()
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                argumentos = [(c, nivel) for c in pendentes]
+                blocos = _mapear_em_blocos(pool, verificar_midia, argumentos, tarefa, workers * 64, chunksize=16)
+                for i, (caminho, resultado, *aviso) in enumerate(blocos, 1):
+                    if aviso: metricas.erro("AvisoVideo", caminho)  # Vale como ok; fica só no relatório
+                    if progresso: progresso(i, total, f"Testando: {os.path.basename(caminho)}")
+                    metricas.contar(1, pendentes[caminho].st_size)
+                    resultados.append((caminho, resultado))
+                    if resultado == "ok":
+                        try: cache.gravar(pendentes[caminho], f"integridade:{nivel}", "ok")
+                        except sqlite3.Error: pass
+        finally:
+            cache.salvar()  # Imagens já aprovadas não são testadas de novo, mesmo após cancelar
+    return resultados
+
+def formatar_bytes(n):
+    """Formata um número de bytes em unidade legível (KB, MB, GB...)."""
+    for unidade in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024: return f"{n:.1f} {unidade}" if unidade != "B" else f"{n} B"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+def gerar_miniatura_galeria(args):
+    """Cria (ou reaproveita) a miniatura de uma foto da galeria. Roda em um processo separado.
+
+    Retorna (origem, miniatura_ou_None, largura, altura, data) com as dimensões
+    da foto original e a data de modificação (AAAA-MM-DD).
+    """
+    origem, destino, tamanho = args
+    try:
+        mtime = os.path.getmtime(origem)
+        data = datetime.date.fromtimestamp(mtime).isoformat()
+        with Image.open(origem) as img:
+            largura, altura = img.size  # Só o cabeçalho é lido aqui
+            if os.path.exists(destino) and os.path.getmtime(destino) >= mtime:
+                return origem, destino, largura, altura, data
+            img.draft("RGB", (tamanho * 2, tamanho * 2))  # JPEG: decodifica já reduzido
+            img.thumbnail((tamanho, tamanho))
+            img = img.convert("RGB")
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        formato = "WEBP" if destino.endswith(".webp") else "JPEG"
+        img.save(destino, formato, quality=80)
+        return origem, destino, largura, altura, data
+    except Exception:
+        return origem, None, 0, 0, ""
+
+def _agrupar_albuns(diretorio_base, fotos):
+    """Ordena as fotos por pasta e gera (nome_do_album, [caminhos]) um álbum por vez."""
+    relativos = sorted((os.path.relpath(c, diretorio_base), c) for c in fotos)
+    album_atual, itens = None, []
+    for rel, caminho in relativos:
+        nome_pasta = os.path.dirname(rel).replace('\\', ' > ').replace('/', ' > ') or "Raiz"
+        if nome_pasta != album_atual and itens:
+            yield album_atual, itens
+            itens = []
+        album_atual = nome_pasta
+        itens.append(caminho)
+    if itens:
+        yield album_atual, itens
+
+def _caminho_miniatura_galeria(pasta_miniaturas, diretorio_base, caminho, extensao):
+    rel = os.path.relpath(caminho, diretorio_base).replace('\\', '/')
+    nome = hashlib.md5(rel.encode("utf-8")).hexdigest()
+    return os.path.join(pasta_miniaturas, nome[:2], nome + extensao)
+
+def _relativo_web(caminho, diretorio_base):
+    return os.path.relpath(caminho, diretorio_base).replace('\\', '/')
+
+# Visualizador offline: lista de álbuns + grade com rolagem virtual (só as linhas
+# visíveis existem no DOM). Os dados vêm de arquivos .js carregados sob demanda
+# via <script>, que funcionam em file:// (fetch de JSON local é bloqueado).
+HTML_VISUALIZADOR_GALERIA = """<!DOCTYPE html>
+<html lang="pt-br">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Galeria Multimídia</title>
+    <style>
+        body { background: #1a1a1a; color: #eee; font-family: sans-serif; margin: 0; display: flex; height: 100vh; overflow: hidden; }
+        #lateral { width: 280px; background: #121212; overflow-y: auto; border-right: 1px solid #333; }
+        #lateral h1 { font-weight: 300; font-size: 20px; margin: 0; padding: 20px 15px 5px; }
+        #contagem { color: #888; font-size: 12px; padding: 0 15px 15px; }
+        .album { padding: 8px 15px; cursor: pointer; color: #aaa; font-size: 13px; white-space: nowrap; overflow: hidden; text-overflow: ellipsis; }
+        .album:hover, .album.ativo { background: #1e1e1e; color: #fff; }
+        .album span { color: #555; float: right; margin-left: 8px; }
+        #principal { flex: 1; display: flex; flex-direction: column; min-width: 0; }
+        #titulo { color: #007acc; padding: 15px 20px; border-bottom: 1px solid #333; font-size: 18px; }
+        #rolagem { flex: 1; overflow-y: auto; }
+        #espaco { position: relative; }
+        .card { position: absolute; overflow: hidden; border-radius: 4px; background: #222; cursor: pointer; }
+        .card:hover { box-shadow: 0 5px 15px rgba(0,0,0,0.5); }
+        .card img { width: 100%; height: 100%; object-fit: cover; display: block; }
+    </style>
+</head>
+<body>
+    <div id="lateral"><h1>📂 Galeria Multimídia</h1><div id="contagem"></div><div id="albuns"></div></div>
+    <div id="principal"><div id="titulo"></div><div id="rolagem"><div id="espaco"></div></div></div>
+    <script src="__BASE__manifesto.js"></script>
+    <script>
+    (function () {
+        var M = window.GALERIA_MANIFESTO, BASE = "__BASE__";
+        var CELULA = 160, GAP = 10, PASSO = CELULA + GAP;
+        var blocos = {}, pedidos = {}, album = null, agendado = false;
+        var rolagem = document.getElementById("rolagem"), espaco = document.getElementById("espaco");
+        var lista = document.getElementById("albuns");
+
+        function url(rel) { return rel.split("/").map(encodeURIComponent).join("/"); }
+
+        window.galeriaBloco = function (id, itens) { blocos[id] = itens; delete pedidos[id]; agendar(); };
+
+        function carregarBloco(id) {
+            if (blocos[id] || pedidos[id]) return;
+            pedidos[id] = true;
+            var s = document.createElement("script");
+            s.src = BASE + "dados/" + id + ".js";
+            document.body.appendChild(s);
+        }
+
+        function colunas() { return Math.max(1, Math.floor((rolagem.clientWidth - GAP) / PASSO)); }
+
+        function desenhar() {
+            agendado = false;
+            if (!album) return;
+            var cols = colunas(), linhas = Math.ceil(album.total / cols);
+            espaco.style.height = (linhas * PASSO + GAP) + "px";
+            var primeira = Math.max(0, Math.floor(rolagem.scrollTop / PASSO) - 2);
+            var ultima = Math.min(linhas, Math.ceil((rolagem.scrollTop + rolagem.clientHeight) / PASSO) + 2);
+            var frag = document.createDocumentFragment();
+            for (var l = primeira; l < ultima; l++) {
+                for (var c = 0; c < cols; c++) {
+                    var i = l * cols + c;
+                    if (i >= album.total) break;
+                    var id = album.blocos[Math.floor(i / M.bloco)], itens = blocos[id];
+                    var card = document.createElement("div");
+                    card.className = "card";
+                    card.style.cssText = "left:" + (GAP + c * PASSO) + "px;top:" + (GAP + l * PASSO) + "px;width:" + CELULA + "px;height:" + CELULA + "px";
+                    if (!itens) { carregarBloco(id); frag.appendChild(card); continue; }
+                    var it = itens[i % M.bloco];  // [caminho, largura, altura, data, miniatura]
+                    card.dataset.caminho = it[0];
+                    card.title = it[0].split("/").pop() + " • " + it[1] + "x" + it[2] + " • " + it[3];
+                    var img = document.createElement("img");
+                    img.loading = "lazy";
+                    img.src = url(it[4] || it[0]);
+                    card.appendChild(img);
+                    frag.appendChild(card);
+                }
+            }
+            espaco.replaceChildren(frag);
+        }
+
+        function agendar() { if (!agendado) { agendado = true; requestAnimationFrame(desenhar); } }
+
+        function abrir(indice, elemento) {
+            album = M.albuns[indice];
+            var ativo = lista.querySelector(".ativo");
+            if (ativo) ativo.classList.remove("ativo");
+            elemento.classList.add("ativo");
+            document.getElementById("titulo").textContent = album.nome + " (" + album.total + ")";
+            rolagem.scrollTop = 0;
+            agendar();
+        }
+
+        document.getElementById("contagem").textContent = M.total + " fotos organizadas";
+        M.albuns.forEach(function (a, i) {
+            var el = document.createElement("div");
+            el.className = "album";
+            el.title = a.nome;
+            var n = document.createElement("span");
+            n.textContent = a.total;
+            el.appendChild(n);
+            el.appendChild(document.createTextNode(a.nome));
+            el.onclick = function () { abrir(i, el); };
+            lista.appendChild(el);
+        });
+        espaco.onclick = function (e) {
+            var card = e.target.closest(".card");
+            if (card && card.dataset.caminho) window.open(url(card.dataset.caminho), "_blank");
+        };
+        rolagem.onscroll = agendar;
+        window.onresize = agendar;
+        if (M.albuns.length) abrir(0, lista.firstChild);
+    })();
+    </script>
+</body>
+</html>
+"""
+
+def gerar_html_galeria(diretorio_base, fotos=None, progresso=None, workers=None, metricas=None, tarefa=None):
+    """Gera a galeria offline: um visualizador HTML leve + manifesto e blocos de dados.
+
+    `fotos` é a lista de caminhos vinda do índice; sem ela a pasta é percorrida.
+    As imagens exibidas são miniaturas (WebP, ou JPEG se o Pillow não tiver WebP)
+    criadas em paralelo e reaproveitadas enquanto a original não mudar. Cada álbum
+    vira blocos de ITENS_BLOCO_GALERIA fotos gravados à medida que ficam prontos, e o
+    manifesto guarda só o resumo dos álbuns, então abrir a página continua
+    instantâneo com centenas de milhares de fotos.
+    """
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    arquivo_saida = "Galeria_Arquivos.html"
+    pasta_galeria = os.path.join(diretorio_base, PASTA_DADOS, "galeria")
+    pasta_blocos = os.path.join(pasta_galeria, "dados")
+    extensao = ".webp" if features.check("webp") else ".jpg"
+    
+    if fotos is None:
+        # Galeria foca em fotos para visualização web simples (pastas de sistema/lixo são ignoradas)
+        fotos = [reg.caminho for reg in varrer_midias(diretorio_base, EXTENSOES_FOTO)]
+    
+    contador_imgs = len(fotos)
+    if contador_imgs == 0: return False
+
+    def gravar_bloco(id_bloco, itens):
+        with open(os.path.join(pasta_blocos, id_bloco + ".js"), "w", encoding="utf-8") as f:
+            f.write(f"galeriaBloco({json.dumps(id_bloco)}, {json.dumps(itens, ensure_ascii=False)});\n")
+
+    try:
+        # Blocos de uma geração anterior podem não existir mais
+        if os.path.isdir(pasta_blocos): shutil.rmtree(pasta_blocos)
+        os.makedirs(pasta_blocos)
+        
+        albuns = []
+        feitos = 0
+        workers = workers or os.cpu_count()
+        with metricas.etapa("miniaturas"), ProcessPoolExecutor(max_workers=workers) as pool:
+            for n_album, (album, caminhos) in enumerate(_agrupar_albuns(diretorio_base, fotos)):
+                argumentos = [(c, _caminho_miniatura_galeria(pasta_galeria, diretorio_base, c, extensao), TAMANHO_MINIATURA_GALERIA)
+                              for c in caminhos]
+                resumo = {"nome": album, "total": len(argumentos), "blocos": []}
+                itens = []
+                # Miniaturas prontas ficam no disco: uma galeria cancelada recomeça só do que faltou
+                blocos = _mapear_em_blocos(pool, gerar_miniatura_galeria, argumentos, tarefa, workers * 32, chunksize=8)
+                for origem, miniatura, largura, altura, data in blocos:
+                    feitos += 1
+                    metricas.contar()
+                    if miniatura is None: metricas.erro("MiniaturaFalhou", origem)
+                    if progresso and feitos % 20 == 0: progresso(feitos, contador_imgs, "Gerando miniaturas da galeria...")
+                    itens.append([_relativo_web(origem, diretorio_base), largura, altura, data,
+                                  _relativo_web(miniatura, diretorio_base) if miniatura else ""])
+                    if len(itens) == ITENS_BLOCO_GALERIA:
+                        resumo["blocos"].append(f"a{n_album:05d}_{len(resumo['blocos']):04d}")
+                        gravar_bloco(resumo["blocos"][-1], itens)
+                        itens = []
+                if itens:
+                    resumo["blocos"].append(f"a{n_album:05d}_{len(resumo['blocos']):04d}")
+                    gravar_bloco(resumo["blocos"][-1], itens)
+                albuns.append(resumo)
+        
+        manifesto = {"total": contador_imgs, "bloco": ITENS_BLOCO_GALERIA, "albuns": albuns}
+        with open(os.path.join(pasta_galeria, "manifesto.js"), "w", encoding="utf-8") as f:
+            f.write("window.GALERIA_MANIFESTO = " + json.dumps(manifesto, ensure_ascii=False) + ";\n")
+        with open(os.path.join(diretorio_base, arquivo_saida), "w", encoding="utf-8") as f:
+            f.write(HTML_VISUALIZADOR_GALERIA.replace("__BASE__", _relativo_web(pasta_galeria, diretorio_base) + "/"))
+        return True
+    except OSError as e:
+        metricas.erro(e, diretorio_base)
+        return False
+
+# --- VARREDURA (SCANDIR) ---
+
+class RegistroArquivo:
+    """Um arquivo encontrado na varredura, com os dados do stat já obtidos pelo scandir."""
+    __slots__ = ("caminho", "relativo", "nome", "ext", "tamanho", "mtime_ns", "inode")
+
+    def __init__(self, caminho, relativo, nome, ext, tamanho, mtime_ns, inode):
+        self.caminho = caminho
+        self.relativo = relativo
+        self.nome = nome
+        self.ext = ext
+        self.tamanho = tamanho
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+
+def varrer_midias(pasta_base, extensoes=EXTENSOES_TODAS, ignorar=PASTAS_IGNORADAS, metricas=None, tarefa=None,
+                  anteriores=None, pastas=None):
+    """Percorre a pasta com os.scandir (iterativo) gerando um RegistroArquivo por mídia.
+
+    Pastas em `ignorar` são podadas antes de serem abertas, e o stat vem do
+    próprio DirEntry (no Windows sem nenhuma chamada extra ao sistema). Por ser
+    um gerador, quem consome já pode trabalhar enquanto a varredura continua.
+
+    Modo incremental: `anteriores` é {pasta_relativa: (mtime_ns, subpastas)} da
+    varredura passada. Criar, apagar ou renomear algo dentro de uma pasta muda o
+    mtime dela, então uma pasta com o mesmo mtime não é listada de novo (nem gera
+    registros): só as subpastas conhecidas são visitadas. Se `pastas` for um dict,
+    recebe {pasta_relativa: (mtime_ns_ou_None, subpastas, listada)} de tudo o que foi visto.
+    """
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    anteriores = anteriores or {}
+    rastrear = pastas is not None
+    # Um mtime muito recente não prova nada: uma alteração no mesmo "tique" do
+    # sistema de arquivos (2 s no FAT) não o mudaria. Essas pastas são listadas da próxima vez.
+    limite_ns = time.time_ns() - 2_000_000_000
+    pilha = [(pasta_base, "")]
+    while pilha:
+        tarefa.checar()
+        pasta, rel_pasta = pilha.pop()
+        if rastrear or anteriores:
+            try:
+                mtime_ns = os.stat(pasta).st_mtime_ns
+            except OSError as e:
+                metricas.erro(e, pasta)
+                continue
+            anterior = anteriores.get(rel_pasta)
+            if anterior and anterior[0] == mtime_ns:
+                if rastrear: pastas[rel_pasta] = (mtime_ns, anterior[1], False)
+                pilha.extend((os.path.join(pasta, nome), os.path.join(rel_pasta, nome) if rel_pasta else nome)
+                             for nome in anterior[1])
+                continue
+        subpastas = []
+        try:
+            it = os.scandir(pasta)
+        except OSError as e:
+            metricas.erro(e, pasta)
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in ignorar:
+                            subpastas.append(entry.name)
+                            pilha.append((entry.path, os.path.join(rel_pasta, entry.name) if rel_pasta else entry.name))
+                        continue
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    if ext not in extensoes: continue
+                    st = entry.stat()
+                except OSError as e:
+                    metricas.erro(e, entry.path)
+                    continue
+                metricas.contar()
+                yield RegistroArquivo(entry.path, os.path.join(rel_pasta, entry.name) if rel_pasta else entry.name,
+                                      entry.name, ext, st.st_size, st.st_mtime_ns, st.st_ino)
+        if rastrear:
+            pastas[rel_pasta] = (mtime_ns if mtime_ns < limite_ns else None, subpastas, True)
+
+# --- ÍNDICE PERSISTENTE (SQLITE) ---
+
+def caminho_ignorado(caminho_relativo):
+    """Verdadeiro se o caminho passa por alguma pasta de sistema/lixo."""
+    partes = caminho_relativo.replace('\\', '/').split('/')
+    return any(p in PASTAS_IGNORADAS for p in partes)
+
+TIPOS_MIDIA = ("foto", "video")
+CAMPOS_DERIVADOS = ("ano", "hash", "integridade")
+
+class TabelaArquivos:
+    """Linhas do índice em colunas compactas, compartilhadas pelas operações.
+
+    Cada pasta é guardada uma vez (tabela de pastas internadas) e os arquivos
+    apontam para ela por número; tamanho, mtime e inode ficam em arrays, sem um
+    objeto Python por campo. O caminho completo só é montado, com caminho(i),
+    para os arquivos que uma etapa realmente usa.
+    """
+
+    __slots__ = ("pasta_base", "pastas", "_id_pasta", "pasta", "nome", "tamanho", "mtime_ns", "inode", "tipo", "extras")
+
+    def __init__(self, pasta_base, campos=()):
+        self.pasta_base = pasta_base
+        self.pastas = []       # id -> pasta relativa
+        self._id_pasta = {}    # pasta relativa -> id
+        self.pasta = array("I")
+        self.nome = []
+        self.tamanho = array("q")
+        self.mtime_ns = array("q")
+        self.inode = array("Q")
+        self.tipo = bytearray()  # índice em TIPOS_MIDIA
+        self.extras = {campo: [] for campo in campos}  # Campos derivados, só os pedidos
+
+    def __len__(self):
+        return len(self.nome)
+
+    def adicionar(self, relativo, tamanho, mtime_ns, inode, tipo, *extras):
+        pasta, nome = os.path.split(relativo)
+        id_pasta = self._id_pasta.get(pasta)
+        if id_pasta is None:
+            id_pasta = self._id_pasta[pasta] = len(self.pastas)
+            self.pastas.append(pasta)
+        self.pasta.append(id_pasta)
+        self.nome.append(nome)
+        self.tamanho.append(tamanho)
+        self.mtime_ns.append(mtime_ns)
+        self.inode.append(inode or 0)
+        self.tipo.append(TIPOS_MIDIA.index(tipo))
+        for coluna, valor in zip(self.extras.values(), extras):
+            coluna.append(valor)
+
+    def id_pasta(self, pasta):
+        return self._id_pasta.get(pasta)
+
+    def relativo(self, i):
+        return os.path.join(self.pastas[self.pasta[i]], self.nome[i])
+
+    def caminho(self, i):
+        return os.path.join(self.pasta_base, self.pastas[self.pasta[i]], self.nome[i])
+
+    def caminhos(self):
+        return [self.caminho(i) for i in range(len(self))]
+
+    def atual(self, i):
+        """O arquivo ainda tem o tamanho e o mtime do índice (hash e veredito guardados continuam valendo)."""
+        try:
+            st = os.stat(self.caminho(i))
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) == (self.tamanho[i], self.mtime_ns[i])
+
+    def por_pasta(self):
+        """{id_pasta: array de linhas}: encontra os arquivos de uma pasta sem um dict por caminho."""
+        grupos = {}
+        for i, id_pasta in enumerate(self.pasta):
+            linhas = grupos.get(id_pasta)
+            if linhas is None: linhas = grupos[id_pasta] = array("I")
+            linhas.append(i)
+        return grupos
+
+class IndiceMidia:
+    """Índice em disco das mídias de uma pasta, reaproveitado entre operações e sessões.
+
+    Cada linha guarda caminho (relativo à pasta base), tamanho, mtime_ns, inode,
+    tipo (foto/video), ano do EXIF, hash e resultado da verificação de integridade.
+    Linhas cujo tamanho e mtime não mudaram são mantidas entre execuções.
+    A tabela `pastas` guarda o mtime e as subpastas de cada pasta, para que a
+    próxima varredura pule as que não mudaram (ver varrer_midias).
+    """
+
+    ARQUIVO_DB = "indice.db"
+
+    def __init__(self, pasta_base):
+        self.pasta_base = os.path.abspath(pasta_base)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(self._local_db(), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        try: self.conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError: pass  # Alguns sistemas de arquivos (FAT/rede) não suportam WAL
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS arquivos (
+                caminho     TEXT PRIMARY KEY,
+                tamanho     INTEGER NOT NULL,
+                mtime_ns    INTEGER NOT NULL,
+                inode       INTEGER,
+                tipo        TEXT NOT NULL,
+                ano         TEXT,
+                hash        TEXT,
+                integridade TEXT
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_tamanho ON arquivos(tamanho)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pastas (
+                caminho   TEXT PRIMARY KEY,
+                mtime_ns  INTEGER,
+                subpastas TEXT NOT NULL
+            )""")
+        self.conn.commit()
+
+    def _local_db(self):
+        # Preferência: dentro do dispositivo (acompanha o pendrive entre computadores).
+        # Se for somente leitura, usa a pasta do usuário com um nome derivado do caminho.
+        pasta_dados = os.path.join(self.pasta_base, PASTA_DADOS)
+        try:
+            os.makedirs(pasta_dados, exist_ok=True)
+            teste = os.path.join(pasta_dados, ".teste_escrita")
+            with open(teste, "w"): pass
+            os.remove(teste)
+            self.pasta_dados, self.prefixo_dados = pasta_dados, ""
+        except OSError:
+            self.pasta_dados = os.path.join(os.path.expanduser("~"), PASTA_DADOS)
+            os.makedirs(self.pasta_dados, exist_ok=True)
+            self.prefixo_dados = "indice_" + hashlib.md5(self.pasta_base.encode("utf-8")).hexdigest()[:16] + "_"
+        return self.caminho_dados(self.ARQUIVO_DB)
+
+    def caminho_dados(self, nome):
+        """Caminho de um arquivo/pasta auxiliar (caches, relatórios) que pertence a este índice."""
+        return os.path.join(self.pasta_dados, self.prefixo_dados + nome)
+
+    def relativo(self, caminho):
+        return os.path.relpath(caminho, self.pasta_base)
+
+    def fechar(self):
+        with self._lock:
+            self.conn.close()
+
+    # --- Construção ---
+    def sincronizar(self, progresso=None, metricas=None, tarefa=None, completo=False):
+        """Percorre a pasta uma vez e atualiza o índice. Retorna o total de mídias.
+
+        Por padrão é incremental: pastas com o mesmo mtime da última varredura
+        não são listadas, mas cada arquivo delas ainda recebe um stat (editar no
+        lugar não muda o mtime da pasta, e no FAT o mtime da pasta nem sempre muda).
+        `completo=True` lista tudo de novo. Se a tarefa for cancelada, o que já foi lido fica gravado, mas nada é
+        removido (a varredura incompleta não prova que um arquivo sumiu).
+        """
+        metricas = metricas or _MetricasNulas()
+        existentes = self.tabela()
+        vistos = bytearray(len(existentes))
+        linhas_pasta = existentes.por_pasta()
+        with self._lock:
+            anteriores = {} if completo else {
+                r[0]: (r[1], json.loads(r[2])) for r in
+                self.conn.execute("SELECT caminho, mtime_ns, subpastas FROM pastas WHERE mtime_ns IS NOT NULL")}
+
+        pastas = {}
+        novos = []
+        total = 0
+        pasta_atual, nomes_pasta = None, {}
+
+        def gravar_novos():
+            # Arquivos novos ou alterados perdem os dados derivados (ano/hash/integridade)
+            with self._lock:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO arquivos (caminho, tamanho, mtime_ns, inode, tipo) VALUES (?, ?, ?, ?, ?)",
+                    novos)
+            novos.clear()
+
+        with metricas.etapa("varredura"):
+            try:
+                for reg in varrer_midias(self.pasta_base, metricas=metricas, tarefa=tarefa,
+                                         anteriores=anteriores, pastas=pastas):
+                    total += 1
+                    # Os arquivos chegam pasta a pasta: só os nomes da pasta atual ficam em um dict
+                    rel_pasta = os.path.dirname(reg.relativo)
+                    if rel_pasta != pasta_atual:
+                        pasta_atual = rel_pasta
+                        nomes_pasta = {existentes.nome[i]: i for i in
+                                       linhas_pasta.get(existentes.id_pasta(rel_pasta), ())}
+                    i = nomes_pasta.get(reg.nome)
+                    if i is not None: vistos[i] = 1
+                    if i is None or (existentes.tamanho[i], existentes.mtime_ns[i]) != (reg.tamanho, reg.mtime_ns):
+                        tipo = "foto" if reg.ext in EXTENSOES_FOTO else "video"
+                        novos.append((reg.relativo, reg.tamanho, reg.mtime_ns, reg.inode, tipo))
+                        if len(novos) >= 1000: gravar_novos()
+                    if progresso and total % 100 == 0:
+                        progresso(total)
+            except TarefaCancelada:
+                gravar_novos()
+                with self._lock: self.conn.commit()
+                raise
+            gravar_novos()
+
+            # Pastas não listadas: o stat de cada arquivo conferido com o índice
+            puladas = {existentes.id_pasta(p) for p, (_, _, listada) in pastas.items() if not listada}
+            linhas_puladas = [i for i in range(len(existentes)) if existentes.pasta[i] in puladas]
+
+            def conferir(i):
+                try: return os.stat(existentes.caminho(i))
+                except OSError: return None
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                for i, st in zip(linhas_puladas, pool.map(conferir, linhas_puladas)):
+                    if st is None: continue  # Sumiu: não é marcado como visto e sai do índice abaixo
+                    vistos[i] = 1
+                    total += 1
+                    if (st.st_size, st.st_mtime_ns) != (existentes.tamanho[i], existentes.mtime_ns[i]):
+                        novos.append((existentes.relativo(i), st.st_size, st.st_mtime_ns, st.st_ino,
+                                      TIPOS_MIDIA[existentes.tipo[i]]))
+            gravar_novos()
+
+            with self._lock:
+                # O que não foi visto nesta varredura (nem conferido pelo stat) não existe mais
+                self.conn.executemany("DELETE FROM arquivos WHERE caminho = ?",
+                                      [(existentes.relativo(i),) for i in range(len(existentes)) if not vistos[i]])
+                self.conn.execute("DELETE FROM pastas")
+                self.conn.executemany("INSERT INTO pastas (caminho, mtime_ns, subpastas) VALUES (?, ?, ?)",
+                                      [(p, m, json.dumps(s)) for p, (m, s, _) in pastas.items()])
+                self.conn.commit()
+        total = self.total()
+        if progresso: progresso(total)
+        return total
+
+    # --- Consultas ---
+    def tabela(self, tipo=None, campos=()):
+        """TabelaArquivos com as linhas do índice (todas ou de um tipo) e os campos derivados pedidos."""
+        if any(c not in CAMPOS_DERIVADOS for c in campos):
+            raise ValueError(f"Campos não indexáveis: {campos}")
+        colunas = ", ".join(("caminho", "tamanho", "mtime_ns", "inode", "tipo") + tuple(campos))
+        filtro = " WHERE tipo = ?" if tipo else ""
+        tabela = TabelaArquivos(self.pasta_base, campos)
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.row_factory = None  # Tuplas simples: as linhas vão direto para as colunas
+            for linha in cursor.execute(f"SELECT {colunas} FROM arquivos{filtro} ORDER BY caminho", (tipo,) if tipo else ()):
+                tabela.adicionar(*linha)
+        return tabela
+
+    def caminhos(self, tipo=None):
+        return self.tabela(tipo).caminhos()
+
+    def total(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM arquivos").fetchone()[0]
+
+    # --- Atualizações ---
+    def definir(self, campo, valores):
+        """Grava um campo derivado em lote. `valores` é uma lista de (caminho_absoluto, valor)."""
+        if campo not in CAMPOS_DERIVADOS:
+            raise ValueError(f"Campo não indexável: {campo}")
+        with self._lock:
+            self.conn.executemany(f"UPDATE arquivos SET {campo} = ? WHERE caminho = ?",
+                                  [(v, self.relativo(c)) for c, v in valores])
+            self.conn.commit()
+
+    def mover(self, origem, destino):
+        """Acompanha um arquivo movido, preservando ano/hash/integridade já calculados."""
+        self.mover_lote([(origem, destino)])
+
+    def mover_lote(self, pares):
+        """Mesmo que mover() para uma lista de (origem, destino), com um único commit."""
+        with self._lock:
+            for origem, destino in pares:
+                rel_origem, rel_destino = self.relativo(origem), self.relativo(destino)
+                if rel_destino.startswith("..") or caminho_ignorado(rel_destino):
+                    self.conn.execute("DELETE FROM arquivos WHERE caminho = ?", (rel_origem,))
+                else:
+                    self.conn.execute("UPDATE OR REPLACE arquivos SET caminho = ? WHERE caminho = ?", (rel_destino, rel_origem))
+            self.conn.commit()
+
+    def atualizar_stat(self, pares):
+        """Novo stat de arquivos cujo conteúdo não mudou (ex: trocados por um link), mantendo ano/hash/integridade.
+
+        `pares` é uma lista de (caminho_absoluto, os.stat_result).
+        """
+        with self._lock:
+            self.conn.executemany("UPDATE arquivos SET tamanho = ?, mtime_ns = ?, inode = ? WHERE caminho = ?",
+                                  [(st.st_size, st.st_mtime_ns, st.st_ino, self.relativo(c)) for c, st in pares])
+            self.conn.commit()
+
+# --- MINIATURAS (CACHE + PRÉ-CARREGAMENTO) ---
+
+FALHA_MINIATURA = object()  # Marca imagens que não puderam ser decodificadas
+
+class CacheMiniaturas:
+    """Miniaturas prontas para as janelas de revisão.
+
+    Uma thread em segundo plano decodifica os próximos itens (JPEG em modo
+    draft, reduzido já na decodificação) e guarda o resultado em um LRU em
+    memória limitado por bytes, com cópia em disco para as próximas sessões.
+    A interface só pede imagens já preparadas e nunca decodifica na thread do Tk.
+    """
+
+    def __init__(self, pasta_disco, limite_memoria=MEMORIA_MINIATURAS):
+        self.pasta_disco = pasta_disco
+        self.limite_memoria = limite_memoria
+        self._memoria = OrderedDict()  # (caminho, tamanho) -> Image ou FALHA_MINIATURA
+        self._bytes = 0
+        self._fila = deque()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._trabalhar, daemon=True).start()
+
+    # --- Interface (thread do Tk) ---
+    def obter_pronta(self, caminho, tamanho):
+        """Miniatura já decodificada, FALHA_MINIATURA, ou None se ainda não estiver pronta."""
+        with self._cond:
+            chave = (caminho, tamanho)
+            img = self._memoria.get(chave)
+            if img is not None: self._memoria.move_to_end(chave)
+            return img
+
+    def prefetch(self, caminhos, tamanho):
+        """Substitui a fila de pré-carregamento (o primeiro da lista é o mais urgente)."""
+        with self._cond:
+            self._fila = deque((c, tamanho) for c in caminhos if (c, tamanho) not in self._memoria)
+            self._cond.notify()
+
+    def priorizar(self, caminho, tamanho):
+        """Coloca um item no início da fila, mantendo o restante do pré-carregamento."""
+        with self._cond:
+            chave = (caminho, tamanho)
+            if chave in self._memoria: return
+            try: self._fila.remove(chave)
+            except ValueError: pass
+            self._fila.appendleft(chave)
+            self._cond.notify()
+
+    # --- Thread de fundo ---
+    def _trabalhar(self):
+        while True:
+            with self._cond:
+                while not self._fila: self._cond.wait()
+                caminho, tamanho = self._fila.popleft()
+                if (caminho, tamanho) in self._memoria: continue
+            self._guardar((caminho, tamanho), self.carregar(caminho, tamanho))
+
+    def _guardar(self, chave, img):
+        custo = img.width * img.height * len(img.getbands()) if img is not FALHA_MINIATURA else 64
+        with self._cond:
+            self._memoria[chave] = img
+            self._bytes += custo
+            while self._bytes > self.limite_memoria and len(self._memoria) > 1:
+                _, antiga = self._memoria.popitem(last=False)
+                self._bytes -= antiga.width * antiga.height * len(antiga.getbands()) if antiga is not FALHA_MINIATURA else 64
+
+    def _arquivo_disco(self, caminho, st, tamanho):
+        chave = f"{os.path.abspath(caminho)}|{st.st_size}|{st.st_mtime_ns}|{tamanho[0]}x{tamanho[1]}"
+        nome = hashlib.md5(chave.encode("utf-8")).hexdigest()
+        return os.path.join(self.pasta_disco, nome[:2], nome + ".jpg")
+
+    def carregar(self, caminho, tamanho):
+        """Decodifica (ou lê do disco) a miniatura. Roda fora da thread do Tk."""
+        try:
+            st = os.stat(caminho)
+            arq = self._arquivo_disco(caminho, st, tamanho)
+            if os.path.exists(arq):
+                with Image.open(arq) as img:
+                    img.load()
+                    return img.copy()
+            with Image.open(caminho) as img:
+                img.draft("RGB", tamanho)  # JPEG decodifica direto em 1/2, 1/4 ou 1/8
+                img.thumbnail(tamanho)
+                img = img.convert("RGB")
+        except Exception:
+            return FALHA_MINIATURA
+        try:
+            os.makedirs(os.path.dirname(arq), exist_ok=True)
+            img.save(arq, "JPEG", quality=85)
+        except OSError:
+            pass  # Cache em disco é opcional (pendrive cheio ou somente leitura)
+        return img
+
+# --- ORGANIZAÇÃO: PLANO + EXECUÇÃO COM DIÁRIO ---
+
+def copiar_verificado(origem, destino, block_size=1024 * 1024):
+    """Copia em blocos calculando o hash da origem e confere o destino relendo-o.
+
+    Usado quando os.rename não é possível (dispositivos diferentes). Em caso de
+    divergência o destino é apagado e um OSError é levantado; a origem fica intacta.
+    """
+    hasher = novo_hasher()
+    with open(origem, "rb") as fo, open(destino, "xb") as fd:
+        buf = bytearray(block_size)
+        view = memoryview(buf)
+        n = fo.readinto(buf)
+        while n:
+            hasher.update(view[:n])
+            fd.write(view[:n])
+            n = fo.readinto(buf)
+        fd.flush()
+        os.fsync(fd.fileno())
+    shutil.copystat(origem, destino)
+    if calcular_hash_arquivo(destino, block_size, usar_cache=False) != hasher.hexdigest():
+        os.remove(destino)
+        raise OSError(errno.EIO, "Cópia divergente da origem", destino)
+    return hasher.hexdigest()
+
+def copiar_retomavel(origem, destino, block_size=BUFFER_IMPORTACAO, tarefa=None):
+    """Cópia verificada via destino.part, que sobrevive a uma interrupção. Retorna o hash da origem.
+
+    Um .part de uma tentativa anterior é conferido bloco a bloco com a origem e
+    só o que falta (ou diverge) é escrito de novo. O hash da origem é calculado
+    durante a própria cópia; depois do fsync o destino é relido (fora do cache
+    de páginas, quando o sistema permite) e só então renomeado para o nome final.
+    """
+    tarefa = tarefa or Tarefa()
+    parte = destino + ".part"
+    hasher = novo_hasher()
+    with open(origem, "rb") as fo, open(parte, "a+b") as fd:
+        fd.seek(0)
+        buf, anterior = bytearray(block_size), bytearray(block_size)
+        view = memoryview(buf)
+        # 1. Aproveita o que já foi escrito, enquanto for igual à origem
+        n = fo.readinto(buf)
+        while n and fd.readinto(anterior) == n and anterior[:n] == view[:n]:
+            hasher.update(view[:n])
+            tarefa.checar()
+            n = fo.readinto(buf)
+        fd.truncate(fo.tell() - n)
+        fd.seek(0, os.SEEK_END)
+        # 2. Copia o resto
+        while n:
+            hasher.update(view[:n])
+            fd.write(view[:n])
+            tarefa.checar()
+            n = fo.readinto(buf)
+        fd.flush()
+        os.fsync(fd.fileno())
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)  # A conferência lê o dispositivo, não a RAM
+    shutil.copystat(origem, parte)
+    h = hasher.hexdigest()
+    if calcular_hash_arquivo(parte, block_size, usar_cache=False) != h:
+        os.remove(parte)
+        raise OSError(errno.EIO, "Cópia divergente da origem", destino)
+    if os.path.exists(destino):
+        raise FileExistsError(errno.EEXIST, "Destino já existe", destino)
+    os.rename(parte, destino)
+    return h
+
+def mover_rapido(origem, destino):
+    """os.rename no mesmo sistema de arquivos; entre dispositivos, cópia verificada + remoção."""
+    try:
+        os.rename(origem, destino)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV: raise
+    st_origem = os.stat(origem)
+    copiar_verificado(origem, destino)
+    os.remove(origem)
+    try: obter_cache_hash().transferir(st_origem, os.stat(destino))
+    except (OSError, sqlite3.Error): pass
+
+def planejar_organizacao(pasta_base, arquivos):
+    """Calcula todos os movimentos sem tocar no disco (exceto para listar as pastas de destino).
+
+    `arquivos` é uma lista de (caminho, ano). Colisões de nome são resolvidas
+    contra um índice em memória com o conteúdo atual de cada pasta de destino
+    e os nomes já reservados pelo próprio plano. Retorna [(origem, destino)].
+    """
+    nomes_por_pasta = {}
+
+    def nomes_em(pasta):
+        if pasta not in nomes_por_pasta:
+            try: nomes_por_pasta[pasta] = {n.lower() for n in os.listdir(pasta)}
+            except OSError: nomes_por_pasta[pasta] = set()
+        return nomes_por_pasta[pasta]
+
+    plano = []
+    for caminho, ano in arquivos:
+        if not ano or ano == "Indeterminado": continue
+        ext = os.path.splitext(caminho)[1].lower()
+        subpasta_tipo = "Fotos" if ext in EXTENSOES_FOTO else "Videos" if ext in EXTENSOES_VIDEO else "Outros"
+        
+        # Estrutura: PASTA_ALVO / ANO / TIPO
+        dest_dir = os.path.join(pasta_base, ano, subpasta_tipo)
+        # Se arquivo já está no lugar certo, pula
+        if os.path.normcase(os.path.abspath(os.path.dirname(caminho))) == os.path.normcase(os.path.abspath(dest_dir)):
+            continue
+        
+        nomes = nomes_em(dest_dir)
+        nome = os.path.basename(caminho)
+        n, e = os.path.splitext(nome)
+        c = 1
+        # Renomear se já existe para não sobrescrever (comparação sem caixa: FAT/NTFS)
+        while nome.lower() in nomes:
+            nome = f"{n}_{c}{e}"
+            c += 1
+        nomes.add(nome.lower())
+        plano.append((caminho, os.path.join(dest_dir, nome)))
+    return plano
+
+class DiarioMovimentos:
+    """Diário append-only (JSON lines) de uma organização, para retomar e desfazer.
+
+    Linhas: {"tipo": "inicio"}, uma {"tipo": "plano"} por movimento, uma
+    {"tipo": "feito"} por movimento concluído, e {"tipo": "fim"} ou
+    {"tipo": "desfeito"} ao final. Caminhos são relativos à pasta base.
+    """
+
+    ARQUIVO = "organizacao.jsonl"
+
+    def __init__(self, pasta_base):
+        self.pasta_base = os.path.abspath(pasta_base)
+        self.caminho = os.path.join(self.pasta_base, PASTA_DADOS, self.ARQUIVO)
+        self._f = None
+
+    def _relativo(self, caminho):
+        """Relativo à pasta base; caminhos de fora dela (origem de uma importação) ficam absolutos."""
+        try: relativo = os.path.relpath(caminho, self.pasta_base)
+        except ValueError: return os.path.abspath(caminho)  # Outro drive no Windows
+        return os.path.abspath(caminho) if relativo.split(os.sep)[0] == os.pardir else relativo
+
+    def _escrever(self, registro, sincronizar=False):
+        self._f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        if sincronizar:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def ler(self):
+        """Retorna (estado, plano, feitos): estado é None, 'pendente', 'fim' ou 'desfeito'."""
+        if not os.path.exists(self.caminho): return None, [], set()
+        estado, plano, feitos = None, [], set()
+        with open(self.caminho, encoding="utf-8") as f:
+            for linha in f:
+                try: reg = json.loads(linha)
+                except ValueError: break  # Última linha cortada por uma queda de energia
+                tipo = reg.get("tipo")
+                if tipo == "inicio": estado, plano, feitos = "pendente", [], set()
+                elif tipo == "plano": plano.append((os.path.join(self.pasta_base, reg["o"]), os.path.join(self.pasta_base, reg["d"])))
+                elif tipo == "feito": feitos.add(reg["i"])
+                elif tipo in ("fim", "desfeito"): estado = tipo
+        return estado, plano, feitos
+
+    def iniciar(self, plano):
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        self._f = open(self.caminho, "w", encoding="utf-8")
+        self._escrever({"tipo": "inicio", "id": uuid.uuid4().hex, "data": datetime.datetime.now().isoformat()})
+        for origem, destino in plano:
+            self._escrever({"tipo": "plano", "o": self._relativo(origem), "d": self._relativo(destino)})
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def retomar(self):
+        self._f = open(self.caminho, "a", encoding="utf-8")
+
+    def feito(self, indice, sincronizar=False):
+        self._escrever({"tipo": "feito", "i": indice}, sincronizar)
+
+    def finalizar(self, tipo="fim"):
+        self._escrever({"tipo": tipo}, sincronizar=True)
+        self._f.close()
+        self._f = None
+
+    def interromper(self):
+        """Fecha o diário sem registrar o fim: a organização continua pendente para retomar."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        self._f = None
+
+class DiarioImportacao(DiarioMovimentos):
+    """Mesmo formato, para a importação de um cartão (as origens ficam com caminho absoluto)."""
+
+    ARQUIVO = "importacao.jsonl"
+
+def remover_pastas_vazias(pastas, pasta_base):
+    """Remove as pastas esvaziadas (e os pais que ficarem vazios), sem varrer a árvore toda."""
+    base = os.path.abspath(pasta_base)
+    for pasta in sorted(set(pastas), key=len, reverse=True):
+        pasta = os.path.abspath(pasta)
+        while pasta != base and pasta.startswith(base):
+            try: os.rmdir(pasta)
+            except OSError: break
+            pasta = os.path.dirname(pasta)
+
+def executar_plano(plano, pasta_base, diario, feitos=frozenset(), indice=None, progresso=None, texto="Organizando",
+                   metricas=None, tarefa=None):
+    """Aplica o plano registrando cada movimento no diário. Retorna (movidos, erros).
+
+    Um cancelamento só interrompe entre dois movimentos; o índice e as pastas
+    vazias são acertados mesmo assim, e o diário continua pendente para retomar.
+    """
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    movidos = erros = 0
+    pastas_criadas = set()
+    pastas_origem = set()
+    pendentes_indice = []
+    total = len(plano)
+    try:
+        for i, (origem, destino) in enumerate(plano):
+            if i in feitos: continue
+            tarefa.checar()
+            if progresso and i % 20 == 0: progresso(i, total, f"{texto}: {os.path.basename(origem)}")
+            try:
+                if not os.path.exists(origem) and os.path.exists(destino):
+                    # Movido antes de uma interrupção, mas o diário não chegou a registrar
+                    diario.feito(i)
+                    pendentes_indice.append((origem, destino))
+                    continue
+                pasta_destino = os.path.dirname(destino)
+                if pasta_destino not in pastas_criadas:
+                    os.makedirs(pasta_destino, exist_ok=True)
+                    pastas_criadas.add(pasta_destino)
+                if os.path.exists(destino):
+                    raise FileExistsError(errno.EEXIST, "Destino já existe", destino)
+                mover_rapido(origem, destino)
+                diario.feito(i, sincronizar=(i % 200 == 0))
+                pastas_origem.add(os.path.dirname(origem))
+                pendentes_indice.append((origem, destino))
+                movidos += 1
+                metricas.contar()
+            except OSError as e:
+                metricas.erro(e, origem)
+                erros += 1
+            if indice and len(pendentes_indice) >= 1000:
+                indice.mover_lote(pendentes_indice)
+                pendentes_indice = []
+    finally:
+        if indice and pendentes_indice:
+            indice.mover_lote(pendentes_indice)
+        remover_pastas_vazias(pastas_origem, pasta_base)
+    return movidos, erros
+
+def desfazer_organizacao(pasta_base, indice=None, progresso=None, metricas=None, tarefa=None):
+    """Devolve cada arquivo da última organização concluída ao seu lugar original.
+
+    Retorna (restaurados, erros) ou None se não houver organização para desfazer.
+    """
+    diario = DiarioMovimentos(pasta_base)
+    estado, plano, feitos = diario.ler()
+    if estado not in ("fim", "pendente") or not feitos: return None
+    inverso = [(plano[i][1], plano[i][0]) for i in sorted(feitos, reverse=True)]
+    diario.retomar()
+    try:
+        restaurados, erros = executar_plano(inverso, pasta_base, _DiarioNulo(), indice=indice, progresso=progresso,
+                                            texto="Desfazendo", metricas=metricas, tarefa=tarefa)
+    except TarefaCancelada:
+        diario.interromper()  # Desfazer de novo termina o serviço (os já devolvidos são reconhecidos)
+        raise
+    diario.finalizar("desfeito")
+    return restaurados, erros
+
+class _DiarioNulo:
+    """Diário que não registra nada (usado ao desfazer, que grava só o resultado final)."""
+    def feito(self, indice, sincronizar=False): pass
+
+# --- OPERAÇÕES SEM INTERFACE (TELA E LINHA DE COMANDO) ---
+
+def mover_para_pasta(origem, pasta_destino, indice=None):
+    """Move o arquivo para a pasta sem sobrescrever nada (nome_copyN) e atualiza o índice."""
+    os.makedirs(pasta_destino, exist_ok=True)
+    nome = os.path.basename(origem)
+    destino = os.path.join(pasta_destino, nome)
+    c = 1
+    while os.path.exists(destino):
+        n, e = os.path.splitext(nome)
+        destino = os.path.join(pasta_destino, f"{n}_copy{c}{e}")
+        c += 1
+    mover_arquivo(origem, destino)
+    if indice: indice.mover(origem, destino)
+    return destino
+
+def organizar_pasta(indice, perfil=PERFIL_PADRAO, progresso=None, retomar=False, metricas=None, tarefa=None):
+    """Organiza em ANO/Fotos|Videos com diário; retomar=True continua um plano interrompido."""
+    metricas = metricas or _MetricasNulas()
+    diario = DiarioMovimentos(indice.pasta_base)
+    if retomar:
+        _, plano, feitos = diario.ler()
+        diario.retomar()
+    else:
+        # 1. Planejamento (índice já tem o ano das execuções anteriores)
+        tabela = indice.tabela(campos=("ano",))
+        coluna_ano = tabela.extras["ano"]
+        sem_ano = [tabela.caminho(i) for i, ano in enumerate(coluna_ano) if not ano]
+        with metricas.etapa("datas"):
+            anos = obter_datas_em_lote(sem_ano, progresso, PERFIS_DISCO[perfil]["workers_metadados"], metricas, tarefa)
+            # Grava antes de mover: o índice leva o ano junto com o arquivo
+            indice.definir("ano", list(anos.items()))
+        with metricas.etapa("planejamento"):
+            arquivos = []
+            for i, ano in enumerate(coluna_ano):
+                caminho = tabela.caminho(i)
+                arquivos.append((caminho, ano or anos.get(caminho)))
+            plano = planejar_organizacao(indice.pasta_base, arquivos)
+            metricas.contar(len(plano))
+            feitos = set()
+            diario.iniciar(plano)
+
+    # 2. Execução em lote
+    with metricas.etapa("movimentos"):
+        try:
+            movidos, erros = executar_plano(plano, indice.pasta_base, diario, feitos, indice, progresso,
+                                            metricas=metricas, tarefa=tarefa)
+        except TarefaCancelada:
+            diario.interromper()
+            raise
+        diario.finalizar()
+    return movidos, erros
+
+def planejar_importacao(origem, indice, perfil=PERFIL_PADRAO, progresso=None, metricas=None, tarefa=None):
+    """Plano [(origem, destino)] de uma importação e quantos arquivos da origem já estão no destino.
+
+    Só arquivos com o mesmo tamanho de algo já indexado no destino são lidos
+    para o hash (os do destino vêm do índice quando já calculados); os demais
+    vão direto para a cópia.
+    """
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    config = PERFIS_DISCO[perfil]
+    with metricas.etapa("varredura origem"):
+        registros = [(r.caminho, r.tamanho) for r in varrer_midias(origem, metricas=metricas, tarefa=tarefa)]
+    with metricas.etapa("ja existentes"):
+        tamanhos = {tamanho for _, tamanho in registros}
+        tabela = indice.tabela(campos=("hash",))
+        no_destino = {}
+        for i, tamanho in enumerate(tabela.tamanho):
+            if tamanho in tamanhos: no_destino.setdefault(tamanho, []).append(i)
+        hashes_destino, novos_hashes, novos = {}, [], []
+        for feitos, (caminho, tamanho) in enumerate(registros, 1):
+            tarefa.checar()
+            linhas = no_destino.get(tamanho)
+            if linhas:
+                for i in linhas:
+                    if i in hashes_destino: continue
+                    h = _sem_prefixo(tabela.extras["hash"][i])
+                    if h is None:
+                        h = calcular_hash_arquivo(tabela.caminho(i), config["buffer"])
+                        if h: novos_hashes.append((tabela.caminho(i), f"{ALGORITMO_HASH}:{h}"))
+                    hashes_destino[i] = h
+                h = calcular_hash_arquivo(caminho, config["buffer"])
+                metricas.contar(1, tamanho)
+                if h and any(hashes_destino[i] == h for i in linhas): continue
+            novos.append(caminho)
+            if progresso and feitos % 50 == 0: progresso(feitos, len(registros), "Conferindo o que já está no destino...")
+        if novos_hashes: indice.definir("hash", novos_hashes)
+        obter_cache_hash().salvar()
+    with metricas.etapa("datas"):
+        anos = obter_datas_em_lote(novos, progresso, config["workers_metadados"], metricas, tarefa)
+    with metricas.etapa("planejamento"):
+        # Sem data a mídia não pode ficar para trás no cartão: vai para Sem_Data
+        plano = planejar_organizacao(indice.pasta_base, [(c, PASTA_SEM_DATA if anos[c] == "Indeterminado" else anos[c])
+                                                        for c in novos])
+    return plano, len(registros) - len(novos)
+
+def importar_midias(origem, indice, perfil=PERFIL_PADRAO, progresso=None, retomar=False, metricas=None, tarefa=None):
+    """Copia fotos e vídeos de um cartão direto para ANO/Fotos|Videos, sem passar pela organização.
+
+    Cada cópia é conferida pelo hash (calculado durante a cópia) e registrada
+    no diário de importação; o perfil do destino define quantas cópias correm
+    em paralelo. Interrompida, retomar=True continua do diário e dos .part.
+    Retorna {"copiados", "ja_existentes", "bytes", "erros": [(origem, erro)]}.
+    """
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    config = PERFIS_DISCO[perfil]
+    diario = DiarioImportacao(indice.pasta_base)
+    if retomar:
+        _, plano, feitos = diario.ler()
+        ja_existentes = 0
+        diario.retomar()
+    else:
+        plano, ja_existentes = planejar_importacao(origem, indice, perfil, progresso, metricas, tarefa)
+        feitos = set()
+        diario.iniciar(plano)
+
+    resultado = {"copiados": 0, "ja_existentes": ja_existentes, "bytes": 0, "erros": []}
+    copiados = []
+    pendentes = [(i, o, d) for i, (o, d) in enumerate(plano) if i not in feitos]
+    total_bytes = sum(os.path.getsize(o) for _, o, _ in pendentes if os.path.exists(o))
+
+    def copiar(item):
+        i, origem_arq, destino = item
+        try:
+            if os.path.exists(destino) and not os.path.exists(destino + ".part"):
+                # Copiado e conferido antes de uma interrupção, mas o diário não chegou a registrar
+                return item, calcular_hash_arquivo(destino, config["buffer"]), None
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            return item, copiar_retomavel(origem_arq, destino, max(config["buffer"], BUFFER_IMPORTACAO), tarefa), None
+        except OSError as e:
+            return item, None, e
+
+    with metricas.etapa("copias"):
+        inicio = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=config["workers"]) as pool:
+                for feitos_agora, ((i, origem_arq, destino), h, erro) in enumerate(
+                        _mapear_em_blocos(pool, copiar, pendentes, tarefa, config["workers"] * 4), 1):
+                    if erro:
+                        metricas.erro(erro, origem_arq)
+                        resultado["erros"].append((origem_arq, str(erro)))
+                        continue
+                    diario.feito(i, sincronizar=(feitos_agora % 200 == 0))
+                    tamanho = os.path.getsize(destino)
+                    copiados.append((destino, h))
+                    resultado["copiados"] += 1
+                    resultado["bytes"] += tamanho
+                    metricas.contar(1, tamanho)
+                    if progresso:
+                        mbs = resultado["bytes"] / max(time.monotonic() - inicio, 1e-6) / 1048576
+                        progresso(resultado["bytes"], total_bytes, f"Importando: {os.path.basename(destino)} ({mbs:.1f} MB/s)")
+        except TarefaCancelada:
+            diario.interromper()
+            raise
+        else:
+            diario.finalizar()
+        finally:
+            # Os arquivos já copiados entram no índice com o hash e o ano que a importação já conhece
+            indice.sincronizar(metricas=metricas)
+            cache = obter_cache_hash()
+            for destino, h in copiados:
+                with contextlib.suppress(OSError, sqlite3.Error): cache.gravar(os.stat(destino), ALGORITMO_HASH, h)
+            cache.salvar()
+            indice.definir("hash", [(d, f"{ALGORITMO_HASH}:{h}") for d, h in copiados])
+            anos = ((d, os.path.basename(os.path.dirname(os.path.dirname(d)))) for d, _ in copiados)
+            indice.definir("ano", [(d, "Indeterminado" if ano == PASTA_SEM_DATA else ano) for d, ano in anos])
+    return resultado
+
+def carregar_regras_lixo(arquivo=ARQUIVO_REGRAS_LIXO):
+    """Regras padrão combinadas com as do usuário. Arquivo inválido gera ValueError/OSError."""
+    regras = {categoria: list(padroes) for categoria, padroes in REGRAS_LIXO_PADRAO.items()}
+    try:
+        with open(arquivo, encoding="utf-8") as f:
+            usuario = json.load(f)
+    except FileNotFoundError:
+        return regras
+    if not isinstance(usuario, dict) or not all(isinstance(p, list) for p in usuario.values()):
+        raise ValueError(f"{arquivo}: esperado {{\"categoria\": [\"padrão\", ...]}}")
+    regras.update({str(categoria): [str(p) for p in padroes] for categoria, padroes in usuario.items()})
+    return regras
+
+class ClassificadorLixo:
+    """Todas as regras de nome em uma única regex: um passe por nome em vez de um `in` por termo."""
+
+    def __init__(self, regras, metricas=None):
+        metricas = metricas or _MetricasNulas()
+        partes, self.categorias = [], []
+        for categoria, padroes in regras.items():
+            for padrao in padroes:
+                parte = f"(?P<r{len(self.categorias)}>{padrao})"
+                try:
+                    re.compile(parte)  # Já no formato da regex combinada: flags globais como (?i) só valem no início
+                except re.error:
+                    metricas.erro("RegraInvalida", f"{categoria}: {padrao}")
+                    continue
+                partes.append(parte)
+                self.categorias.append(categoria)
+        self._regex = re.compile("|".join(partes), re.IGNORECASE) if partes else None
+
+    def categoria(self, nome):
+        """Categoria da regra que casa com o nome, ou None."""
+        m = self._regex.search(nome) if self._regex else None
+        return self.categorias[int(m.lastgroup[1:])] if m else None
 
-FONTE_LOGO = ("Impact", 50)
-FONTE_TITULO = ("Segoe UI", 24, "bold")
-FONTE_MENU = ("Segoe UI", 12, "bold")
-FONTE_DESC = ("Segoe UI", 9)
+def ler_cabecalho_imagem(origem):
+    """(largura, altura, tem_exif_de_camera) sem decodificar: o PIL só lê o cabeçalho ao abrir."""
+    with Image.open(origem) as img:
+        return _cabecalho_aberto(img)
 
-# --- FUNÇÕES UTILITÁRIAS ---
+def _cabecalho_aberto(img):
+    largura, altura = img.size
+    if img.format == "TIFF":
+        exif = img.getexif()
+    else:
+        # Em PNG, getexif() decodificaria a imagem atrás do chunk eXIf; o que veio no cabeçalho basta
+        exif = Image.Exif()
+        if img.info.get("exif"): exif.load(img.info["exif"])
+    return largura, altura, bool(exif.get(0x010F) or exif.get(0x0110))  # Make / Model
 
-def obter_data_arquivo(caminho_arquivo):
-    """Tenta descobrir o ano do arquivo (EXIF para fotos ou Data de Modificação)."""
-    ext = os.path.splitext(caminho_arquivo)[1].lower()
-    
-    # Tenta EXIF apenas se for foto
-    if ext in EXTENSOES_FOTO:
-        try:
-            img = Image.open(caminho_arquivo)
-            exif_data = img._getexif()
-            # 36867 é a tag para DateTimeOriginal
-            if exif_data and 36867 in exif_data:
-                data_str = exif_data[36867]
-                ano = data_str.split(':')[0]
-                if int(ano) > 1900: # Validação básica de ano
-                    return ano
-        except Exception:
-            pass
-    
-    # Fallback: Data de modificação do arquivo (funciona p/ vídeos e fotos sem EXIF)
+def buscar_prints_por_conteudo(caminhos, progresso=None, workers=4, metricas=None, tarefa=None):
+    """Fotos com resolução de tela e sem EXIF de câmera (prints renomeados), lendo só cabeçalhos em paralelo."""
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    cache = obter_cache_hash()
+    total = len(caminhos)
+
+    def ler(caminho):
+        tarefa.checar()
+        try:
+            st = os.stat(caminho)
+            em_cache = cache.obter(st, "lixo:tela")
+            if em_cache is not None: return em_cache == "sim"
+            largura, altura, camera = ler_cabecalho_imagem(caminho)
+        except (OSError, SyntaxError, ValueError, struct.error, Image.DecompressionBombError) as e:
+            metricas.erro(e, caminho)
+            return False
+        except sqlite3.Error:
+            return False
+        tela = (max(largura, altura), min(largura, altura)) in RESOLUCOES_TELA and not camera
+        try: cache.gravar(st, "lixo:tela", "sim" if tela else "nao")
+        except sqlite3.Error: pass
+        return tela
+
+    encontrados = []
     try:
-        timestamp = os.path.getmtime(caminho_arquivo)
-        data_arquivo = datetime.datetime.fromtimestamp(timestamp)
-        return str(data_arquivo.year)
-    except:
-        return "Indeterminado"
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i, (caminho, tela) in enumerate(zip(caminhos, pool.map(ler, caminhos)), 1):
+                metricas.contar()
+                if tela: encontrados.append(caminho)
+                if progresso and i % 50 == 0: progresso(i, total, "Lendo cabeçalhos das fotos...")
+    finally:
+        cache.salvar()
+    return encontrados
 
-def calcular_hash_arquivo(caminho, block_size=65536):
-    """Gera hash MD5 para comparar conteúdo."""
-    hasher = hashlib.md5()
+def buscar_lixo(indice, metricas=None, perfil=PERFIL_PADRAO, progresso=None, tarefa=None, conteudo=LIXO_POR_CONTEUDO):
+    """Lista ordenada de (caminho, motivo) das fotos que parecem lixo (WhatsApp, prints...).
+
+    O nome é testado contra as regras (padrão + regras_lixo.json). Com `conteudo`,
+    as demais fotos têm o cabeçalho lido: resolução de tela sem EXIF de câmera
+    indica um print renomeado. O tamanho sozinho não é critério.
+    """
+    metricas = metricas or _MetricasNulas()
     try:
-        with open(caminho, 'rb') as f:
-            buf = f.read(block_size)
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = f.read(block_size)
-        return hasher.hexdigest()
-    except:
-        return None
+        regras = carregar_regras_lixo()
+    except (OSError, ValueError) as e:
+        metricas.erro(e, ARQUIVO_REGRAS_LIXO)
+        regras = REGRAS_LIXO_PADRAO
+    encontrados, restantes = [], []
+    with metricas.etapa("nomes"):
+        classificador = ClassificadorLixo(regras, metricas)
+        fotos = indice.caminhos("foto")
+        metricas.contar(len(fotos))
+        for caminho in fotos:
+            categoria = classificador.categoria(os.path.basename(caminho))
+            if categoria: encontrados.append((caminho, categoria))
+            else: restantes.append(caminho)
+    if conteudo and restantes:
+        with metricas.etapa("cabecalhos"):
+            prints = buscar_prints_por_conteudo(restantes, progresso, PERFIS_DISCO[perfil]["workers_metadados"],
+                                                metricas, tarefa)
+            encontrados += [(caminho, "print (resolução de tela, sem câmera)") for caminho in prints]
+    return sorted(encontrados)
 
-def gerar_html_galeria(diretorio_base):
-    """Gera um arquivo HTML para visualização elegante das fotos."""
-    titulo_galeria = "Galeria Multimídia"
-    arquivo_saida = "Galeria_Arquivos.html"
-    
-    albuns = {}
-    contador_imgs = 0
-    
-    for root, dirs, files in os.walk(diretorio_base):
-        # Ignora pastas de sistema/lixo
-        if "_LIXEIRA" in root or "_SUSPEITOS" in root or "_REVISAO_RAPIDA" in root: continue
-        
-        path_root = Path(root)
-        imagens_na_pasta = []
-        
-        for file in files:
-            ext = os.path.splitext(file)[1].lower()
-            if ext in EXTENSOES_FOTO: # Galeria foca em fotos para visualização web simples
-                caminho_completo = path_root / file
-                try:
-                    caminho_relativo = os.path.relpath(caminho_completo, diretorio_base)
-                    caminho_web = caminho_relativo.replace('\\', '/')
-                    imagens_na_pasta.append(caminho_web)
-                    contador_imgs += 1
-                except: pass
-        
-        if imagens_na_pasta:
-            nome_pasta = str(path_root.relative_to(diretorio_base)).replace('\\', ' > ')
-            if nome_pasta == ".": nome_pasta = "Raiz"
-            albuns[nome_pasta] = sorted(imagens_na_pasta)
+def buscar_corrompidos(indice, nivel="rapido", progresso=None, metricas=None, tarefa=None):
+    """Lista ordenada de (caminho, erro) das fotos e vídeos que falharam na verificação.
 
-    if contador_imgs == 0: return False
+    Arquivos aprovados antes neste nível (ou no profundo) saem direto do índice
+    quando o stat confere com o registrado (um arquivo truncado depois perde o "ok"). Vídeos só em
+    MP4/MOV e MKV/WebM, os contêineres cuja estrutura é conferida.
+    """
+    metricas = metricas or _MetricasNulas()
+    aprovadas = {"ok:profundo"} if nivel == "profundo" else {"ok:profundo", "ok:rapido"}
+    tabela = indice.tabela(campos=("integridade",))
+    pendentes = [tabela.caminho(i) for i, r in enumerate(tabela.extras["integridade"])
+                 if os.path.splitext(tabela.nome[i])[1].lower() in EXTENSOES_VERIFICAVEIS
+                 and (r not in aprovadas or not tabela.atual(i))]
+    with metricas.etapa("verificacao"):
+        resultados = verificar_integridade(pendentes, nivel, progresso, metricas=metricas, tarefa=tarefa)
+        indice.definir("integridade", [(p, f"ok:{nivel}" if r == "ok" else r) for p, r in resultados])
+    return sorted((p, r) for p, r in resultados if r != "ok")
+
+def buscar_duplicatas(indice, perfil=PERFIL_PADRAO, progresso=None, metricas=None, tarefa=None):
+    """Duplicatas exatas de todo o índice; devolve (grupos, estatísticas de leitura)."""
+    try:
+        grupos, hashes_novos, stats = encontrar_duplicatas(indice.tabela(campos=("hash",)), progresso,
+                                                           motor=MotorHash(perfil, metricas=metricas, tarefa=tarefa))
+    finally:
+        obter_cache_hash().salvar()  # Hashes já calculados são reaproveitados mesmo se a tarefa for cancelada
+    indice.definir("hash", [(p, f"{ALGORITMO_HASH}:{h}") for p, h in hashes_novos])
+    return grupos, stats
+
+def deduplicar_grupos(grupos, indice=None, modo="auto", progresso=None, metricas=None, tarefa=None):
+    """Troca por links as cópias de todos os grupos de duplicatas exatas (a primeira de cada grupo fica).
 
-    # HTML Template Minimalista
-    html = f"""<!DOCTYPE html>
-    <html lang="pt-br">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>{titulo_galeria}</title>
-        <style>
-            body {{ background: #1a1a1a; color: #eee; font-family: sans-serif; margin: 0; padding: 20px; }}
-            h1 {{ text-align: center; font-weight: 300; }}
-            h2 {{ color: #007acc; border-bottom: 1px solid #333; padding-bottom: 10px; margin-top: 40px; }}
-            .grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(150px, 1fr)); gap: 10px; }}
-            .card {{ aspect-ratio: 1; overflow: hidden; border-radius: 4px; background: #222; cursor: pointer; transition: 0.2s; }}
-            .card:hover {{ transform: scale(1.02); box-shadow: 0 5px 15px rgba(0,0,0,0.5); }}
-            img {{ width: 100%; height: 100%; object-fit: cover; display: block; }}
-        </style>
-    </head>
-    <body>
-        <h1>📂 {titulo_galeria}</h1>
-        <p style="text-align:center; color:#888">{contador_imgs} fotos organizadas</p>
+    Retorna {"substituidos", "reflinks", "hardlinks", "bytes_liberados", "erros": [(caminho, erro)]}.
     """
-    
-    for album, fotos in albuns.items():
-        html += f"<h2>{album}</h2><div class='grid'>"
-        for foto in fotos:
-            html += f"<div class='card' onclick=\"window.open('{foto}', '_blank')\"><img src='{foto}' loading='lazy'></div>"
-        html += "</div>"
-    
-    html += "</body></html>"
-    
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    resultado = {"substituidos": 0, "reflinks": 0, "hardlinks": 0, "bytes_liberados": 0, "erros": []}
+    atualizados = []
+    total = sum(len(g) - 1 for g in grupos)
+    feitos = 0
+    with metricas.etapa("links"):
+        try:
+            for grupo in grupos:
+                original = grupo[0]
+                for copia in grupo[1:]:
+                    tarefa.checar()
+                    feitos += 1
+                    try:
+                        tipo, liberados = substituir_por_link(original, copia, modo)
+                    except (OSError, ArquivosDiferentes) as e:
+                        metricas.erro(e, copia)
+                        resultado["erros"].append((copia, str(e)))
+                        continue
+                    metricas.contar(1, 2 * os.path.getsize(original))
+                    if tipo:
+                        resultado["substituidos"] += 1
+                        resultado[tipo + "s"] += 1
+                        resultado["bytes_liberados"] += liberados
+                        atualizados.append(copia)
+                    if progresso and feitos % 20 == 0:
+                        progresso(feitos, total, f"Ligando cópias... {formatar_bytes(resultado['bytes_liberados'])} liberados")
+        finally:
+            if indice and atualizados:
+                pares = []
+                for caminho in atualizados:
+                    with contextlib.suppress(OSError): pares.append((caminho, os.stat(caminho)))
+                indice.atualizar_stat(pares)
+    return resultado
+
+def buscar_parecidas(indice, perfil=PERFIL_PADRAO, progresso=None, metricas=None, tarefa=None):
+    tabela = indice.tabela("foto")
+    fotos = [(tabela.caminho(i), tabela.tamanho[i], tabela.inode[i]) for i in range(len(tabela))]
+    return encontrar_fotos_parecidas(fotos, progresso, motor=MotorHash(perfil, metricas=metricas, tarefa=tarefa))
+
+# --- ACERVO DE REFERÊNCIA ---
+
+def _sem_prefixo(h, algoritmo=ALGORITMO_HASH):
+    """Hash do índice ("algoritmo:hash") sem o prefixo, ou None se for de outro algoritmo."""
+    prefixo = algoritmo + ":"
+    return h[len(prefixo):] if h and h.startswith(prefixo) else None
+
+class IndiceReferencia:
+    """Tamanho + hash parcial/completo de cada arquivo de um acervo mestre.
+
+    Fica na pasta do usuário (não no acervo), então a conferência funciona com o
+    acervo desconectado e nunca o relê. As consultas são pelo tamanho (indexado):
+    o custo depende do dispositivo conferido, não do tamanho do acervo.
+    """
+
+    def __init__(self, nome, pasta=PASTA_REFERENCIAS):
+        os.makedirs(pasta, exist_ok=True)
+        self.nome = nome
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(os.path.join(pasta, nome + ".db"), check_same_thread=False, timeout=30)
+        try: self.conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.DatabaseError: pass
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS arquivos (
+                caminho  TEXT PRIMARY KEY,
+                tamanho  INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                parcial  TEXT NOT NULL,
+                hash     TEXT NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_referencia_tamanho ON arquivos(tamanho)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT)")
+        self.conn.commit()
+
+    @staticmethod
+    def nome_para(pasta_acervo):
+        """Nome do índice de um acervo: nome da pasta + trecho do hash do caminho completo."""
+        base = os.path.abspath(pasta_acervo)
+        nome = re.sub(r"[^\w-]", "_", os.path.basename(base.rstrip(os.sep)) or "raiz")
+        return f"{nome}_{hashlib.md5(base.encode('utf-8')).hexdigest()[:8]}"
+
+    @staticmethod
+    def listar(pasta=PASTA_REFERENCIAS):
+        """Nomes dos índices existentes, do atualizado mais recentemente ao mais antigo."""
+        try:
+            arquivos = [e for e in os.scandir(pasta) if e.name.endswith(".db")]
+        except OSError:
+            return []
+        return [e.name[:-3] for e in sorted(arquivos, key=lambda e: e.stat().st_mtime, reverse=True)]
+
+    def meta(self, chave):
+        with self._lock:
+            linha = self.conn.execute("SELECT valor FROM meta WHERE chave = ?", (chave,)).fetchone()
+        return linha[0] if linha else None
+
+    def total(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM arquivos").fetchone()[0]
+
+    def tem_tamanho(self, tamanho):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM arquivos WHERE tamanho = ? LIMIT 1", (tamanho,)).fetchone() is not None
+
+    def candidatos(self, tamanho, parcial):
+        """(caminho_relativo, hash) dos arquivos do acervo com esse tamanho e hash parcial."""
+        with self._lock:
+            return self.conn.execute("SELECT caminho, hash FROM arquivos WHERE tamanho = ? AND parcial = ?",
+                                     (tamanho, parcial)).fetchall()
+
+    def fechar(self):
+        with self._lock:
+            self.conn.close()
+
+    def atualizar(self, indice, perfil=PERFIL_PADRAO, progresso=None, metricas=None, tarefa=None):
+        """Traz para a referência o acervo de `indice` (já sincronizado). Retorna o total de arquivos.
+
+        Só arquivos novos ou alterados são lidos; hashes completos já presentes no
+        índice do acervo são reaproveitados e os calculados aqui voltam para ele.
+        """
+        metricas = metricas or _MetricasNulas()
+        tabela = indice.tabela(campos=("hash",))
+        with self._lock:
+            if self.meta("algoritmo") not in (None, ALGORITMO_HASH):
+                self.conn.execute("DELETE FROM arquivos")  # Hashes de outro algoritmo não se comparam
+            pendentes = []
+            with metricas.etapa("comparacao"):
+                self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS vistos (caminho TEXT PRIMARY KEY)")
+                self.conn.execute("DELETE FROM vistos")
+                for i in range(len(tabela)):
+                    relativo, tamanho, mtime_ns = tabela.relativo(i), tabela.tamanho[i], tabela.mtime_ns[i]
+                    self.conn.execute("INSERT INTO vistos VALUES (?)", (relativo,))
+                    linha = self.conn.execute("SELECT tamanho, mtime_ns FROM arquivos WHERE caminho = ?", (relativo,)).fetchone()
+                    if linha != (tamanho, mtime_ns) and tamanho > 0:
+                        pendentes.append((tabela.caminho(i), tamanho, tabela.inode[i],
+                                          _sem_prefixo(tabela.extras["hash"][i]), relativo, mtime_ns))
+                self.conn.execute("DELETE FROM arquivos WHERE caminho NOT IN (SELECT caminho FROM vistos)")
+                self.conn.commit()
+                metricas.contar(len(tabela))
+
+        motor = MotorHash(perfil, metricas=metricas, tarefa=tarefa)
+
+        def ler(item):
+            caminho, tamanho, _, h = item[:4]
+            parcial, lidos, completo = calcular_hash_parcial(caminho, tamanho)
+            if parcial and not h:
+                if completo:
+                    h = parcial
+                else:
+                    h, lidos_completo = motor.hash_completo(caminho)
+                    lidos += lidos_completo
+            return (parcial, h), lidos
+
+        lote, hashes_novos = [], []
+        def gravar_lote():
+            with self._lock:
+                self.conn.executemany("INSERT OR REPLACE INTO arquivos VALUES (?, ?, ?, ?, ?)", lote)
+                self.conn.commit()
+            lote.clear()
+
+        with metricas.etapa("hash"):
+            try:
+                for item, (parcial, h) in motor.mapear(ler, pendentes, progresso, "Indexando o acervo..."):
+                    if not parcial or not h:
+                        metricas.erro("LeituraFalhou", item[0])
+                        continue
+                    lote.append((item[4], item[1], item[5], parcial, h))
+                    if item[3] is None: hashes_novos.append((item[0], f"{ALGORITMO_HASH}:{h}"))
+                    if len(lote) >= 500: gravar_lote()
+            finally:
+                # O que já foi lido fica na referência mesmo se a tarefa for cancelada
+                gravar_lote()
+                indice.definir("hash", hashes_novos)
+                obter_cache_hash().salvar()
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                  [("pasta", indice.pasta_base), ("algoritmo", ALGORITMO_HASH),
+                                   ("atualizado", datetime.datetime.now().isoformat(timespec="seconds"))])
+            self.conn.commit()
+        return self.total()
+
+def buscar_arquivados(indice, referencia, perfil=PERFIL_PADRAO, progresso=None, metricas=None, tarefa=None):
+    """Arquivos do dispositivo que já estão no acervo: lista ordenada de (caminho, caminho_no_acervo).
+
+    Só arquivos cujo tamanho existe no acervo são abertos; destes, lê-se a
+    amostra do hash parcial e, se ela bater, o conteúdo completo.
+    """
+    metricas = metricas or _MetricasNulas()
+    if referencia.meta("algoritmo") != ALGORITMO_HASH:
+        raise ValueError(f"o acervo '{referencia.nome}' foi indexado com outro algoritmo; indexe-o de novo")
+    pasta_acervo = referencia.meta("pasta") or ""
+    tabela = indice.tabela(campos=("hash",))
+    with metricas.etapa("tamanho"):
+        tamanhos, candidatos = {}, []
+        for i, tamanho in enumerate(tabela.tamanho):
+            if tamanho <= 0: continue
+            if tamanho not in tamanhos: tamanhos[tamanho] = referencia.tem_tamanho(tamanho)
+            if tamanhos[tamanho]:
+                candidatos.append((tabela.caminho(i), tamanho, tabela.inode[i], _sem_prefixo(tabela.extras["hash"][i])))
+        metricas.contar(len(tabela))
+
+    motor = MotorHash(perfil, metricas=metricas, tarefa=tarefa)
+
+    def conferir(item):
+        caminho, tamanho, _, h = item
+        parcial, lidos, completo = calcular_hash_parcial(caminho, tamanho)
+        if not parcial: return None, lidos
+        iguais = referencia.candidatos(tamanho, parcial)
+        if not iguais: return ("", None), lidos
+        calculado = None
+        if not h:
+            if completo:
+                h = parcial
+            else:
+                h, lidos_completo = motor.hash_completo(caminho)
+                lidos += lidos_completo
+                if not h: return None, lidos
+            calculado = h
+        no_acervo = next((rel for rel, hr in iguais if hr == h), "")
+        return (no_acervo, calculado), lidos
+
+    encontrados, hashes_novos = [], []
+    with metricas.etapa("conteudo"):
+        try:
+            for item, resultado in motor.mapear(conferir, candidatos, progresso, "Conferindo com o acervo..."):
+                if resultado is None:
+                    metricas.erro("LeituraFalhou", item[0])
+                    continue
+                no_acervo, calculado = resultado
+                if calculado: hashes_novos.append((item[0], f"{ALGORITMO_HASH}:{calculado}"))
+                if no_acervo: encontrados.append((item[0], os.path.join(pasta_acervo, no_acervo)))
+        finally:
+            indice.definir("hash", hashes_novos)
+            obter_cache_hash().salvar()
+    return sorted(encontrados)
+
+# --- AUDITORIA COMPLETA (UMA LEITURA POR ARQUIVO) ---
+
+LIMITE_BUFFER_AUDITORIA = 64 * 1024 * 1024  # Acima disso o arquivo passa em fluxo e só o hash usa os bytes
+LIMITE_EM_VOO_AUDITORIA = 256 * 1024 * 1024  # Bytes já lidos esperando os processos de análise
+
+def auditar_arquivo(args):
+    """Todas as análises de um arquivo sobre o mesmo buffer. Roda em um processo separado.
+
+    Retorna (caminho, hash, ano, integridade, dhash, print_por_conteudo). Sem
+    `dados` (arquivo grande), o hash vem do leitor e o resto lê só cabeçalhos.
+    """
+    caminho, nivel, algoritmo, dados = args
+    h = None
+    if dados is not None:
+        hasher = novo_hasher(algoritmo)
+        hasher.update(dados)
+        h = hasher.hexdigest()
+    ano = obter_data_arquivo(caminho, dados)
+    integridade = dhash = tela = None
+    if os.path.splitext(caminho)[1].lower() in EXTENSOES_FOTO:
+        integridade = verificar_imagem((caminho, "rapido", dados))[1]
+        if integridade == "ok":
+            # Uma abertura serve ao cabeçalho (detecção de print) e à decodificação reduzida do dHash,
+            # que também é a verificação profunda
+            try:
+                with Image.open(io.BytesIO(dados) if dados is not None else caminho) as img:
+                    try:
+                        largura, altura, camera = _cabecalho_aberto(img)
+                        tela = (max(largura, altura), min(largura, altura)) in RESOLUCOES_TELA and not camera
+                    except (SyntaxError, ValueError, struct.error):
+                        tela = False
+                    dhash = _dhash_decodificando(img)
+            except Exception as e:
+                if nivel == "profundo":
+                    integridade = str(e) or type(e).__name__
+                    tela = None
+    elif os.path.splitext(caminho)[1].lower() in EXTENSOES_VIDEO_VERIFICAVEIS:
+        integridade = verificar_video((caminho, nivel, dados))[1]
+    return caminho, h, ano, integridade, dhash, tela
+
+def _ler_para_auditoria(caminho, algoritmo, buffer):
+    """(stat, dados, hash): o conteúdo inteiro se couber no limite; senão só o hash, calculado em fluxo."""
+    with open(caminho, "rb") as f:
+        st = os.fstat(f.fileno())
+        if st.st_size <= LIMITE_BUFFER_AUDITORIA:
+            return st, f.read(), None
+        hasher = novo_hasher(algoritmo)
+        for bloco in iter(lambda: f.read(buffer), b""):
+            hasher.update(bloco)
+        return st, None, hasher.hexdigest()
+
+def auditoria_completa(indice, nivel="profundo", perfil=PERFIL_PADRAO, progresso=None, metricas=None, tarefa=None,
+                       workers=None):
+    """Lê cada arquivo uma única vez para hash, integridade, data, assinatura visual e detecção de lixo.
+
+    Um leitor sequencial (na ordem física no perfil USB) entrega os bytes a um
+    pool de processos, que analisa enquanto o próximo arquivo é lido. Arquivos
+    com hash, ano e integridade já no índice (e o mesmo stat) não são lidos de novo. Tudo vai
+    para o índice e os caches; o relatório (duplicatas, corrompidos, lixo) é
+    gravado em auditoria.json e devolvido para as janelas de revisão.
+    """
+    metricas = metricas or _MetricasNulas()
+    tarefa = tarefa or Tarefa()
+    config = PERFIS_DISCO[perfil]
+    algoritmo = ALGORITMO_HASH
+    aprovadas = {"ok:profundo"} if nivel == "profundo" else {"ok:profundo", "ok:rapido"}
+    cache = obter_cache_hash()
+
+    tabela = indice.tabela(campos=CAMPOS_DERIVADOS)
+    ano_col, hash_col, integridade_col = (tabela.extras[c] for c in CAMPOS_DERIVADOS)
+    itens = [(tabela.caminho(i), tabela.inode[i]) for i in range(len(tabela))
+             if not (_sem_prefixo(hash_col[i], algoritmo) and ano_col[i]
+                     and (integridade_col[i] in aprovadas
+                          or os.path.splitext(tabela.nome[i])[1].lower() not in EXTENSOES_VERIFICAVEIS)
+                     and tabela.atual(i))]
+    if config["ordenar_inode"]:
+        itens.sort(key=lambda it: it[1])
+    total = len(itens)
+    resultados = {"hash": [], "ano": [], "integridade": []}
+    bytes_lidos = 0
+
+    def gravar_resultados():
+        for campo, valores in resultados.items():
+            if valores: indice.definir(campo, valores)
+            valores.clear()
+
+    def registrar(caminho, st, h_fluxo, resultado):
+        _, h, ano, integridade, dhash, tela = resultado
+        h = h or h_fluxo
+        try:
+            cache.gravar(st, algoritmo, h)
+            if integridade == "ok": cache.gravar(st, f"integridade:{nivel}", "ok")
+            if dhash is not None: cache.gravar(st, "dhash64", f"{dhash:016x}")
+            if tela is not None: cache.gravar(st, "lixo:tela", "sim" if tela else "nao")
+        except sqlite3.Error:
+            pass
+        resultados["hash"].append((caminho, f"{algoritmo}:{h}"))
+        resultados["ano"].append((caminho, ano))
+        if integridade is not None:
+            resultados["integridade"].append((caminho, f"ok:{nivel}" if integridade == "ok" else integridade))
+        if len(resultados["hash"]) >= 500: gravar_resultados()
+
+    with metricas.etapa("leitura unica"):
+        inicio = time.monotonic()
+        workers = workers or os.cpu_count() or 2
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                em_voo, bytes_em_voo = deque(), 0
+
+                def concluir_um():
+                    nonlocal bytes_em_voo
+                    futuro, caminho, st, h_fluxo, tamanho = em_voo.popleft()
+                    bytes_em_voo -= tamanho
+                    registrar(caminho, st, h_fluxo, futuro.result())
+
+                for feitos, (caminho, _) in enumerate(itens, 1):
+                    tarefa.checar()
+                    try:
+                        st, dados, h_fluxo = _ler_para_auditoria(caminho, algoritmo, config["buffer"])
+                    except OSError as e:
+                        metricas.erro(e, caminho)
+                        continue
+                    tamanho = len(dados) if dados is not None else 0
+                    bytes_lidos += st.st_size
+                    metricas.contar(1, st.st_size)
+                    em_voo.append((pool.submit(auditar_arquivo, (caminho, nivel, algoritmo, dados)),
+                                   caminho, st, h_fluxo, tamanho))
+                    bytes_em_voo += tamanho
+                    # A leitura não dispara na frente da análise: limita arquivos e bytes em memória
+                    while len(em_voo) > 2 * workers or bytes_em_voo > LIMITE_EM_VOO_AUDITORIA:
+                        concluir_um()
+                    if progresso and feitos % 10 == 0:
+                        mbs = bytes_lidos / max(time.monotonic() - inicio, 1e-6) / 1048576
+                        progresso(feitos, total, f"Auditando (leitura única): {mbs:.1f} MB/s")
+                while em_voo:
+                    concluir_um()
+        finally:
+            # O que já foi analisado fica no índice e nos caches, mesmo se a tarefa for cancelada
+            gravar_resultados()
+            cache.salvar()
+
+    with metricas.etapa("relatorio"):
+        tabela = indice.tabela(campos=CAMPOS_DERIVADOS)
+        grupos, inodes, ja_ligados = {}, set(), 0
+        for i, h in enumerate(tabela.extras["hash"]):
+            if not h or tabela.tamanho[i] == 0: continue
+            if tabela.inode[i]:
+                if tabela.inode[i] in inodes:  # Hardlinks não ocupam espaço extra
+                    ja_ligados += 1
+                    continue
+                inodes.add(tabela.inode[i])
+            grupos.setdefault((tabela.tamanho[i], h), []).append(tabela.caminho(i))
+        duplicatas = sorted(sorted(g) for g in grupos.values() if len(g) > 1)
+        corrompidos = sorted((tabela.caminho(i), r) for i, r in enumerate(tabela.extras["integridade"])
+                             if r and not r.startswith("ok:"))
+        anos = Counter(a or "?" for a in tabela.extras["ano"])
+        bytes_duplicados = sum(tamanho * (len(g) - 1) for (tamanho, _), g in grupos.items() if len(g) > 1)
+    # O conteúdo visual já está no cache: aqui só entram stat e regras de nome
+    lixo = buscar_lixo(indice, metricas, perfil, progresso, tarefa)
+
+    # Mesmo formato das estatísticas de encontrar_duplicatas: a janela de duplicatas usa as duas
+    estatisticas = {"arquivos": len(tabela), "bytes_total": sum(tabela.tamanho), "evitados_tamanho": 0,
+                    "lidos_parcial": 0, "evitados_parcial": 0, "lidos_completo": bytes_lidos,
+                    "reaproveitados": len(tabela) - total, "ja_ligados": ja_ligados}
+    relatorio = {"pasta": indice.pasta_base, "data": datetime.datetime.now().isoformat(timespec="seconds"),
+                 "nivel": nivel, "algoritmo": algoritmo, "lidos": total, "estatisticas": estatisticas,
+                 "bytes_duplicados": bytes_duplicados, "anos": dict(sorted(anos.items())),
+                 "duplicatas": duplicatas, "corrompidos": corrompidos, "lixo": lixo}
+    destino = indice.caminho_dados("auditoria.json")
     try:
-        with open(os.path.join(diretorio_base, arquivo_saida), "w", encoding="utf-8") as f:
-            f.write(html)
-        return True
-    except:
-        return False
+        with open(destino + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=1)
+        os.replace(destino + ".tmp", destino)
+        relatorio["arquivo"] = destino
+    except OSError as e:
+        metricas.erro(e, destino)
+    return relatorio
+
+# --- LINHA DE COMANDO ---
+
+SAIDA_OK, SAIDA_ENCONTROU, SAIDA_USO, SAIDA_FALHA = 0, 1, 2, 3
+SAIDA_CANCELADA = 130  # Mesmo código que o shell usa para Ctrl+C
+
+class SaidaCLI:
+    """Escreve eventos JSON no stdout: só o resultado (json) ou progresso + resultado (ndjson)."""
+
+    INTERVALO_PROGRESSO = 0.5  # segundos entre linhas de progresso
+
+    def __init__(self, formato, comando, pasta):
+        self.formato, self.comando, self.pasta = formato, comando, pasta
+        self.metricas = None
+        self._ultimo = 0.0
+        self._lock = threading.Lock()
+
+    def _escrever(self, evento):
+        with self._lock:
+            sys.stdout.write(json.dumps(evento, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+
+    def progresso(self, atual, total, texto=""):
+        if self.formato != "ndjson": return
+        agora = time.monotonic()
+        final = total and atual >= total  # A última atualização de cada etapa sempre sai
+        if not final and agora - self._ultimo < self.INTERVALO_PROGRESSO: return
+        self._ultimo = agora
+        evento = {"evento": "progresso", "comando": self.comando, "pasta": self.pasta,
+                  "atual": atual, "total": total, "texto": texto}
+        if self.metricas:
+            evento["etapa"] = self.metricas.etapa_atual
+            evento["erros"] = self.metricas.total_erros()
+        self._escrever(evento)
+
+    def resultado(self, dados, ok=True, evento=None):
+        self._escrever({"evento": evento or ("resultado" if ok else "erro"), "comando": self.comando,
+                        "pasta": self.pasta, "ok": ok, **dados})
+
+def criar_parser_cli():
+    parser = argparse.ArgumentParser(
+        prog="pendrive_manager",
+        description="Pendrive Manager sem interface gráfica. Sem argumentos, abre a janela.",
+        epilog=f"Códigos de saída: {SAIDA_OK} = ok/nada encontrado, {SAIDA_ENCONTROU} = itens encontrados ou "
+               f"arquivos com erro, {SAIDA_USO} = uso incorreto, {SAIDA_FALHA} = falha na execução, "
+               f"{SAIDA_CANCELADA} = cancelado (Ctrl+C/SIGTERM; o trabalho feito é aproveitado na próxima vez).")
+    parser.add_argument("--formato", choices=("json", "ndjson"), default="json",
+                        help="json: um documento no fim; ndjson: uma linha por evento de progresso + resultado")
+    parser.add_argument("--perfil", choices=sorted(PERFIS_DISCO), default=PERFIL_PADRAO, help="perfil de leitura do disco")
+    parser.add_argument("--prometheus", action="store_true",
+                        help="grava também as métricas no formato texto do Prometheus em .pendrive_manager/relatorios")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    def comando(nome, ajuda):
+        p = sub.add_parser(nome, help=ajuda)
+        p.add_argument("pasta", help="pasta ou ponto de montagem do dispositivo")
+        p.add_argument("--completo", action="store_true",
+                       help="lista todas as pastas de novo (por padrão pula as que não mudaram desde o último scan)")
+        return p
+
+    comando("scan", "atualiza o índice e mostra os totais")
+    comando("organizar", "organiza em ANO/Fotos|Videos").add_argument(
+        "--retomar", action="store_true", help="continua uma organização interrompida")
+    comando("desfazer", "desfaz a última organização")
+    p = comando("importar", "copia fotos e vídeos de um cartão direto para ANO/Fotos|Videos da pasta, conferindo cada cópia")
+    p.add_argument("--de", metavar="ORIGEM", help="pasta ou ponto de montagem do cartão")
+    p.add_argument("--retomar", action="store_true", help="continua uma importação interrompida")
+    p = comando("lixo", "lista fotos que parecem lixo (WhatsApp, prints...)")
+    p.add_argument("--mover", action="store_true", help="move os encontrados para _REVISAO_RAPIDA")
+    p.add_argument("--so-nomes", action="store_true", help="não lê o cabeçalho das fotos (só as regras de nome)")
+    p = comando("integridade", "verifica fotos e vídeos (MP4/MOV/MKV/WebM) corrompidos")
+    p.add_argument("--profundo", action="store_true", help="decodifica as fotos (pega JPEG truncado); vídeos são conferidos pela estrutura nos dois modos")
+    p.add_argument("--mover", action="store_true", help="move as corrompidas para _LIXEIRA_SEGURA")
+    p = comando("duplicatas", "duplicatas exatas por conteúdo")
+    acao = p.add_mutually_exclusive_group()
+    acao.add_argument("--mover", action="store_true",
+                      help="move as cópias (mantém a primeira de cada grupo) para _LIXEIRA_SEGURA")
+    acao.add_argument("--ligar", action="store_true",
+                      help="troca as cópias por links da primeira do grupo (conferidas byte a byte), "
+                           "liberando o espaço na hora")
+    p.add_argument("--tipo-link", choices=("auto", "reflink", "hardlink"), default="auto",
+                   help="auto: reflink (cópia independente) quando o sistema de arquivos permite, senão hardlink")
+    comando("parecidas", "fotos visualmente parecidas").add_argument(
+        "--mover", action="store_true", help="move as versões menores para _LIXEIRA_SEGURA")
+    comando("galeria", "gera Galeria_Arquivos.html")
+    comando("auditoria", "hash, integridade, data e lixo lendo cada arquivo uma vez (relatório em auditoria.json)").add_argument(
+        "--rapido", action="store_true", help="integridade só pela estrutura (sem decodificar as fotos)")
+    comando("acervo", "indexa (ou atualiza) a pasta como acervo de referência").add_argument(
+        "--nome", help="nome do índice de referência (padrão: derivado da pasta)")
+    p = comando("arquivados", "lista o que já está no acervo de referência")
+    p.add_argument("--acervo", help="nome do índice de referência (padrão: o atualizado por último)")
+    p.add_argument("--quarentena", action="store_true", help="move os já arquivados para _JA_ARQUIVADOS")
+    return parser
+
+def _mover_lista(caminhos, pasta_destino, indice, metricas, tarefa, progresso=None):
+    movidos, erros = 0, []
+    with metricas.etapa("mover"):
+        for i, caminho in enumerate(caminhos):
+            tarefa.checar()
+            if progresso and i % 20 == 0: progresso(i, len(caminhos), f"Movendo: {os.path.basename(caminho)}")
+            try:
+                mover_para_pasta(caminho, pasta_destino, indice)
+                movidos += 1
+                metricas.contar()
+            except OSError as e:
+                metricas.erro(e, caminho)
+                erros.append({"caminho": caminho, "erro": str(e)})
+    return {"movidos": movidos, "erros_mover": erros}
+
+def executar_comando_cli(args, saida, tarefa=None):
+    """Executa um subcomando; devolve (dados do resultado, código de saída).
+
+    As métricas por etapa entram no resultado e no relatório gravado em
+    .pendrive_manager/relatorios (com o arquivo do Prometheus, se pedido).
+    """
+    indice = IndiceMidia(args.pasta)
+    metricas = saida.metricas = MetricasExecucao(args.comando, indice.pasta_base)
+    try:
+        dados, codigo = _executar_comando(args, saida, indice, metricas, tarefa or Tarefa())
+    except TarefaCancelada:
+        metricas.cancelada = True
+        raise
+    finally:
+        relatorio = metricas.gravar(indice.caminho_dados("relatorios"), args.prometheus or EXPORTAR_PROMETHEUS)
+        indice.fechar()
+    dados["metricas"] = metricas.como_dict()["etapas"]
+    dados["relatorio"] = relatorio
+    return dados, codigo
+
+def _executar_comando(args, saida, indice, metricas, tarefa):
+    total = indice.sincronizar(lambda t: saida.progresso(t, 0, "Indexando"), metricas, tarefa, args.completo)
+    lixeira = os.path.join(indice.pasta_base, "_LIXEIRA_SEGURA")
+    progresso = saida.progresso
+    dados, codigo = {}, SAIDA_OK
+
+    if args.comando == "scan":
+        dados = {"total": total, "fotos": len(indice.caminhos("foto")), "videos": len(indice.caminhos("video"))}
+    elif args.comando == "organizar":
+        if args.retomar and DiarioMovimentos(indice.pasta_base).ler()[0] != "pendente":
+            return {"mensagem": "não há organização interrompida para retomar"}, SAIDA_FALHA
+        movidos, erros = organizar_pasta(indice, args.perfil, progresso, args.retomar, metricas, tarefa)
+        dados = {"movidos": movidos, "erros": erros}
+        codigo = SAIDA_ENCONTROU if erros else SAIDA_OK
+    elif args.comando == "importar":
+        if args.retomar and DiarioImportacao(indice.pasta_base).ler()[0] != "pendente":
+            return {"mensagem": "não há importação interrompida para retomar"}, SAIDA_FALHA
+        if not args.retomar and not (args.de and os.path.isdir(args.de)):
+            return {"mensagem": "informe a pasta do cartão com --de"}, SAIDA_USO
+        resultado = importar_midias(args.de, indice, args.perfil, progresso, args.retomar, metricas, tarefa)
+        resultado["erros"] = [{"caminho": p, "erro": e} for p, e in resultado["erros"]]
+        dados = resultado
+        codigo = SAIDA_ENCONTROU if resultado["erros"] else SAIDA_OK
+    elif args.comando == "desfazer":
+        with metricas.etapa("movimentos"):
+            desfeito = desfazer_organizacao(indice.pasta_base, indice, progresso, metricas, tarefa)
+        if desfeito is None:
+            return {"mensagem": "não há organização recente para desfazer"}, SAIDA_FALHA
+        restaurados, erros = desfeito
+        dados = {"restaurados": restaurados, "erros": erros}
+        codigo = SAIDA_ENCONTROU if erros else SAIDA_OK
+    elif args.comando == "lixo":
+        encontrados = buscar_lixo(indice, metricas, args.perfil, progresso, tarefa, not args.so_nomes)
+        dados = {"encontrados": [{"caminho": p, "motivo": m} for p, m in encontrados]}
+        if args.mover:
+            dados.update(_mover_lista([p for p, _ in encontrados], os.path.join(indice.pasta_base, "_REVISAO_RAPIDA"),
+                                      indice, metricas, tarefa))
+        codigo = SAIDA_ENCONTROU if encontrados else SAIDA_OK
+    elif args.comando == "integridade":
+        suspeitos = buscar_corrompidos(indice, "profundo" if args.profundo else "rapido", progresso, metricas, tarefa)
+        dados = {"nivel": "profundo" if args.profundo else "rapido",
+                 "corrompidos": [{"caminho": p, "erro": r} for p, r in suspeitos]}
+        if args.mover: dados.update(_mover_lista([p for p, _ in suspeitos], lixeira, indice, metricas, tarefa))
+        codigo = SAIDA_ENCONTROU if suspeitos else SAIDA_OK
+    elif args.comando in ("duplicatas", "parecidas"):
+        if args.comando == "duplicatas":
+            grupos, stats = buscar_duplicatas(indice, args.perfil, progresso, metricas, tarefa)
+            dados = {"algoritmo": ALGORITMO_HASH, "estatisticas": stats}
+        else:
+            grupos = buscar_parecidas(indice, args.perfil, progresso, metricas, tarefa)
+        dados["grupos"] = grupos
+        if getattr(args, "ligar", None):
+            dedup = deduplicar_grupos(grupos, indice, args.tipo_link, progresso, metricas, tarefa)
+            dedup["erros"] = [{"caminho": p, "erro": e} for p, e in dedup["erros"]]
+            dados["ligados"] = dedup
+        if args.mover: dados.update(_mover_lista([p for g in grupos for p in g[1:]], lixeira, indice, metricas, tarefa))
+        codigo = SAIDA_ENCONTROU if grupos else SAIDA_OK
+    elif args.comando == "acervo":
+        referencia = IndiceReferencia(args.nome or IndiceReferencia.nome_para(indice.pasta_base))
+        try:
+            dados = {"acervo": referencia.nome, "arquivos": referencia.atualizar(indice, args.perfil, progresso, metricas, tarefa)}
+        finally:
+            referencia.fechar()
+    elif args.comando == "arquivados":
+        existentes = IndiceReferencia.listar()
+        nome = args.acervo or (existentes[0] if existentes else None)
+        if nome not in existentes:
+            return {"mensagem": "acervo de referência não encontrado; crie com o comando 'acervo'",
+                    "acervos": existentes}, SAIDA_FALHA
+        referencia = IndiceReferencia(nome)
+        try:
+            arquivados = buscar_arquivados(indice, referencia, args.perfil, progresso, metricas, tarefa)
+        except ValueError as e:
+            return {"mensagem": str(e)}, SAIDA_FALHA
+        finally:
+            referencia.fechar()
+        dados = {"acervo": nome, "arquivados": [{"caminho": p, "no_acervo": a} for p, a in arquivados]}
+        if args.quarentena:
+            dados.update(_mover_lista([p for p, _ in arquivados], os.path.join(indice.pasta_base, "_JA_ARQUIVADOS"),
+                                      indice, metricas, tarefa))
+        codigo = SAIDA_ENCONTROU if arquivados else SAIDA_OK
+    elif args.comando == "auditoria":
+        relatorio = auditoria_completa(indice, "rapido" if args.rapido else "profundo", args.perfil, progresso,
+                                       metricas, tarefa)
+        dados = dict(relatorio, corrompidos=[{"caminho": p, "erro": r} for p, r in relatorio["corrompidos"]],
+                     lixo=[{"caminho": p, "motivo": m} for p, m in relatorio["lixo"]])
+        codigo = SAIDA_ENCONTROU if relatorio["duplicatas"] or relatorio["corrompidos"] or relatorio["lixo"] else SAIDA_OK
+    elif args.comando == "galeria":
+        if not gerar_html_galeria(indice.pasta_base, indice.caminhos("foto"), progresso, metricas=metricas, tarefa=tarefa):
+            return {"mensagem": "não foi possível gerar a galeria"}, SAIDA_FALHA
+        dados = {"arquivo": os.path.join(indice.pasta_base, "Galeria_Arquivos.html")}
+    return dados, codigo
+
+def main_cli(argv=None):
+    args = criar_parser_cli().parse_args(argv)  # Uso incorreto: argparse sai com código 2
+    pasta = os.path.abspath(args.pasta)
+    saida = SaidaCLI(args.formato, args.comando, pasta)
+    if not os.path.isdir(pasta):
+        saida.resultado({"mensagem": "pasta não encontrada"}, ok=False)
+        return SAIDA_FALHA
+    # Ctrl+C/SIGTERM cancelam no próximo ponto seguro (nunca no meio de um movimento)
+    tarefa = Tarefa()
+    for sinal in (signal.SIGINT, getattr(signal, "SIGTERM", None)):
+        if sinal is not None: signal.signal(sinal, lambda *_: tarefa.cancelar())
+    inicio = time.perf_counter()
+    try:
+        dados, codigo = executar_comando_cli(args, saida, tarefa)
+    except TarefaCancelada:
+        saida.resultado({"cancelado": True, "mensagem": "cancelado; o trabalho já feito será aproveitado na próxima execução",
+                         "duracao_s": round(time.perf_counter() - inicio, 3)}, ok=False, evento="cancelado")
+        return SAIDA_CANCELADA
+    except Exception as e:
+        saida.resultado({"mensagem": f"{type(e).__name__}: {e}"}, ok=False)
+        return SAIDA_FALHA
+    dados["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    saida.resultado(dados, ok=codigo != SAIDA_FALHA)
+    return codigo
+
+# --- CANAL DE PROGRESSO (TRABALHADORES -> TELA) ---
+
+class CanalProgresso:
+    """Guarda apenas o último estado de progresso publicado pelas threads de trabalho.
+
+    publicar() só troca uma referência (atribuição atômica no CPython): quem
+    trabalha nunca espera pela interface nem enfileira callbacks no Tk. A tela
+    lê o canal em intervalo fixo e os estados intermediários são descartados.
+    Feito para um único leitor (a thread do Tk).
+    """
+
+    def __init__(self):
+        self._estado = None
+        self._lido = None
+
+    def publicar(self, *estado):
+        self._estado = estado
+
+    def ler_novo(self):
+        """Estado mais recente ainda não lido, ou None se nada mudou desde a última leitura."""
+        estado = self._estado
+        if estado is self._lido: return None
+        self._lido = estado
+        return estado
+
+    def limpar(self):
+        self._estado = self._lido = None
 
 # --- CLASSE PRINCIPAL ---
 
@@ -161,6 +3285,14 @@ class PendriveManagerApp:
         self.total_analisado = 0
         self.lista_arquivos_global = []
         self.fila_limpeza = [] # Nova lista para limpeza
+        self.motivos_lixo = {} # caminho -> motivo (regra de nome ou conteúdo)
+        self.indice = None # Índice persistente (SQLite) da pasta atual
+        self.miniaturas = None # Cache de miniaturas das janelas de revisão
+        self.perfil_disco = PERFIL_PADRAO # Perfil de leitura (ver PERFIS_DISCO)
+        self.metricas = None # Métricas da operação em andamento (mostradas na tela de progresso)
+        self.canal = CanalProgresso() # Progresso publicado pelas threads, lido pela tela em intervalo fixo
+        self.tarefa = None # Controle de pausa/cancelamento da operação em andamento
+        self.root.protocol("WM_DELETE_WINDOW", self.fechar_janela)
         
         # Variáveis de Operação
         self.processando = False
@@ -168,6 +3300,7 @@ class PendriveManagerApp:
         self.total_erros = 0
         
         self.tela_boas_vindas()
+        self.root.after(INTERVALO_TELA_MS, self._pintar_progresso)
 
     def limpar_tela(self):
         for widget in self.root.winfo_children():
@@ -204,7 +3337,7 @@ class PendriveManagerApp:
     # =========================================================================
     # TELA 2: SCANNING
     # =========================================================================
-    def tela_loading_inicial(self):
+    def tela_loading_inicial(self, completo=False):
         self.limpar_tela()
         
         frame = tk.Frame(self.root, bg=COR_FUNDO)
@@ -212,6 +3345,7 @@ class PendriveManagerApp:
 
         tk.Label(frame, text="ANALISANDO MÍDIA...", font=FONTE_TITULO, fg=COR_TEXTO, bg=COR_FUNDO).pack(pady=20)
         
+        self.canal.limpar()
         self.lbl_status_load = tk.Label(frame, text="Lendo estrutura de diretórios...", font=("Consolas", 11), fg=COR_DESTAQUE, bg=COR_FUNDO)
         self.lbl_status_load.pack(pady=10)
 
@@ -219,23 +3353,35 @@ class PendriveManagerApp:
         self.progress_load.pack(pady=20)
         self.progress_load.start(10)
 
-        threading.Thread(target=self.thread_scan_inicial).start()
+        self.tarefa = Tarefa()
+        tk.Button(frame, text="CANCELAR", bg="#333", fg="#ccc", relief="flat", font=("Segoe UI", 8, "bold"),
+                  width=12, command=self.cancelar_tarefa).pack(pady=10)
+
+        threading.Thread(target=self.thread_scan_inicial, args=(completo,)).start()
 
-    def thread_scan_inicial(self):
-        arquivos = []
+    def thread_scan_inicial(self, completo=False):
+        # Varredura única: as demais operações consultam o índice em vez de percorrer a pasta
+        if self.indice: self.indice.fechar()
+        self.indice = IndiceMidia(self.pasta_alvo)
+        self.miniaturas = CacheMiniaturas(self.indice.caminho_dados("miniaturas"))
+        metricas = self.iniciar_metricas("scan")
         try:
-            for root, dirs, files in os.walk(self.pasta_alvo):
-                for file in files:
-                    # Agora verifica TODAS as extensões (Foto + Video)
-                    if os.path.splitext(file)[1].lower() in EXTENSOES_TODAS:
-                        arquivos.append(os.path.join(root, file))
-                        if len(arquivos) % 100 == 0:
-                            self.root.after(0, lambda t=len(arquivos): self.lbl_status_load.config(text=f"Indexando: {t} arquivos encontrados"))
-        except: pass
+            self.total_analisado = self.indice.sincronizar(
+                lambda t: self.canal.publicar(t, 0, f"Indexando: {t} arquivos encontrados"), metricas, self.tarefa,
+                completo)
+        except TarefaCancelada:
+            # O que já foi indexado fica gravado; a próxima abertura só completa o resto
+            metricas.cancelada = True
+            self.finalizar_metricas()
+            self.chamar_na_tela(self.tela_boas_vindas)
+            return
+        except (OSError, sqlite3.Error) as e:
+            metricas.erro(e, self.pasta_alvo)
+            self.total_analisado = self.indice.total()
+        self.finalizar_metricas()
         
-        self.total_analisado = len(arquivos)
         time.sleep(0.8) # Pequeno delay para UX
-        self.root.after(0, self.tela_dashboard)
+        self.chamar_na_tela(self.tela_dashboard)
 
     # =========================================================================
     # TELA 3: DASHBOARD
@@ -263,6 +3409,15 @@ class PendriveManagerApp:
         tk.Label(stats, text="MÍDIAS\nIDENTIFICADAS", font=("Segoe UI", 10, "bold"), fg="#555", bg=COR_FUNDO, justify=tk.LEFT).pack(side=tk.LEFT, padx=20)
         
         tk.Button(stats, text="TROCAR PASTA", bg="#333", fg="#ccc", relief="flat", font=("Segoe UI", 8), command=self.tela_boas_vindas).pack(side=tk.RIGHT)
+        tk.Button(stats, text="REESCANEAR TUDO", bg="#333", fg="#ccc", relief="flat", font=("Segoe UI", 8),
+                  command=lambda: self.tela_loading_inicial(completo=True)).pack(side=tk.RIGHT, padx=(0, 10))
+        self.btn_perfil = tk.Button(stats, text=f"DISCO: {PERFIS_DISCO[self.perfil_disco]['nome']}", bg="#333", fg="#ccc",
+                                    relief="flat", font=("Segoe UI", 8), command=self.alternar_perfil_disco)
+        self.btn_perfil.pack(side=tk.RIGHT, padx=10)
+        tk.Button(stats, text="IMPORTAR CARTÃO", bg=COR_SUCESSO, fg="white", relief="flat", font=("Segoe UI", 8, "bold"),
+                  command=self.iniciar_importacao).pack(side=tk.RIGHT, padx=(0, 10))
+        tk.Button(stats, text="AUDITORIA COMPLETA", bg=COR_DESTAQUE, fg="white", relief="flat", font=("Segoe UI", 8, "bold"),
+                  command=self.iniciar_auditoria).pack(side=tk.RIGHT)
 
         # GRID DE FUNÇÕES
         grid = tk.Frame(container, bg=COR_FUNDO)
@@ -275,13 +3430,23 @@ class PendriveManagerApp:
         
         # Linha 2
         self.criar_card(grid, 1, 0, "GERENCIAR LIXEIRA", "Recuperar itens ou esvaziar tudo", "🗑️", COR_ALERTA, self.gerenciar_lixeira)
-        self.criar_card(grid, 1, 1, "VERIFICAR CORROMPIDOS", "Detecta imagens quebradas", "🛡️", "#FFC107", self.iniciar_corrupcao)
+        self.criar_card(grid, 1, 1, "VERIFICAR CORROMPIDOS", "Detecta fotos e vídeos quebrados", "🛡️", "#FFC107", self.iniciar_corrupcao)
         self.criar_card(grid, 1, 2, "CRIAR GALERIA VISUAL", "Gera um site offline para ver as fotos", "🌐", COR_INFO, self.iniciar_galeria)
         
+        # Linha 3
+        self.criar_card(grid, 2, 0, "FOTOS PARECIDAS", "Recompressões do WhatsApp e cópias redimensionadas", "👯", "#FD7E14", self.iniciar_parecidas)
+        self.criar_card(grid, 2, 1, "DESFAZER ORGANIZAÇÃO", "Devolve os arquivos às pastas originais", "↩️", "#6C757D", self.iniciar_desfazer)
+        self.criar_card(grid, 2, 2, "JÁ ARQUIVADO?", "Confere com o acervo mestre e separa o que já existe", "🗄️", "#20C997", self.iniciar_acervo)
+        
         # Footer Log
         self.lbl_log = tk.Label(self.root, text="Aguardando ação do usuário...", bg=COR_FUNDO, fg="#444", font=("Consolas", 9))
         self.lbl_log.pack(side=tk.BOTTOM, pady=15)
 
+    def alternar_perfil_disco(self):
+        perfis = list(PERFIS_DISCO)
+        self.perfil_disco = perfis[(perfis.index(self.perfil_disco) + 1) % len(perfis)]
+        self.btn_perfil.config(text=f"DISCO: {PERFIS_DISCO[self.perfil_disco]['nome']}")
+
     def criar_card(self, parent, row, col, titulo, desc, icone, cor, comando):
         frame = tk.Frame(parent, bg=COR_PAINEL, padx=20, pady=20)
         tk.Frame(frame, bg=cor, width=4).pack(side=tk.LEFT, fill=tk.Y, padx=(0, 15))
@@ -303,6 +3468,22 @@ class PendriveManagerApp:
     # FUNÇÕES LÓGICAS
     # =========================================================================
 
+    def mostrar_miniatura(self, label, caminho, tamanho, ao_falhar):
+        """Exibe a miniatura pré-carregada; se ainda não estiver pronta, aguarda sem travar a tela."""
+        img = self.miniaturas.obter_pronta(caminho, tamanho)
+        label.caminho_pendente = caminho
+        if img is None:
+            self.miniaturas.priorizar(caminho, tamanho)
+            label.config(image="", text="Carregando...", fg="#555")
+            label.after(30, lambda: label.winfo_exists() and label.caminho_pendente == caminho
+                        and self.mostrar_miniatura(label, caminho, tamanho, ao_falhar))
+            return
+        if img is FALHA_MINIATURA:
+            ao_falhar()
+            return
+        label.foto = ImageTk.PhotoImage(img)  # Referência no widget para o Tk não descartar a imagem
+        label.config(image=label.foto, text="")
+
     def abrir_arquivo_externo(self, caminho):
         """Abre o arquivo no visualizador padrão do sistema (Windows/Linux/Mac)."""
         try:
@@ -315,97 +3496,118 @@ class PendriveManagerApp:
         except Exception as e:
             messagebox.showerror("Erro ao Abrir", f"Não foi possível abrir o arquivo:\n{e}")
 
+    def iniciar_metricas(self, operacao):
+        self.metricas = MetricasExecucao(operacao, self.pasta_alvo)
+        return self.metricas
+
+    def finalizar_metricas(self):
+        """Grava o relatório da operação atual e devolve uma linha para a mensagem final."""
+        metricas, self.metricas = self.metricas, None
+        if metricas is None or self.indice is None: return ""
+        relatorio = metricas.gravar(self.indice.caminho_dados("relatorios"))
+        erros = metricas.total_erros()
+        texto = f"\n\nTempo: {metricas.como_dict()['duracao_s']:.1f} s • {erros} erros registrados"
+        if relatorio: texto += f"\nRelatório: {relatorio}"
+        return texto
+
     def mover_seguro(self, origem, destino_custom=None):
-        if destino_custom:
-            pasta_lixo = destino_custom
-        else:
-            pasta_lixo = os.path.join(self.pasta_alvo, "_LIXEIRA_SEGURA")
-            
-        if not os.path.exists(pasta_lixo): os.makedirs(pasta_lixo)
-        
-        nome = os.path.basename(origem)
-        destino = os.path.join(pasta_lixo, nome)
-        
-        c = 1
-        while os.path.exists(destino):
-            n, e = os.path.splitext(nome)
-            destino = os.path.join(pasta_lixo, f"{n}_copy{c}{e}")
-            c += 1
-            
-        shutil.move(origem, destino)
+        pasta_lixo = destino_custom or os.path.join(self.pasta_alvo, "_LIXEIRA_SEGURA")
+        mover_para_pasta(origem, pasta_lixo, self.indice)
 
     # --- 1. ORGANIZAR ---
     def iniciar_organizacao(self):
+        diario = DiarioMovimentos(self.pasta_alvo)
+        estado, plano, feitos = diario.ler()
+        if estado == "pendente":
+            msg = (f"Uma organização anterior foi interrompida ({len(feitos)} de {len(plano)} arquivos movidos).\n\n"
+                   "Deseja RETOMAR de onde parou?")
+            if messagebox.askyesno("Organização Interrompida", msg):
+                self.mostrar_progresso("Retomando organização...")
+                threading.Thread(target=self.thread_organizacao, args=(True,)).start()
+                return
         aviso = "Isso irá organizar seus arquivos na estrutura:\n\n📁 ANO\n  └── 📁 Fotos\n  └── 📁 Videos\n\nDeseja continuar?"
         if not messagebox.askyesno("Organização Profunda", aviso): return
         self.mostrar_progresso("Organizando arquivos e vídeos...")
         threading.Thread(target=self.thread_organizacao).start()
 
-    def thread_organizacao(self):
-        movidos = 0
-        erros = 0
-        ignorar = ["_LIXEIRA_SEGURA", "_SUSPEITOS", "_REVISAO_RAPIDA"]
-        
-        arquivos = []
-        # Coleta inicial
-        for root, d, files in os.walk(self.pasta_alvo):
-            if any(x in root for x in ignorar): continue
-            for f in files:
-                if os.path.splitext(f)[1].lower() in EXTENSOES_TODAS:
-                    arquivos.append(os.path.join(root, f))
-        
-        total = len(arquivos)
-        for i, path in enumerate(arquivos):
-            self.update_progresso(i, total, f"Organizando: {os.path.basename(path)}")
-            try:
-                ano = obter_data_arquivo(path)
-                if ano == "Indeterminado": continue
-                
-                # Definir Subpasta (Fotos ou Videos)
-                ext = os.path.splitext(path)[1].lower()
-                subpasta_tipo = "Outros"
-                
-                if ext in EXTENSOES_FOTO:
-                    subpasta_tipo = "Fotos"
-                elif ext in EXTENSOES_VIDEO:
-                    subpasta_tipo = "Videos"
-                
-                # Cria a estrutura: PASTA_ALVO / ANO / TIPO
-                dest_dir = os.path.join(self.pasta_alvo, ano, subpasta_tipo)
-                
-                # Se arquivo já está no lugar certo, pula
-                pasta_atual = os.path.dirname(path)
-                if os.path.abspath(pasta_atual) == os.path.abspath(dest_dir):
-                    continue
+    def thread_organizacao(self, retomar=False):
+        try:
+            movidos, erros = organizar_pasta(self.indice, self.perfil_disco, self.update_progresso, retomar,
+                                             self.iniciar_metricas("organizar"), self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Organização interrompida.\n\nOs arquivos já movidos estão registrados no diário: "
+                                  "use 'ORGANIZAR' para continuar de onde parou ou 'DESFAZER ORGANIZAÇÃO' para voltar.")
+            return
+        
+        msg = f"Organização Completa!\n\n{movidos} arquivos movidos para pastas de Anos e Categorias."
+        if erros: msg += f"\n{erros} arquivos não puderam ser movidos."
+        msg += "\n\nUse 'DESFAZER ORGANIZAÇÃO' para voltar tudo ao lugar."
+        msg += self.finalizar_metricas()
+        self.chamar_na_tela(lambda: self.fim_processo(msg))
 
-                if not os.path.exists(dest_dir): os.makedirs(dest_dir)
-                
-                nome = os.path.basename(path)
-                dest = os.path.join(dest_dir, nome)
-                
-                # Renomear se já existe para não sobrescrever
-                c = 1
-                while os.path.exists(dest):
-                    n, e = os.path.splitext(nome)
-                    dest = os.path.join(dest_dir, f"{n}_{c}{e}")
-                    c += 1
-                
-                shutil.move(path, dest)
-                movidos += 1
-            except: erros += 1
-            
-        # Limpar pastas vazias
-        for r, d, f in os.walk(self.pasta_alvo, topdown=False):
-            for name in d:
-                try: os.rmdir(os.path.join(r, name))
-                except: pass
-                
-        self.fim_processo(f"Organização Completa!\n\n{movidos} arquivos movidos para pastas de Anos e Categorias.")
+    def iniciar_importacao(self):
+        estado, plano, feitos = DiarioImportacao(self.pasta_alvo).ler()
+        if estado == "pendente":
+            msg = (f"Uma importação anterior foi interrompida ({len(feitos)} de {len(plano)} arquivos copiados).\n\n"
+                   "Deseja RETOMAR de onde parou? (o cartão precisa estar conectado)")
+            if messagebox.askyesno("Importação Interrompida", msg):
+                self.mostrar_progresso("Retomando importação...")
+                threading.Thread(target=self.thread_importacao, args=(None, True)).start()
+                return
+        origem = filedialog.askdirectory(title="Pasta do cartão (origem das fotos e vídeos)")
+        if not origem: return
+        aviso = (f"Copiar as fotos e vídeos de:\n{origem}\n\ndireto para a estrutura:\n\n📁 ANO\n  └── 📁 Fotos\n  └── 📁 Videos\n\n"
+                 "Cada cópia é conferida pelo hash e o que já existe aqui não é copiado de novo. "
+                 "O cartão não é alterado. Deseja continuar?")
+        if not messagebox.askyesno("Importar Cartão", aviso): return
+        self.mostrar_progresso("Importando do cartão...")
+        threading.Thread(target=self.thread_importacao, args=(origem,)).start()
+
+    def thread_importacao(self, origem, retomar=False):
+        try:
+            resultado = importar_midias(origem, self.indice, self.perfil_disco, self.update_progresso, retomar,
+                                        self.iniciar_metricas("importar"), self.tarefa)
+        except TarefaCancelada:
+            self.total_analisado = self.indice.total()
+            self.tarefa_cancelada("Importação interrompida.\n\nAs cópias já conferidas ficam; use 'IMPORTAR CARTÃO' "
+                                  "com o cartão conectado para continuar de onde parou.")
+            return
+        self.total_analisado = self.indice.total()
+        msg = (f"Importação Completa!\n\n{resultado['copiados']} arquivos copiados ({formatar_bytes(resultado['bytes'])}) "
+               f"e conferidos.\n{resultado['ja_existentes']} já estavam aqui e foram pulados.")
+        if resultado["erros"]: msg += f"\n{len(resultado['erros'])} arquivos não puderam ser copiados."
+        msg += self.finalizar_metricas()
+        self.chamar_na_tela(lambda: self.fim_processo(msg))
+
+    def iniciar_desfazer(self):
+        estado, plano, feitos = DiarioMovimentos(self.pasta_alvo).ler()
+        if estado not in ("fim", "pendente") or not feitos:
+            messagebox.showinfo("Desfazer", "Não há organização recente para desfazer.")
+            return
+        if not messagebox.askyesno("Desfazer Organização", f"Devolver {len(feitos)} arquivos às pastas originais?"): return
+        self.mostrar_progresso("Desfazendo organização...")
+        threading.Thread(target=self.thread_desfazer).start()
+
+    def thread_desfazer(self):
+        metricas = self.iniciar_metricas("desfazer")
+        try:
+            with metricas.etapa("movimentos"):
+                restaurados, erros = desfazer_organizacao(self.pasta_alvo, self.indice, self.update_progresso,
+                                                          metricas, self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Desfazer interrompido.\n\nOs arquivos restantes continuam no diário: "
+                                  "use 'DESFAZER ORGANIZAÇÃO' de novo para terminar.")
+            return
+        msg = f"{restaurados} arquivos voltaram ao lugar original."
+        if erros: msg += f"\n{erros} não puderam ser restaurados (nome ocupado ou arquivo ausente)."
+        msg += self.finalizar_metricas()
+        self.chamar_na_tela(lambda: self.fim_processo(msg))
 
     # --- 2. NOVO: FAXINA INTELIGENTE (Detectar Lixo) ---
     def iniciar_limpeza_lixo(self):
         info = ("MODO FAXINA INTELIGENTE\n\n"
-                "Vou procurar apenas arquivos com nomes explícitos (WhatsApp, Print, Screenshot, etc).\n\n"
+                "Vou procurar arquivos com nomes de lixo (WhatsApp, Print, Screenshot, etc) e prints\n"
+                "renomeados (resolução de tela e sem dados de câmera).\n\n"
                 "Ao final, você poderá MOVER TUDO para uma pasta separada para revisar em lote.\n"
                 "Deseja iniciar?")
         if not messagebox.askyesno("Faxina", info): return
@@ -414,40 +3616,21 @@ class PendriveManagerApp:
         threading.Thread(target=self.thread_scan_lixo).start()
 
     def thread_scan_lixo(self):
-        self.fila_limpeza = []
-        termos_suspeitos = ["whatsapp", "screenshot", "screen", "captura", "print", "telegram", "facebook", "instagram", "download", "received"]
-        
-        arquivos = []
-        for r, d, f in os.walk(self.pasta_alvo):
-            if "_LIXEIRA" in r: continue
-            
-            # Se a PASTA tem nome suspeito
-            pasta_lower = r.lower()
-            eh_pasta_suspeita = any(t in pasta_lower for t in termos_suspeitos)
-            
-            for file in f:
-                nome_lower = file.lower()
-                ext = os.path.splitext(file)[1].lower()
-                
-                if ext in EXTENSOES_FOTO:
-                    # REMOVIDO: Critério de tamanho sozinho (era o que pegava suas fotos pessoais)
-                    
-                    # Critério 1: Nome do arquivo (mais seguro)
-                    tem_nome_lixo = any(t in nome_lower for t in termos_suspeitos) or "wa0" in nome_lower
-                    
-                    # Só adiciona se o NOME for explicitamente lixo ou se estiver numa pasta CLARAMENTE de lixo (ex: WhatsApp Images)
-                    # Para evitar falsos positivos, vamos focar mais no nome do arquivo nesta versão segura.
-                    
-                    if tem_nome_lixo:
-                        arquivos.append(os.path.join(r, file))
-
-        self.fila_limpeza = arquivos
-        self.root.after(0, self.abrir_revisor_lixo)
+        try:
+            encontrados = buscar_lixo(self.indice, self.iniciar_metricas("lixo"), self.perfil_disco,
+                                      self.update_progresso, self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Faxina cancelada.\n\nAs fotos já analisadas ficam no cache e não serão lidas de novo.")
+            return
+        self.fila_limpeza = [p for p, _ in encontrados]
+        self.motivos_lixo = dict(encontrados)
+        self.finalizar_metricas()
+        self.chamar_na_tela(self.abrir_revisor_lixo)
 
     def abrir_revisor_lixo(self):
         self.tela_dashboard()
         if not self.fila_limpeza:
-            messagebox.showinfo("Limpo", "Não encontrei arquivos com nomes suspeitos (WhatsApp/Print).")
+            messagebox.showinfo("Limpo", "Não encontrei arquivos suspeitos (WhatsApp/Print).")
             return
             
         self.idx_lixo = 0
@@ -502,22 +3685,21 @@ class PendriveManagerApp:
             return
             
         path = self.fila_limpeza[self.idx_lixo]
-        self.lbl_lixo_nome.config(text=f"({self.idx_lixo + 1}/{len(self.fila_limpeza)}) {os.path.basename(path)}")
+        self.lbl_lixo_nome.config(text=f"({self.idx_lixo + 1}/{len(self.fila_limpeza)}) {os.path.basename(path)}"
+                                       f"  [{self.motivos_lixo.get(path, '?')}]")
         
-        try:
-            img = Image.open(path)
-            # Redimensionar para caber na tela mantendo proporção
-            img.thumbnail((800, 500))
-            self.tk_lixo = ImageTk.PhotoImage(img)
-            self.lbl_lixo_img.config(image=self.tk_lixo)
-        except:
-            self.lbl_lixo_img.config(image="", text="Erro ao carregar imagem", fg="white")
+        # Redimensionar para caber na tela mantendo proporção (preparado em segundo plano)
+        proximos = self.fila_limpeza[self.idx_lixo:self.idx_lixo + 1 + PREFETCH_MINIATURAS]
+        self.miniaturas.prefetch(proximos, (800, 500))
+        self.mostrar_miniatura(self.lbl_lixo_img, path, (800, 500),
+                               lambda: self.lbl_lixo_img.config(image="", text="Erro ao carregar imagem", fg="white"))
 
     def acao_jogar_lixo(self):
         path = self.fila_limpeza[self.idx_lixo]
         try:
             self.mover_seguro(path) # Move para pasta segura padrao
-        except: pass
+        except OSError as e:
+            self.lbl_log.config(text=f"Não foi possível mover {os.path.basename(path)}: {e}")
         self.idx_lixo += 1
         self.carregar_img_lixo()
 
@@ -535,7 +3717,7 @@ class PendriveManagerApp:
         if not os.path.exists(pasta_destino): os.makedirs(pasta_destino)
         
         restantes = self.fila_limpeza[self.idx_lixo:]
-        count = 0
+        count = erros = 0
         
         self.win.destroy()
         self.mostrar_progresso("Movendo arquivos para revisão em lote...")
@@ -544,41 +3726,41 @@ class PendriveManagerApp:
             try:
                 self.mover_seguro(item, destino_custom=pasta_destino)
                 count += 1
-            except: pass
+            except OSError:
+                erros += 1
             
-        self.fim_processo(f"{count} arquivos movidos para '_REVISAO_RAPIDA'.\nAbra a pasta para deletar o que não quiser.")
+        msg = f"{count} arquivos movidos para '_REVISAO_RAPIDA'.\nAbra a pasta para deletar o que não quiser."
+        if erros: msg += f"\n{erros} arquivos não puderam ser movidos."
+        self.fim_processo(msg)
         os.startfile(pasta_destino)
 
     # --- 3. CORROMPIDOS ---
     def iniciar_corrupcao(self):
-        self.mostrar_progresso("Verificando integridade das imagens...")
-        threading.Thread(target=self.thread_corrupcao).start()
-
-    def thread_corrupcao(self):
-        self.suspeitos = []
-        arquivos = []
-        for r, d, f in os.walk(self.pasta_alvo):
-            if "_LIXEIRA" in r: continue
-            for file in f:
-                # Verifica APENAS fotos, pois PIL não valida vídeos
-                if os.path.splitext(file)[1].lower() in EXTENSOES_FOTO:
-                    arquivos.append(os.path.join(r, file))
-        
-        total = len(arquivos)
-        for i, p in enumerate(arquivos):
-            self.update_progresso(i, total, f"Testando: {os.path.basename(p)}")
-            try:
-                img = Image.open(p)
-                img.verify() # Verifica estrutura do arquivo
-            except Exception as e:
-                self.suspeitos.append((p, str(e)))
-        
-        self.root.after(0, self.abrir_audit_corrupt)
+        info = ("VERIFICAR CORROMPIDOS\n\n"
+                "SIM = Verificação PROFUNDA (decodifica a imagem, pega JPEGs cortados pela metade)\n"
+                "NÃO = Verificação RÁPIDA (apenas a estrutura do arquivo)\n\n"
+                "Vídeos MP4/MOV/MKV/WebM têm a estrutura conferida nos dois modos (pega cópias cortadas).\n"
+                "Arquivos já aprovados antes não são testados novamente.")
+        resposta = messagebox.askyesnocancel("Modo de Verificação", info)
+        if resposta is None: return
+        nivel = "profundo" if resposta else "rapido"
+        self.mostrar_progresso("Verificando integridade das fotos e vídeos...")
+        threading.Thread(target=self.thread_corrupcao, args=(nivel,)).start()
+
+    def thread_corrupcao(self, nivel="rapido"):
+        try:
+            self.suspeitos = buscar_corrompidos(self.indice, nivel, self.update_progresso,
+                                                self.iniciar_metricas("integridade"), self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Verificação cancelada.\n\nOs arquivos já aprovados ficam no cache e não serão testadas de novo.")
+            return
+        self.finalizar_metricas()
+        self.chamar_na_tela(self.abrir_audit_corrupt)
 
     def abrir_audit_corrupt(self):
         self.tela_dashboard()
         if not self.suspeitos:
-            messagebox.showinfo("Tudo Certo", "Nenhuma imagem corrompida encontrada.")
+            messagebox.showinfo("Tudo Certo", "Nenhuma foto ou vídeo corrompido encontrado.")
             return
             
         # Janela Audit
@@ -608,18 +3790,15 @@ class PendriveManagerApp:
         
         p, err = self.suspeitos[self.idx_audit]
         self.lbl_nome.config(text=f"{os.path.basename(p)}\nErro: {err}")
-        try:
-            # Tenta abrir novamente para ver se exibe algo, mesmo com erro
-            img = Image.open(p)
-            img.thumbnail((400, 400))
-            self.tk_img = ImageTk.PhotoImage(img)
-            self.lbl_prev.config(image=self.tk_img, text="")
-        except:
-            self.lbl_prev.config(image="", text="VISUALIZAÇÃO INDISPONÍVEL", fg="#555")
+        # Tenta abrir novamente para ver se exibe algo, mesmo com erro
+        proximos = [c for c, _ in self.suspeitos[self.idx_audit:self.idx_audit + 1 + PREFETCH_MINIATURAS]]
+        self.miniaturas.prefetch(proximos, (400, 400))
+        self.mostrar_miniatura(self.lbl_prev, p, (400, 400),
+                               lambda: self.lbl_prev.config(image="", text="VISUALIZAÇÃO INDISPONÍVEL", fg="#555"))
 
     def lixo_corrupt(self):
         try: self.mover_seguro(self.suspeitos[self.idx_audit][0])
-        except: pass
+        except OSError as e: self.lbl_log.config(text=f"Não foi possível mover: {e}")
         self.prox_corrupt()
 
     def prox_corrupt(self):
@@ -631,45 +3810,51 @@ class PendriveManagerApp:
         self.mostrar_progresso("Comparando assinaturas digitais (Hash)...")
         threading.Thread(target=self.thread_dup).start()
 
+    def iniciar_parecidas(self):
+        info = ("FOTOS PARECIDAS\n\n"
+                "Encontra a mesma foto salva várias vezes com qualidade ou tamanho diferentes "
+                "(ex: reenviadas pelo WhatsApp).\n\n"
+                "A versão MAIOR de cada grupo aparece como original. Deseja iniciar?")
+        if not messagebox.askyesno("Fotos Parecidas", info): return
+        self.mostrar_progresso("Comparando fotos visualmente...")
+        threading.Thread(target=self.thread_parecidas).start()
+
+    def thread_parecidas(self):
+        try:
+            self.dups = buscar_parecidas(self.indice, self.perfil_disco, self.update_progresso,
+                                         self.iniciar_metricas("parecidas"), self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Busca cancelada.\n\nAs assinaturas já calculadas ficam no cache e a próxima busca continua daí.")
+            return
+        self.finalizar_metricas()
+        self.stats_dup = None
+        self.chamar_na_tela(self.abrir_audit_dup)
+
     def thread_dup(self):
-        # 1. Size
-        by_size = {}
-        arquivos = []
-        for r, d, f in os.walk(self.pasta_alvo):
-            if "_LIXEIRA" in r: continue
-            for file in f:
-                if os.path.splitext(file)[1].lower() in EXTENSOES_TODAS:
-                    path = os.path.join(r, file)
-                    arquivos.append(path)
-                    try:
-                        sz = os.path.getsize(path)
-                        if sz not in by_size: by_size[sz] = []
-                        by_size[sz].append(path)
-                    except: pass
-        
-        # 2. Hash
-        candidatos = [l for l in by_size.values() if len(l) > 1]
-        hashes = {}
-        total = sum(len(l) for l in candidatos)
-        done = 0
-        
-        for group in candidatos:
-            for p in group:
-                done += 1
-                self.update_progresso(done, total, "Verificando conteúdo...")
-                h = calcular_hash_arquivo(p)
-                if h:
-                    if h not in hashes: hashes[h] = []
-                    hashes[h].append(p)
-                    
-        self.dups = [l for l in hashes.values() if len(l) > 1]
-        self.root.after(0, self.abrir_audit_dup)
+        try:
+            self.dups, self.stats_dup = buscar_duplicatas(self.indice, self.perfil_disco, self.update_progresso,
+                                                          self.iniciar_metricas("duplicatas"), self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Busca cancelada.\n\nOs hashes já calculados ficam no cache e a próxima busca continua daí.")
+            return
+        self.finalizar_metricas()
+        self.chamar_na_tela(self.abrir_audit_dup)
+
+    def resumo_stats_dup(self):
+        st = getattr(self, "stats_dup", None)
+        if not st: return ""
+        lido = st["lidos_parcial"] + st["lidos_completo"]
+        return (f"\n\nLeitura em disco ({ALGORITMO_HASH}): {formatar_bytes(lido)} de {formatar_bytes(st['bytes_total'])}\n"
+                f"• Evitado pelo tamanho: {formatar_bytes(st['evitados_tamanho'])}\n"
+                f"• Evitado pela amostragem: {formatar_bytes(st['evitados_parcial'])}\n"
+                f"• Hashes reaproveitados do índice: {st['reaproveitados']}")
 
     def abrir_audit_dup(self):
         self.tela_dashboard()
         if not self.dups:
-            messagebox.showinfo("Limpo", "Sem duplicatas encontradas.")
+            messagebox.showinfo("Limpo", "Sem duplicatas encontradas." + self.resumo_stats_dup())
             return
+        self.lbl_log.config(text=f"{len(self.dups)} grupos de duplicatas • {self.resumo_stats_dup().strip().splitlines()[0]}")
             
         self.idx_dup = 0
         self.win = tk.Toplevel(self.root)
@@ -705,6 +3890,10 @@ class PendriveManagerApp:
         btns.pack(fill=tk.X, pady=10)
         tk.Button(btns, text="MOVER CÓPIAS P/ LIXEIRA", bg=COR_ALERTA, fg="white", command=self.lixo_dup).pack(side=tk.LEFT, padx=50)
         tk.Button(btns, text="PULAR", bg="#555", fg="white", command=self.prox_dup).pack(side=tk.RIGHT, padx=50)
+        if self.stats_dup is not None:
+            # Só para duplicatas exatas: fotos "parecidas" nunca viram link
+            tk.Button(btns, text="LIGAR TODOS OS GRUPOS", bg=COR_INFO, fg="white", command=self.ligar_todos_dup).pack(side=tk.RIGHT, padx=10)
+            tk.Button(btns, text="SUBSTITUIR POR LINK", bg=COR_INFO, fg="white", command=self.ligar_dup).pack(side=tk.RIGHT, padx=10)
         
         self.load_dup()
 
@@ -717,37 +3906,236 @@ class PendriveManagerApp:
         self.path_orig.config(text=g[0])
         self.path_copy.config(text=g[1])
         
-        # Tenta mostrar preview se for imagem, se for video avisa
-        try:
-            if os.path.splitext(g[0])[1].lower() in EXTENSOES_FOTO:
-                img = Image.open(g[0])
-                img.thumbnail((350, 350))
-                self.tk_o = ImageTk.PhotoImage(img)
-                self.lbl_orig.config(image=self.tk_o, text="", cursor="hand2")
-            else:
-                self.lbl_orig.config(image="", text="🎥 VÍDEO\n(CLIQUE PARA ASSISTIR)", fg="white", font=("Segoe UI", 12, "bold"), cursor="hand2")
-        except: pass
+        # Pré-carrega as fotos dos próximos grupos enquanto o usuário decide
+        proximos = [c for grupo in self.dups[self.idx_dup:self.idx_dup + 1 + PREFETCH_MINIATURAS // 2] for c in grupo[:2]
+                    if os.path.splitext(c)[1].lower() in EXTENSOES_FOTO]
+        self.miniaturas.prefetch(proximos, (350, 350))
         
-        try:
-            if os.path.splitext(g[1])[1].lower() in EXTENSOES_FOTO:
-                img = Image.open(g[1])
-                img.thumbnail((350, 350))
-                self.tk_c = ImageTk.PhotoImage(img)
-                self.lbl_copy.config(image=self.tk_c, text="", cursor="hand2")
+        # Tenta mostrar preview se for imagem, se for video avisa
+        for caminho, label in ((g[0], self.lbl_orig), (g[1], self.lbl_copy)):
+            label.caminho_pendente = None
+            if os.path.splitext(caminho)[1].lower() in EXTENSOES_FOTO:
+                self.mostrar_miniatura(label, caminho, (350, 350), lambda l=label: l.config(image="", text=""))
             else:
-                self.lbl_copy.config(image="", text="🎥 VÍDEO\n(CLIQUE PARA ASSISTIR)", fg="white", font=("Segoe UI", 12, "bold"), cursor="hand2")
-        except: pass
+                label.config(image="", text="🎥 VÍDEO\n(CLIQUE PARA ASSISTIR)", fg="white", font=("Segoe UI", 12, "bold"), cursor="hand2")
 
     def lixo_dup(self):
         for p in self.dups[self.idx_dup][1:]:
             try: self.mover_seguro(p)
-            except: pass
+            except OSError as e: self.lbl_log.config(text=f"Não foi possível mover {os.path.basename(p)}: {e}")
         self.prox_dup()
         
     def prox_dup(self):
         self.idx_dup += 1
         self.load_dup()
 
+    def ligar_dup(self):
+        # A conferência byte a byte de vídeos grandes demora: roda fora da thread do Tk, com progresso e cancelamento.
+        # A revisão fica escondida até o grupo terminar, então não há duas comparações ao mesmo tempo.
+        grupo = self.dups[self.idx_dup]
+        self.win.withdraw()
+        self.mostrar_progresso("Substituindo cópias por links...")
+        threading.Thread(target=self.thread_ligar_dup, args=([grupo], True)).start()
+
+    def ligar_todos_dup(self):
+        restantes = self.dups[self.idx_dup:]
+        copias = sum(len(g) - 1 for g in restantes)
+        msg = (f"Substituir {copias} cópias de {len(restantes)} grupos por links para o original?\n\n"
+               "Cada cópia é conferida byte a byte antes. O espaço é liberado na hora, sem passar pela lixeira.")
+        if not messagebox.askyesno("Liberar Espaço", msg, parent=self.win): return
+        self.win.destroy()
+        self.mostrar_progresso("Substituindo cópias por links...")
+        threading.Thread(target=self.thread_ligar_dup, args=(restantes,)).start()
+
+    def thread_ligar_dup(self, grupos, revisando=False):
+        try:
+            resultado = deduplicar_grupos(grupos, self.indice, progresso=self.update_progresso,
+                                          metricas=self.iniciar_metricas("links"), tarefa=self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Substituição interrompida.\n\nAs cópias já trocadas continuam como links; as demais ficaram intactas.")
+            if revisando: self.chamar_na_tela(self.win.deiconify)
+            return
+        if revisando:
+            # Um grupo só: volta para a revisão no próximo grupo, sem caixa de diálogo
+            texto = self.texto_links(resultado)
+            self.finalizar_metricas()
+            self.chamar_na_tela(lambda: self.voltar_revisao_dup(texto))
+            return
+        msg = self.texto_links(resultado) + self.finalizar_metricas()
+        self.chamar_na_tela(lambda: self.fim_processo(msg))
+
+    def voltar_revisao_dup(self, texto):
+        self.tela_dashboard()
+        self.lbl_log.config(text=texto)
+        self.win.deiconify()
+        self.prox_dup()
+
+    def texto_links(self, resultado):
+        texto = f"{resultado['substituidos']} cópias viraram links • {formatar_bytes(resultado['bytes_liberados'])} liberados"
+        if resultado["erros"]: texto += f" • {len(resultado['erros'])} não puderam ser ligadas (ex: {resultado['erros'][0][1]})"
+        return texto
+
+    # --- ACERVO DE REFERÊNCIA ---
+    def iniciar_acervo(self):
+        acervos = IndiceReferencia.listar()
+        if acervos:
+            referencia = IndiceReferencia(acervos[0])
+            pasta, quando = referencia.meta("pasta"), referencia.meta("atualizado")
+            referencia.fechar()
+            resposta = messagebox.askyesnocancel(
+                "Acervo de Referência",
+                f"Acervo: {pasta}\nIndexado em: {quando}\n\n"
+                "SIM: conferir esta pasta com o acervo\nNÃO: indexar outro acervo (ou atualizar este)")
+            if resposta is None: return
+            if resposta:
+                self.mostrar_progresso("Conferindo com o acervo...")
+                threading.Thread(target=self.thread_arquivados, args=(acervos[0],)).start()
+                return
+        elif not messagebox.askyesno("Acervo de Referência",
+                                     "Nenhum acervo indexado ainda.\n\nEscolha a pasta do acervo mestre: ela é lida "
+                                     "uma vez e depois qualquer dispositivo é conferido sem reler o acervo."):
+            return
+        pasta = filedialog.askdirectory(title="Pasta do acervo mestre")
+        if not pasta: return
+        self.mostrar_progresso("Indexando o acervo...")
+        threading.Thread(target=self.thread_acervo, args=(pasta,)).start()
+
+    def thread_acervo(self, pasta):
+        indice = IndiceMidia(pasta)
+        referencia = IndiceReferencia(IndiceReferencia.nome_para(pasta))
+        metricas = self.iniciar_metricas("acervo")
+        try:
+            indice.sincronizar(lambda t: self.canal.publicar(t, 0, f"Indexando o acervo: {t} arquivos"), metricas, self.tarefa)
+            total = referencia.atualizar(indice, self.perfil_disco, self.update_progresso, metricas, self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Indexação do acervo interrompida.\n\nO que já foi lido fica guardado; a próxima vez continua daí.")
+            return
+        finally:
+            referencia.fechar()
+            indice.fechar()
+        msg = f"Acervo indexado: {total} arquivos.\n\nAgora qualquer dispositivo pode ser conferido com ele em 'JÁ ARQUIVADO?'."
+        msg += self.finalizar_metricas()
+        self.chamar_na_tela(lambda: self.fim_processo(msg))
+
+    def thread_arquivados(self, nome):
+        referencia = IndiceReferencia(nome)
+        try:
+            arquivados = buscar_arquivados(self.indice, referencia, self.perfil_disco, self.update_progresso,
+                                           self.iniciar_metricas("arquivados"), self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Conferência cancelada.\n\nOs hashes já calculados ficam no cache.")
+            return
+        except ValueError as e:
+            self.finalizar_metricas()
+            self.chamar_na_tela(lambda: self.fim_processo(f"Não foi possível conferir: {e}"))
+            return
+        finally:
+            referencia.fechar()
+        resumo = self.finalizar_metricas()
+        self.chamar_na_tela(lambda: self.resultado_arquivados(arquivados, resumo))
+
+    def resultado_arquivados(self, arquivados, resumo):
+        self.tela_dashboard()
+        if not arquivados:
+            messagebox.showinfo("Acervo", "Nada desta pasta está no acervo: tudo aqui é novo." + resumo)
+            return
+        tamanho = sum(os.path.getsize(p) for p, _ in arquivados if os.path.exists(p))
+        msg = (f"{len(arquivados)} arquivos ({formatar_bytes(tamanho)}) já estão no acervo.\n\n"
+               "Mover para a pasta '_JA_ARQUIVADOS' (quarentena), deixando só o que é novo?" + resumo)
+        if not messagebox.askyesno("Já Arquivados", msg): return
+        self.mostrar_progresso("Movendo para _JA_ARQUIVADOS...")
+        threading.Thread(target=self.thread_quarentena, args=([p for p, _ in arquivados],)).start()
+
+    def thread_quarentena(self, caminhos):
+        pasta = os.path.join(self.pasta_alvo, "_JA_ARQUIVADOS")
+        try:
+            resultado = _mover_lista(caminhos, pasta, self.indice, self.iniciar_metricas("quarentena"), self.tarefa,
+                                     self.update_progresso)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Quarentena interrompida.\n\nOs arquivos já movidos estão em _JA_ARQUIVADOS; os demais ficaram no lugar.")
+            return
+        self.finalizar_metricas()
+        erros = len(resultado["erros_mover"])
+        texto = (f"{resultado['movidos']} arquivos movidos para _JA_ARQUIVADOS" +
+                 (f" • {erros} com erro" if erros else ""))
+        self.chamar_na_tela(lambda: self.fim_quarentena(texto))
+
+    def fim_quarentena(self, texto):
+        self.total_analisado = self.indice.total()
+        self.tela_dashboard()
+        self.lbl_log.config(text=texto)
+
+    def iniciar_auditoria(self):
+        info = ("AUDITORIA COMPLETA\n\n"
+                "Lê cada arquivo UMA vez e faz tudo de uma passada: duplicatas, corrompidos, datas e faxina.\n"
+                "Num pendrive é bem mais rápido que rodar cada função separada.\n\n"
+                "SIM = integridade PROFUNDA (decodifica as fotos)\n"
+                "NÃO = integridade RÁPIDA (apenas a estrutura)\n\n"
+                "Arquivos já auditados e sem mudança não são lidos de novo.")
+        resposta = messagebox.askyesnocancel("Auditoria Completa", info)
+        if resposta is None: return
+        self.mostrar_progresso("Auditando (leitura única)...")
+        threading.Thread(target=self.thread_auditoria, args=("profundo" if resposta else "rapido",)).start()
+
+    def thread_auditoria(self, nivel):
+        try:
+            relatorio = auditoria_completa(self.indice, nivel, self.perfil_disco, self.update_progresso,
+                                           self.iniciar_metricas("auditoria"), self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Auditoria cancelada.\n\nO que já foi analisado fica no índice: a próxima auditoria continua daí.")
+            return
+        resumo = self.finalizar_metricas()
+        self.chamar_na_tela(lambda: self.tela_auditoria(relatorio, resumo))
+
+    def tela_auditoria(self, relatorio, resumo=""):
+        self.tela_dashboard()
+        st = relatorio["estatisticas"]
+        self.win = tk.Toplevel(self.root)
+        self.win.title("Auditoria Completa")
+        self.win.geometry("600x520")
+        self.win.configure(bg=COR_PAINEL)
+
+        tk.Label(self.win, text="RESULTADO DA AUDITORIA", fg=COR_DESTAQUE, bg=COR_PAINEL, font=FONTE_MENU).pack(pady=15)
+        anos = "  ".join(f"{ano}: {n}" for ano, n in relatorio["anos"].items())
+        texto = (f"{st['arquivos']} arquivos • {relatorio['lidos']} lidos agora "
+                 f"({formatar_bytes(st['lidos_completo'])}), {st['reaproveitados']} já auditados\n\n"
+                 f"Por ano: {anos}" + resumo)
+        tk.Label(self.win, text=texto, fg="#ccc", bg=COR_PAINEL, font=FONTE_DESC, wraplength=540, justify="left").pack(padx=20)
+
+        def revisar(abrir):
+            self.win.destroy()
+            abrir()
+
+        def ver_duplicatas():
+            self.dups, self.stats_dup = relatorio["duplicatas"], st
+            self.abrir_audit_dup()
+
+        def ver_lixo():
+            self.fila_limpeza = [p for p, _ in relatorio["lixo"]]
+            self.motivos_lixo = dict(relatorio["lixo"])
+            self.abrir_revisor_lixo()
+
+        def ver_corrompidos():
+            self.suspeitos = relatorio["corrompidos"]
+            self.abrir_audit_corrupt()
+
+        botoes = tk.Frame(self.win, bg=COR_PAINEL)
+        botoes.pack(fill=tk.X, padx=40, pady=20)
+        for texto, cor, abrir, total in (
+                (f"♻️ DUPLICATAS: {len(relatorio['duplicatas'])} grupos ({formatar_bytes(relatorio['bytes_duplicados'])})",
+                 "#E83E8C", ver_duplicatas, len(relatorio["duplicatas"])),
+                (f"🧹 LIXO: {len(relatorio['lixo'])} fotos", COR_ROXO, ver_lixo, len(relatorio["lixo"])),
+                (f"🛡️ CORROMPIDOS: {len(relatorio['corrompidos'])} fotos", "#FFC107", ver_corrompidos,
+                 len(relatorio["corrompidos"]))):
+            tk.Button(botoes, text=texto, bg=cor if total else "#333", fg="white", relief="flat",
+                      font=("Segoe UI", 10, "bold"), state=tk.NORMAL if total else tk.DISABLED,
+                      command=lambda abrir=abrir: revisar(abrir)).pack(fill=tk.X, pady=5)
+        if relatorio.get("arquivo"):
+            tk.Label(self.win, text=f"Relatório salvo em {relatorio['arquivo']}", fg="#666", bg=COR_PAINEL,
+                     font=("Consolas", 8), wraplength=540).pack(pady=5)
+        self.lbl_log.config(text=f"Auditoria: {len(relatorio['duplicatas'])} grupos de duplicatas • "
+                                 f"{len(relatorio['lixo'])} lixo • {len(relatorio['corrompidos'])} corrompidos")
+
     # --- 5. LIXEIRA ---
     def gerenciar_lixeira(self):
         lixo = os.path.join(self.pasta_alvo, "_LIXEIRA_SEGURA")
@@ -770,13 +4158,22 @@ class PendriveManagerApp:
         threading.Thread(target=self.thread_galeria).start()
         
     def thread_galeria(self):
-        sucesso = gerar_html_galeria(self.pasta_alvo)
+        try:
+            sucesso = gerar_html_galeria(self.pasta_alvo, self.indice.caminhos("foto"), self.update_progresso,
+                                         metricas=self.iniciar_metricas("galeria"), tarefa=self.tarefa)
+        except TarefaCancelada:
+            self.tarefa_cancelada("Galeria cancelada.\n\nAs miniaturas já criadas serão reaproveitadas na próxima vez.")
+            return
+        resumo = self.finalizar_metricas()
         time.sleep(1) # Visual
-        self.root.after(0, lambda: self.fim_processo("Galeria criada com sucesso!\nAbra o arquivo 'Galeria_Arquivos.html' na pasta."))
+        msg = ("Galeria criada com sucesso!\nAbra o arquivo 'Galeria_Arquivos.html' na pasta." if sucesso
+               else "Não foi possível criar a galeria.")
+        self.chamar_na_tela(lambda: self.fim_processo(msg + resumo))
 
     # --- UX ---
     def mostrar_progresso(self, txt):
         self.limpar_tela()
+        self.canal.limpar()
         f = tk.Frame(self.root, bg=COR_FUNDO)
         f.place(relx=0.5, rely=0.5, anchor="center")
         tk.Label(f, text="PROCESSANDO", font=FONTE_TITULO, fg="white", bg=COR_FUNDO).pack(pady=20)
@@ -784,20 +4181,92 @@ class PendriveManagerApp:
         self.lbl_prog.pack()
         self.prog = ttk.Progressbar(f, length=400, mode='determinate')
         self.prog.pack(pady=20)
+        self.lbl_metricas = tk.Label(f, text="", fg="#666", bg=COR_FUNDO, font=("Consolas", 9))
+        self.lbl_metricas.pack()
+
+        self.tarefa = Tarefa()
+        botoes = tk.Frame(f, bg=COR_FUNDO)
+        botoes.pack(pady=15)
+        self.btn_pausar = tk.Button(botoes, text="PAUSAR", bg="#333", fg="#ccc", relief="flat",
+                                    font=("Segoe UI", 8, "bold"), width=12, command=self.alternar_pausa)
+        self.btn_pausar.pack(side=tk.LEFT, padx=5)
+        self.btn_cancelar = tk.Button(botoes, text="CANCELAR", bg=COR_ALERTA, fg="white", relief="flat",
+                                      font=("Segoe UI", 8, "bold"), width=12, command=self.cancelar_tarefa)
+        self.btn_cancelar.pack(side=tk.LEFT, padx=5)
+
+    def alternar_pausa(self):
+        if not self.tarefa or self.tarefa.cancelada: return
+        if self.tarefa.pausada:
+            self.tarefa.retomar()
+            self.btn_pausar.config(text="PAUSAR")
+        else:
+            self.tarefa.pausar()
+            self.btn_pausar.config(text="RETOMAR")
+            self.lbl_prog.config(text="Pausado: o arquivo atual termina e a operação espera")
+
+    def cancelar_tarefa(self):
+        # A thread só para no próximo ponto seguro (entre arquivos), nunca no meio de um movimento
+        if not self.tarefa: return
+        self.tarefa.cancelar()
+        for nome in ("btn_pausar", "btn_cancelar"):
+            if self._widget_vivo(nome): getattr(self, nome).config(state="disabled")
+        if self._widget_vivo("lbl_prog"): self.lbl_prog.config(text="Cancelando... aguardando o arquivo atual terminar")
+
+    def tarefa_cancelada(self, msg):
+        """Encerra uma operação cancelada: grava o relatório e volta ao painel."""
+        if self.metricas: self.metricas.cancelada = True
+        resumo = self.finalizar_metricas()
+        self.chamar_na_tela(lambda: self.fim_processo(msg + resumo))
+
+    def chamar_na_tela(self, funcao):
+        try:
+            self.root.after(0, funcao)
+        except (RuntimeError, tk.TclError):
+            pass # Janela já fechada
+
+    def fechar_janela(self):
+        # Cancela a operação em andamento; a thread termina o arquivo atual e grava cache/diário antes de sair
+        if self.tarefa: self.tarefa.cancelar()
+        self.root.destroy()
 
     def update_progresso(self, atual, total, txt):
-        self.root.after(0, lambda: self._update_ui(atual, total, txt))
+        # Chamado pelas threads de trabalho: só publica, quem desenha é _pintar_progresso
+        self.canal.publicar(atual, total, txt)
+
+    def _widget_vivo(self, nome):
+        widget = getattr(self, nome, None)
+        return widget is not None and widget.winfo_exists()
+
+    def _pintar_progresso(self):
+        """Lê o canal em intervalo fixo: no máximo um redesenho por quadro, seja qual for o ritmo das threads."""
+        try:
+            estado = self.canal.ler_novo()
+            if estado is not None:
+                self._update_ui(*estado)
+            metricas = self.metricas
+            if metricas and self._widget_vivo("lbl_metricas"):
+                self.lbl_metricas.config(text=metricas.resumo())
+        finally:
+            self.root.after(INTERVALO_TELA_MS, self._pintar_progresso)
 
     def _update_ui(self, atual, total, txt):
-        pct = (atual/total)*100 if total > 0 else 0
-        self.prog['value'] = pct
-        self.lbl_prog.config(text=f"{txt} ({int(pct)}%)")
+        if self._widget_vivo("prog"):
+            pct = (atual/total)*100 if total > 0 else 0
+            self.prog['value'] = pct
+            self.lbl_prog.config(text=f"{txt} ({int(pct)}%)")
+        elif self._widget_vivo("lbl_status_load"):
+            self.lbl_status_load.config(text=txt)
 
     def fim_processo(self, msg):
         self.tela_dashboard()
         messagebox.showinfo("Concluído", msg)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Necessário para o pool de processos no executável (PyInstaller)
+    if len(sys.argv) > 1:
+        sys.exit(main_cli(sys.argv[1:]))
+    if tk is None:
+        sys.exit("Tkinter não está disponível. Use a linha de comando (--help).")
     root = tk.Tk()
     app = PendriveManagerApp(root)
     root.mainloop()
\ No newline at end of file
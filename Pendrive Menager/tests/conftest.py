@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os testes importam o pendrive_manager.py da pasta acima (o Tkinter é opcional)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,33 @@
+import os
+
+import pendrive_manager as pm
+
+
+def test_reescrita_invalida_o_hash_em_cache(tmp_path):
+    cache = pm.CacheHash(str(tmp_path / "cache.db"))
+    caminho = tmp_path / "foto.jpg"
+    caminho.write_bytes(b"conteudo original")
+    st = os.stat(caminho)
+    cache.gravar(st, "blake2b", "aaaa")
+    assert cache.obter(os.stat(caminho), "blake2b") == "aaaa"
+
+    # Reescrita no lugar: mesmo inode, outro tamanho e outro mtime
+    with open(caminho, "r+b") as f: f.write(b"conteudo reescrito e maior")
+    os.utime(caminho, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert os.stat(caminho).st_ino == st.st_ino
+    assert cache.obter(os.stat(caminho), "blake2b") is None
+
+
+def test_mesmo_tamanho_com_outro_mtime_nao_vale(tmp_path):
+    cache = pm.CacheHash(str(tmp_path / "cache.db"))
+    caminho = tmp_path / "video.mp4"
+    caminho.write_bytes(b"x" * 100)
+    st = os.stat(caminho)
+    cache.gravar(st, "blake2b", "bbbb")
+
+    caminho.write_bytes(b"y" * 100)
+    os.utime(caminho, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert cache.obter(os.stat(caminho), "blake2b") is None
+    # A entrada vencida sai do cache: voltar o mtime não a ressuscita
+    os.utime(caminho, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert cache.obter(os.stat(caminho), "blake2b") is None
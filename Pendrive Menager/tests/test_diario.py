@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+import pendrive_manager as pm
+
+
+class TarefaQueCai(pm.Tarefa):
+    """Cancela depois de `passos` movimentos, como uma queda no meio do plano."""
+
+    def __init__(self, passos):
+        super().__init__()
+        self.passos = passos
+
+    def checar(self):
+        if self.passos == 0: self.cancelar()
+        self.passos -= 1
+        super().checar()
+
+
+def criar_pasta(base, quantidade=5):
+    arquivos = {}
+    for n in range(quantidade):
+        caminho = os.path.join(base, "bagunca", f"foto{n}.jpg")
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        conteudo = f"foto {n}".encode()
+        with open(caminho, "wb") as f: f.write(conteudo)
+        arquivos[caminho] = conteudo
+    plano = [(caminho, os.path.join(base, "2020", "Fotos", os.path.basename(caminho))) for caminho in arquivos]
+    return arquivos, plano
+
+
+def test_queda_no_meio_do_plano_e_retomada(tmp_path):
+    base = str(tmp_path)
+    arquivos, plano = criar_pasta(base)
+    diario = pm.DiarioMovimentos(base)
+    diario.iniciar(plano)
+    with pytest.raises(pm.TarefaCancelada):
+        pm.executar_plano(plano, base, diario, tarefa=TarefaQueCai(2))
+    diario.interromper()
+
+    estado, plano_lido, feitos = pm.DiarioMovimentos(base).ler()
+    assert estado == "pendente"
+    assert plano_lido == plano
+    assert feitos == {0, 1}
+
+    # Movido antes da queda, mas sem o "feito" no diário
+    os.replace(*plano[2])
+
+    diario = pm.DiarioMovimentos(base)
+    diario.retomar()
+    movidos, erros = pm.executar_plano(plano_lido, base, diario, feitos)
+    diario.finalizar()
+    assert (movidos, erros) == (2, 0)
+    assert pm.DiarioMovimentos(base).ler()[0] == "fim"
+    for origem, destino in plano:
+        assert not os.path.exists(origem)
+        with open(destino, "rb") as f: assert f.read() == arquivos[origem]
+
+
+def test_desfazer_devolve_tudo_ao_lugar(tmp_path):
+    base = str(tmp_path)
+    arquivos, plano = criar_pasta(base)
+    diario = pm.DiarioMovimentos(base)
+    diario.iniciar(plano)
+    assert pm.executar_plano(plano, base, diario) == (len(plano), 0)
+    diario.finalizar()
+
+    assert pm.desfazer_organizacao(base) == (len(plano), 0)
+    for caminho, conteudo in arquivos.items():
+        with open(caminho, "rb") as f: assert f.read() == conteudo
+    assert not os.path.exists(os.path.join(base, "2020"))  # Pastas esvaziadas somem
+    assert pm.DiarioMovimentos(base).ler()[0] == "desfeito"
+    assert pm.desfazer_organizacao(base) is None  # Não desfaz duas vezes
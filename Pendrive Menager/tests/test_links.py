@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+import pendrive_manager as pm
+
+
+def gravar(caminho, conteudo):
+    with open(caminho, "wb") as f: f.write(conteudo)
+    return str(caminho)
+
+
+def test_recusa_copia_que_difere_no_ultimo_byte(tmp_path):
+    conteudo = os.urandom(3 * 1024 * 1024)
+    original = gravar(tmp_path / "original.mp4", conteudo)
+    copia = gravar(tmp_path / "copia.mp4", conteudo[:-1] + bytes([conteudo[-1] ^ 0xFF]))
+    inode = os.stat(copia).st_ino
+
+    with pytest.raises(pm.ArquivosDiferentes):
+        pm.substituir_por_link(original, copia)
+
+    # A cópia fica intacta e nenhum temporário sobra na pasta
+    assert os.stat(copia).st_ino == inode
+    assert sorted(os.listdir(tmp_path)) == ["copia.mp4", "original.mp4"]
+
+
+def test_copia_identica_vira_link(tmp_path):
+    conteudo = os.urandom(64 * 1024)
+    original = gravar(tmp_path / "original.jpg", conteudo)
+    copia = gravar(tmp_path / "copia.jpg", conteudo)
+
+    tipo, liberados = pm.substituir_por_link(original, copia)
+    assert tipo in ("reflink", "hardlink")
+    assert liberados == len(conteudo)
+    with open(copia, "rb") as f: assert f.read() == conteudo
+    assert sorted(os.listdir(tmp_path)) == ["copia.jpg", "original.jpg"]